@@ -1,15 +1,94 @@
-from flask import Flask, render_template, request, redirect, jsonify, url_for, flash
+from flask import (Flask, render_template, request, redirect, jsonify, url_for, flash, make_response,
+                   Response, stream_with_context)
 import sqlite3
 import os
 from datetime import datetime, date
 import calendar
 import json
+from functools import lru_cache
+
+import db
+from db import get_db
+from migrate_add_appointment_patientid import migrate_appointment_patient_ids
+from migrate_dentalchart_storage import migrate_chart_storage
+from migrate_add_chartlog_seq import migrate_chart_log_sequence
+from migrate_unique_appointment_slots import ensure_unique_slots
+from migrate_normalize_appointment_times import normalize_appointment_times
+from migrate_add_appointment_duration import migrate_appointment_durations
+from migrate_add_appointment_starts_at import migrate_appointment_timestamps
+from migrate_split_patients import split_patient_tables
+from resources import RESOURCE_KINDS, ensure_resources, list_resources, free_resource
+from patient_search import ensure_patient_search, match_expression, search_patients
+from appointment_stats import ensure_appointment_stats
+from availability import availability_index
+from schedule import (SLOT_TIMES, DURATION_CHOICES, DAY_SECONDS, procedure_minutes, appointment_minutes,
+                      clinic_hours_error, overlapping_appointment, normalize_time, timestamp, current_timestamp)
+from chart_codec import TEETH
+from dental_charts import (ensure_chart_tables, chart_revision, load_chart, replace_chart, is_chart_patch,
+                           apply_chart_patch, StaleChartRevision, chart_at, revision_as_of, chart_visits,
+                           chart_diff)
+from http_cache import data_versions, validators, is_not_modified, not_modified, set_validators
+from pagination import (cursor_mode, read_cursor, keyset_condition, keyset_order,
+                        page_cursors, cached_count, encode_cursor, decode_cursor)
+from streaming import NDJSON_MIMETYPE, wants_ndjson, iter_rows, json_array_chunks, ndjson_chunks
+from patient_fields import (ensure_patient_tables, read_patient_form, missing_fields, insert_row, insert_patient,
+                            update_patient_fields, delete_patient_record, load_patient, load_patient_by_name)
+from bulk_import import IMPORTERS, IMPORT_FORMATS, import_records
+from bulk_export import EXPORTS, EXPORT_FORMATS, export_rows, export_chunks
 
 app = Flask(__name__)
 app.secret_key = "your-very-secret-key"
+db.init_app(app)
+
+# Sort keys for cursor (keyset) pagination of the list pages
+PATIENT_KEY = ('p.Name', 'p.ID')
+APPOINTMENT_KEY = ('StartsAt', 'ID')
+TREATMENT_RECORD_KEY = ('DateOfTreatment', 'ID')
+
+# Appointment fields the JSON API can return, and the columns behind them
+APPOINTMENT_FIELDS = {
+    'id': 'ID',
+    'patient_name': 'PatientName',
+    'contact': 'Contact',
+    'date': 'Date',
+    'time': 'Time',
+    'dental_care': 'DentalCare',
+    'patient_id': 'PatientID',
+    'resource_id': 'ResourceID',
+    'duration': 'Duration',
+    'starts_at': 'StartsAt',
+}
+DEFAULT_APPOINTMENT_FIELDS = ('id', 'patient_name', 'contact', 'date', 'time', 'dental_care')
+
+# Largest page the JSON API returns when a limit is given
+MAX_API_PAGE_SIZE = 1000
+
+# Longest date span one availability request may cover (about three months)
+MAX_AVAILABILITY_DAYS = 93
+
+def wants_fragment():
+    """Whether the request asks for only the swappable part of a list page"""
+    return request.headers.get('X-Fragment') == '1' or request.args.get('fragment') == '1'
+
+def render_page(template, fragment_template, **context):
+    """Render a full page, or just its fragment template for in-page updates"""
+    if wants_fragment():
+        response = make_response(render_template(fragment_template, **context))
+    else:
+        response = make_response(render_template(template, **context))
+    # The same URL serves both, so caches must key on the header too
+    response.vary.add('X-Fragment')
+    return response
+
+# Clinic hours for the booking forms
+@app.context_processor
+def schedule_context():
+    return {'slot_times': SLOT_TIMES, 'duration_choices': DURATION_CHOICES}
 
-# Jinja filter for 12-hour time format
+# Jinja filter for 12-hour time format; pages repeat the same few slot times,
+# so each is parsed once
 @app.template_filter('ampm')
+@lru_cache(maxsize=1024)
 def ampm_filter(value):
     try:
         # Try parsing as HH:MM (24-hour)
@@ -18,68 +97,15 @@ def ampm_filter(value):
     except Exception:
         return value  # fallback if parsing fails
 
-# SQLite DB path
-DB_FILE = "dental.db"
-
 def init_db():
     """Initialize the database with the required tables"""
-    conn = sqlite3.connect(DB_FILE)
+    conn = db.connect()
     cursor = conn.cursor()
     
-    # Create Patients table with additional fields
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS Patients (
-            ID INTEGER PRIMARY KEY AUTOINCREMENT,
-            Name TEXT NOT NULL UNIQUE,
-            Contact TEXT NOT NULL,
-            Email TEXT,
-            DateOfBirth TEXT,
-            Address TEXT,
-            EmergencyContact TEXT,
-            MedicalHistory TEXT,
-            Religion TEXT,
-            HomeAddress TEXT,
-            Occupation TEXT,
-            DentalInsurance TEXT,
-            EffectiveDate TEXT,
-            ParentGuardianName TEXT,
-            ParentGuardianOccupation TEXT,
-            ReferralSource TEXT,
-            ConsultationReason TEXT,
-            DentalHistory TEXT,
-            PreviousDentist TEXT,
-            LastDentalVisit TEXT,
-            Sex TEXT,
-            Nickname TEXT,
-            Age TEXT,
-            Nationality TEXT,
-            GoodHealth TEXT,
-            MedicalTreatment TEXT,
-            TreatmentCondition TEXT,
-            SeriousIllness TEXT,
-            SurgicalOperation TEXT,
-            Hospitalized TEXT,
-            HospitalizationDetails TEXT,
-            PrescriptionMedication TEXT,
-            NonPrescriptionMedication TEXT,
-            TobaccoUse TEXT,
-            AlcoholDrugUse TEXT,
-            AllergicLocalAnesthetic TEXT,
-            AllergicPenicillin TEXT,
-            AllergicAntibiotics TEXT,
-            AllergicSulfaDrugs TEXT,
-            AllergicAspirin TEXT,
-            AllergicLatex TEXT,
-            AllergicOthers TEXT,
-            BleedingTime TEXT,
-            Pregnant TEXT,
-            Nursing TEXT,
-            BirthPills TEXT,
-            BloodType TEXT,
-            BloodPressure TEXT,
-            CreatedDate TEXT DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
+    # Create the patient tables from the field registry, adding fields newer than the tables,
+    # and move the side-table columns out of a Patients table from before the split
+    ensure_patient_tables(conn)
+    split_patient_tables(conn)
     
     # Create Appointments table
     cursor.execute('''
@@ -89,7 +115,10 @@ def init_db():
             Contact TEXT NOT NULL,
             Date TEXT NOT NULL,
             Time TEXT NOT NULL,
-            DentalCare TEXT NOT NULL
+            DentalCare TEXT NOT NULL,
+            PatientID INTEGER REFERENCES Patients (ID),
+            ResourceID INTEGER REFERENCES Resources (ID),
+            Duration INTEGER NOT NULL DEFAULT 30
         )
     ''')
     
@@ -109,9 +138,66 @@ def init_db():
         )
     ''')
     
+    # Create TreatmentRecords table for the patient ledger
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS TreatmentRecords (
+            ID INTEGER PRIMARY KEY AUTOINCREMENT,
+            PatientID INTEGER NOT NULL,
+            DateOfTreatment TEXT NOT NULL,
+            ToothNumber TEXT,
+            Procedure TEXT,
+            DentistName TEXT,
+            AmountCharged REAL,
+            AmountPaid REAL,
+            Balance REAL,
+            NextAppointment TEXT,
+            FOREIGN KEY (PatientID) REFERENCES Patients (ID)
+        )
+    ''')
+    
+    # Full-text index over patient names and contact details
+    ensure_patient_search(conn)
+    
+    # Bring databases created before Appointments.PatientID up to date
+    migrate_appointment_patient_ids(conn)
+    
+    # Per-patient appointment summaries maintained by triggers
+    ensure_appointment_stats(conn)
+    
+    # Revision counters and packed storage for dental charts
+    ensure_chart_tables(conn)
+    
+    # Number chart saves across patients, the dental chart export watermark
+    migrate_chart_log_sequence(conn)
+    
+    # Move charts saved as per-tooth JSON into the packed tables
+    migrate_chart_storage(conn)
+    
+    # Chairs and dentists that appointments are booked against
+    ensure_resources(conn)
+    
+    # Appointment lengths, so bookings can run past a single slot
+    migrate_appointment_durations(conn)
+    
+    # Integer start timestamps, for range queries and sorting on an index
+    migrate_appointment_timestamps(conn)
+    
+    # Times as HH:MM, so slots compare equal however they were typed
+    normalize_appointment_times(conn)
+    
+    # One appointment per resource and slot, enforced by a unique index
+    ensure_unique_slots(conn)
+    
+    # Create secondary indexes used by the list, calendar and history pages
+    db.ensure_indexes(conn)
+    
     conn.commit()
     conn.close()
 
+def has_passed(appointment):
+    """Whether an Appointments row (SELECT *) started before the current minute"""
+    return appointment[9] is not None and appointment[9] < current_timestamp()
+
 def validate_appointment_date(appointment_date, appointment_id=None):
     """Validate that appointment date is not in the past"""
     try:
@@ -121,11 +207,10 @@ def validate_appointment_date(appointment_date, appointment_id=None):
         
         # For editing, allow the current appointment date
         if appointment_id:
-            conn = sqlite3.connect(DB_FILE)
+            conn = get_db()
             cursor = conn.cursor()
             cursor.execute("SELECT Date FROM Appointments WHERE ID = ?", (appointment_id,))
             current_date = cursor.fetchone()
-            conn.close()
             
             if current_date and current_date[0] == appointment_date:
                 return True, None  # Allow keeping the same date
@@ -138,31 +223,112 @@ def validate_appointment_date(appointment_date, appointment_id=None):
     except ValueError:
         return False, "Invalid date format. Please use YYYY-MM-DD format."
 
-def check_appointment_conflict(appointment_date, appointment_time, appointment_id=None):
-    """Check if there's already an appointment at the same date and time"""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    
-    if appointment_id:
-        # For editing, exclude the current appointment from the check
-        cursor.execute("""
-            SELECT COUNT(*) FROM Appointments 
-            WHERE Date = ? AND Time = ? AND ID != ?
-        """, (appointment_date, appointment_time, appointment_id))
-    else:
-        # For new appointments, check all appointments at that date/time
-        cursor.execute("""
-            SELECT COUNT(*) FROM Appointments 
-            WHERE Date = ? AND Time = ?
-        """, (appointment_date, appointment_time))
-    
-    count = cursor.fetchone()[0]
-    conn.close()
-    
-    if count > 0:
-        return False, f"There is already an appointment scheduled for {appointment_date} at {appointment_time}. Please choose a different date or time."
+def slot_conflict_message(appointment_date, appointment_time, minutes):
+    """Error shown when a booking overlaps one that is already there"""
+    return (f"A {minutes}-minute appointment on {appointment_date} at {appointment_time} overlaps one already "
+            f"scheduled. Please choose a different date or time.")
+
+def is_slot_conflict(error):
+    """Whether an IntegrityError came from the unique (Date, Time, ResourceID) slot index.
     
-    return True, None
+    It is the only unique constraint an appointment write can break.
+    """
+    return error.sqlite_errorcode == sqlite3.SQLITE_CONSTRAINT_UNIQUE
+
+def schedule_resources(conn, value):
+    """Resource IDs a schedule lookup covers: the one asked for, or every active one.
+    
+    Returns None when value names no active resource.
+    """
+    active = tuple(row[0] for row in list_resources(conn))
+    if not value:
+        return active
+    try:
+        resource_id = int(value)
+    except ValueError:
+        return None
+    return (resource_id,) if resource_id in active else None
+
+def booking_minutes(value, dental_care, appointment_id=None):
+    """(minutes, error message) for a booking's duration field.
+    
+    Blank means the length of the dental care booked; a missing field on an
+    edit keeps the appointment's current length.
+    """
+    if value is None and appointment_id:
+        row = get_db().execute("SELECT Duration FROM Appointments WHERE ID = ?", (appointment_id,)).fetchone()
+        if row:
+            return row[0], None
+    return appointment_minutes(value, dental_care)
+
+def booking_resource(value):
+    """(resource ID, error message) for a booking form's resource_id; no ID means any free one"""
+    if not value:
+        return None, None
+    resources = schedule_resources(get_db(), value)
+    if resources is None:
+        return None, "Please choose an active chair or dentist."
+    return resources[0], None
+
+def insert_appointment(conn, name, contact, appointment_date, time, dental_care, resource_id=None, minutes=None):
+    """Book an appointment, linking it to the patient of that name if there is one.
+    
+    minutes defaults to the length of the dental care. Without a resource_id
+    the first chair or dentist free for the whole appointment is used.
+    Returns False, booking nothing, when it would overlap another booking.
+    """
+    time = normalize_time(time)
+    minutes = minutes or procedure_minutes(dental_care)
+    # Safe to check then insert: the writer runs one job at a time
+    if resource_id is None:
+        resource_id = free_resource(conn, appointment_date, time, minutes)
+        if resource_id is None:
+            return False
+    elif overlapping_appointment(conn, appointment_date, time, minutes, resource_id) is not None:
+        return False
+    try:
+        conn.execute("""
+            INSERT INTO Appointments (PatientName, Contact, Date, Time, DentalCare, PatientID, ResourceID, Duration)
+            VALUES (?, ?, ?, ?, ?, (SELECT ID FROM Patients WHERE Name = ?), ?, ?)
+        """, (name, contact, appointment_date, time, dental_care, name, resource_id, minutes))
+    except sqlite3.IntegrityError as e:
+        if not is_slot_conflict(e):
+            raise
+        return False
+    return True
+
+def update_appointment(conn, appointment_id, name, contact, appointment_date, time, dental_care, resource_id=None,
+                       minutes=None):
+    """Rewrite an appointment, relinking it to the patient of that name.
+    
+    minutes defaults to the appointment's current length. Without a
+    resource_id the appointment keeps its resource if that is free for the
+    new interval, or moves to one that is. Returns False, changing nothing,
+    when the new interval overlaps another booking.
+    """
+    time = normalize_time(time)
+    current = conn.execute("SELECT ResourceID, Duration FROM Appointments WHERE ID = ?",
+                           (appointment_id,)).fetchone()
+    minutes = minutes or (current[1] if current else procedure_minutes(dental_care))
+    if resource_id is None:
+        resource_id = free_resource(conn, appointment_date, time, minutes, prefer=current and current[0],
+                                    exclude_id=appointment_id)
+        if resource_id is None:
+            return False
+    elif overlapping_appointment(conn, appointment_date, time, minutes, resource_id, appointment_id) is not None:
+        return False
+    try:
+        conn.execute("""
+            UPDATE Appointments 
+            SET PatientName = ?, Contact = ?, Date = ?, Time = ?, DentalCare = ?,
+                PatientID = (SELECT ID FROM Patients WHERE Name = ?), ResourceID = ?, Duration = ?
+            WHERE ID = ?
+        """, (name, contact, appointment_date, time, dental_care, name, resource_id, minutes, appointment_id))
+    except sqlite3.IntegrityError as e:
+        if not is_slot_conflict(e):
+            raise
+        return False
+    return True
 
 # Initialize database on startup
 init_db()
@@ -175,91 +341,28 @@ def index():
 def create_patient():
     """Create a new patient"""
     if request.method == 'POST':
-        name = request.form['name']
-        contact = request.form['contact']
-        email = request.form.get('email', '')
-        date_of_birth = request.form.get('date_of_birth', '')
-        address = request.form.get('address', '')
-        emergency_contact = request.form.get('emergency_contact', '')
-        medical_history = request.form.get('medical_history', '')
-        religion = request.form.get('religion', '')
-        home_address = request.form.get('home_address', '')
-        occupation = request.form.get('occupation', '')
-        dental_insurance = request.form.get('dental_insurance', '')
-        effective_date = request.form.get('effective_date', '')
-        parent_guardian_name = request.form.get('parent_guardian_name', '')
-        parent_guardian_occupation = request.form.get('parent_guardian_occupation', '')
-        referral_source = request.form.get('referral_source', '')
-        consultation_reason = request.form.get('consultation_reason', '')
-        dental_history = request.form.get('dental_history', '')
-        previous_dentist = request.form.get('previous_dentist', '')
-        last_dental_visit = request.form.get('last_dental_visit', '')
-        sex = request.form.get('sex', '')
-        nickname = request.form.get('nickname', '')
-        age = request.form.get('age', '')
-        nationality = request.form.get('nationality', '')
-        
-        # Medical History Fields
-        good_health = request.form.get('good_health', '')
-        medical_treatment = request.form.get('medical_treatment', '')
-        treatment_condition = request.form.get('treatment_condition', '')
-        serious_illness = request.form.get('serious_illness', '')
-        surgical_operation = request.form.get('surgical_operation', '')
-        hospitalized = request.form.get('hospitalized', '')
-        hospitalization_details = request.form.get('hospitalization_details', '')
-        prescription_medication = request.form.get('prescription_medication', '')
-        non_prescription_medication = request.form.get('non_prescription_medication', '')
-        tobacco_use = request.form.get('tobacco_use', '')
-        alcohol_drug_use = request.form.get('alcohol_drug_use', '')
-        allergic_local_anesthetic = request.form.get('allergic_local_anesthetic', '')
-        allergic_penicillin = request.form.get('allergic_penicillin', '')
-        allergic_antibiotics = request.form.get('allergic_antibiotics', '')
-        allergic_sulfa_drugs = request.form.get('allergic_sulfa_drugs', '')
-        allergic_aspirin = request.form.get('allergic_aspirin', '')
-        allergic_latex = request.form.get('allergic_latex', '')
-        allergic_others = request.form.get('allergic_others', '')
-        bleeding_time = request.form.get('bleeding_time', '')
-        pregnant = request.form.get('pregnant', '')
-        nursing = request.form.get('nursing', '')
-        birth_pills = request.form.get('birth_pills', '')
-        blood_type = request.form.get('blood_type', '')
-        blood_pressure = request.form.get('blood_pressure', '')
+        values = read_patient_form(request.form)
         
         # Validate required fields
-        if not name or not contact:
+        if missing_fields(values):
             return render_template('create_patient.html', 
                                  error_message="Name and Contact are required fields.")
         
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
+        def insert_patient_rows(conn):
+            patient_id = insert_patient(conn, insert_row(values))
+            
+            # Link any appointments booked under this name before the patient existed
+            conn.execute("""
+                UPDATE Appointments SET PatientID = ?
+                WHERE PatientID IS NULL AND PatientName = ?
+            """, (patient_id, values['name']))
         
         try:
-            cursor.execute("""
-                INSERT INTO Patients (Name, Contact, Email, DateOfBirth, Address, EmergencyContact, MedicalHistory,
-                                    Religion, HomeAddress, Occupation, DentalInsurance, EffectiveDate,
-                                    ParentGuardianName, ParentGuardianOccupation, ReferralSource, ConsultationReason,
-                                    DentalHistory, PreviousDentist, LastDentalVisit, Sex, Nickname, Age, Nationality,
-                                    GoodHealth, MedicalTreatment, TreatmentCondition, SeriousIllness, SurgicalOperation,
-                                    Hospitalized, HospitalizationDetails, PrescriptionMedication, NonPrescriptionMedication,
-                                    TobaccoUse, AlcoholDrugUse, AllergicLocalAnesthetic, AllergicPenicillin, AllergicAntibiotics,
-                                    AllergicSulfaDrugs, AllergicAspirin, AllergicLatex, AllergicOthers, BleedingTime,
-                                    Pregnant, Nursing, BirthPills, BloodType, BloodPressure)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (name, contact, email, date_of_birth, address, emergency_contact, medical_history,
-                  religion, home_address, occupation, dental_insurance, effective_date,
-                  parent_guardian_name, parent_guardian_occupation, referral_source, consultation_reason,
-                  dental_history, previous_dentist, last_dental_visit, sex, nickname, age, nationality,
-                  good_health, medical_treatment, treatment_condition, serious_illness, surgical_operation,
-                  hospitalized, hospitalization_details, prescription_medication, non_prescription_medication,
-                  tobacco_use, alcohol_drug_use, allergic_local_anesthetic, allergic_penicillin, allergic_antibiotics,
-                  allergic_sulfa_drugs, allergic_aspirin, allergic_latex, allergic_others, bleeding_time,
-                  pregnant, nursing, birth_pills, blood_type, blood_pressure))
-            conn.commit()
-            conn.close()
+            db.write(insert_patient_rows)
+            data_versions.bump('patients', 'appointments')
             
             return redirect('/patients')
         except sqlite3.IntegrityError:
-            conn.close()
             return render_template('create_patient.html', 
                                  error_message="A patient with this name already exists.")
     
@@ -268,65 +371,15 @@ def create_patient():
 @app.route('/edit-patient/<int:patient_id>', methods=['GET', 'POST'])
 def edit_patient(patient_id):
     """Edit an existing patient"""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
+    conn = get_db()
     
     if request.method == 'POST':
-        name = request.form['name']
-        contact = request.form['contact']
-        email = request.form.get('email', '')
-        date_of_birth = request.form.get('date_of_birth', '')
-        address = request.form.get('address', '')
-        emergency_contact = request.form.get('emergency_contact', '')
-        medical_history = request.form.get('medical_history', '')
-        religion = request.form.get('religion', '')
-        home_address = request.form.get('home_address', '')
-        occupation = request.form.get('occupation', '')
-        dental_insurance = request.form.get('dental_insurance', '')
-        effective_date = request.form.get('effective_date', '')
-        parent_guardian_name = request.form.get('parent_guardian_name', '')
-        parent_guardian_occupation = request.form.get('parent_guardian_occupation', '')
-        referral_source = request.form.get('referral_source', '')
-        consultation_reason = request.form.get('consultation_reason', '')
-        dental_history = request.form.get('dental_history', '')
-        previous_dentist = request.form.get('previous_dentist', '')
-        last_dental_visit = request.form.get('last_dental_visit', '')
-        sex = request.form.get('sex', '')
-        nickname = request.form.get('nickname', '')
-        age = request.form.get('age', '')
-        nationality = request.form.get('nationality', '')
-        
-        # Medical History Fields
-        good_health = request.form.get('good_health', '')
-        medical_treatment = request.form.get('medical_treatment', '')
-        treatment_condition = request.form.get('treatment_condition', '')
-        serious_illness = request.form.get('serious_illness', '')
-        surgical_operation = request.form.get('surgical_operation', '')
-        hospitalized = request.form.get('hospitalized', '')
-        hospitalization_details = request.form.get('hospitalization_details', '')
-        prescription_medication = request.form.get('prescription_medication', '')
-        non_prescription_medication = request.form.get('non_prescription_medication', '')
-        tobacco_use = request.form.get('tobacco_use', '')
-        alcohol_drug_use = request.form.get('alcohol_drug_use', '')
-        allergic_local_anesthetic = request.form.get('allergic_local_anesthetic', '')
-        allergic_penicillin = request.form.get('allergic_penicillin', '')
-        allergic_antibiotics = request.form.get('allergic_antibiotics', '')
-        allergic_sulfa_drugs = request.form.get('allergic_sulfa_drugs', '')
-        allergic_aspirin = request.form.get('allergic_aspirin', '')
-        allergic_latex = request.form.get('allergic_latex', '')
-        allergic_others = request.form.get('allergic_others', '')
-        bleeding_time = request.form.get('bleeding_time', '')
-        pregnant = request.form.get('pregnant', '')
-        nursing = request.form.get('nursing', '')
-        birth_pills = request.form.get('birth_pills', '')
-        blood_type = request.form.get('blood_type', '')
-        blood_pressure = request.form.get('blood_pressure', '')
+        values = read_patient_form(request.form)
+        name, contact, email = values['name'], values['contact'], values['email']
         
         # Validate required fields
         if not name or not contact:
-            cursor.execute("SELECT * FROM Patients WHERE ID = ?", (patient_id,))
-            patient = cursor.fetchone()
-            conn.close()
+            patient = load_patient(conn, patient_id)
             
             # Create specific error messages
             error_messages = []
@@ -346,14 +399,12 @@ def edit_patient(patient_id):
         
         # Additional validation for email if provided
         if email and not email.strip():
-            email = ''  # Convert empty string to None for database
+            values['email'] = ''  # Convert empty string to None for database
         elif email:
             import re
             email_pattern = re.compile(r'^[^\s@]+@[^\s@]+\.[^\s@]+$')
             if not email_pattern.match(email):
-                cursor.execute("SELECT * FROM Patients WHERE ID = ?", (patient_id,))
-                patient = cursor.fetchone()
-                conn.close()
+                patient = load_patient(conn, patient_id)
                 
                 error_message = "Please provide a valid email address."
                 
@@ -364,31 +415,17 @@ def edit_patient(patient_id):
                                      patient=patient, 
                                      error_message=error_message)
         
+        def update_patient(conn):
+            # Only the fields that changed are written
+            changes = update_patient_fields(conn, patient_id, values)
+            
+            # Keep the name shown on this patient's appointments in step with a rename
+            if 'Name' in changes:
+                conn.execute("UPDATE Appointments SET PatientName = ? WHERE PatientID = ?", (name, patient_id))
+        
         try:
-            cursor.execute("""
-                UPDATE Patients 
-                SET Name = ?, Contact = ?, Email = ?, DateOfBirth = ?, 
-                    Address = ?, EmergencyContact = ?, MedicalHistory = ?,
-                    Religion = ?, HomeAddress = ?, Occupation = ?, DentalInsurance = ?, EffectiveDate = ?,
-                    ParentGuardianName = ?, ParentGuardianOccupation = ?, ReferralSource = ?, ConsultationReason = ?,
-                    DentalHistory = ?, PreviousDentist = ?, LastDentalVisit = ?, Sex = ?, Nickname = ?, Age = ?, Nationality = ?,
-                    GoodHealth = ?, MedicalTreatment = ?, TreatmentCondition = ?, SeriousIllness = ?, SurgicalOperation = ?,
-                    Hospitalized = ?, HospitalizationDetails = ?, PrescriptionMedication = ?, NonPrescriptionMedication = ?,
-                    TobaccoUse = ?, AlcoholDrugUse = ?, AllergicLocalAnesthetic = ?, AllergicPenicillin = ?, AllergicAntibiotics = ?,
-                    AllergicSulfaDrugs = ?, AllergicAspirin = ?, AllergicLatex = ?, AllergicOthers = ?, BleedingTime = ?,
-                    Pregnant = ?, Nursing = ?, BirthPills = ?, BloodType = ?, BloodPressure = ?
-                WHERE ID = ?
-            """, (name, contact, email, date_of_birth, address, emergency_contact, medical_history,
-                  religion, home_address, occupation, dental_insurance, effective_date,
-                  parent_guardian_name, parent_guardian_occupation, referral_source, consultation_reason,
-                  dental_history, previous_dentist, last_dental_visit, sex, nickname, age, nationality,
-                  good_health, medical_treatment, treatment_condition, serious_illness, surgical_operation,
-                  hospitalized, hospitalization_details, prescription_medication, non_prescription_medication,
-                  tobacco_use, alcohol_drug_use, allergic_local_anesthetic, allergic_penicillin, allergic_antibiotics,
-                  allergic_sulfa_drugs, allergic_aspirin, allergic_latex, allergic_others, bleeding_time,
-                  pregnant, nursing, birth_pills, blood_type, blood_pressure, patient_id))
-            conn.commit()
-            conn.close()
+            db.write(update_patient)
+            data_versions.bump('patients', 'appointments')
             
             # Check if it's an AJAX request
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
@@ -396,9 +433,7 @@ def edit_patient(patient_id):
             
             return redirect('/patients?success=patient_updated')
         except sqlite3.IntegrityError:
-            conn.close()
-            cursor.execute("SELECT * FROM Patients WHERE ID = ?", (patient_id,))
-            patient = cursor.fetchone()
+            patient = load_patient(conn, patient_id)
             
             error_msg = "A patient with this name already exists."
             
@@ -410,9 +445,7 @@ def edit_patient(patient_id):
                                  error_message=error_msg)
     
     # GET request - show edit form
-    cursor.execute("SELECT * FROM Patients WHERE ID = ?", (patient_id,))
-    patient = cursor.fetchone()
-    conn.close()
+    patient = load_patient(conn, patient_id)
     
     if patient is None:
         return redirect('/patients')
@@ -422,22 +455,24 @@ def edit_patient(patient_id):
 @app.route('/delete-patient/<int:patient_id>')
 def delete_patient(patient_id):
     """Delete a patient and all their appointments"""
-    conn = sqlite3.connect(DB_FILE)
+    conn = get_db()
     cursor = conn.cursor()
     
-    # Get patient name before deletion
-    cursor.execute("SELECT Name FROM Patients WHERE ID = ?", (patient_id,))
+    # Make sure the patient exists before deletion
+    cursor.execute("SELECT ID FROM Patients WHERE ID = ?", (patient_id,))
     patient = cursor.fetchone()
     
     if patient:
-        patient_name = patient[0]
-        # Delete all appointments for this patient
-        cursor.execute("DELETE FROM Appointments WHERE PatientName = ?", (patient_name,))
-        # Delete the patient
-        cursor.execute("DELETE FROM Patients WHERE ID = ?", (patient_id,))
-        conn.commit()
+        def delete_patient_rows(conn):
+            # Delete all appointments for this patient
+            conn.execute("DELETE FROM Appointments WHERE PatientID = ?", (patient_id,))
+            # Delete the patient and their medical and allergy rows
+            delete_patient_record(conn, patient_id)
+        
+        db.write(delete_patient_rows)
+        availability_index.invalidate()
+        data_versions.bump('patients', 'appointments')
     
-    conn.close()
     return redirect('/patients')
 
 @app.route('/patients')
@@ -453,21 +488,41 @@ def patients():
     if per_page < 1 or per_page > 100:  # Limit to reasonable range
         per_page = 10
     
-    conn = sqlite3.connect(DB_FILE)
+    etag, last_modified = validators(('patients', 'appointments'), request.full_path, wants_fragment())
+    if is_not_modified(etag, last_modified):
+        return not_modified(etag, last_modified)
+    
+    conn = get_db()
     cursor = conn.cursor()
     
-    # Get total count for pagination
-    if search_query:
-        cursor.execute("""
-            SELECT COUNT(DISTINCT p.ID)
-            FROM Patients p
-            LEFT JOIN Appointments a ON p.Name = a.PatientName
-            WHERE p.Name LIKE ?
-        """, (f'%{search_query}%',))
-    else:
-        cursor.execute("SELECT COUNT(*) FROM Patients")
+    # Translate the search box text into a full-text match expression
+    search_match = match_expression(conn, search_query) if search_query else None
     
-    total_patients = cursor.fetchone()[0]
+    # Build the row source and count query
+    if search_match:
+        source = "PatientSearch JOIN Patients p ON p.ID = PatientSearch.rowid"
+        conditions = ["PatientSearch MATCH ?"]
+        params = [search_match]
+        count_query = "SELECT COUNT(*) FROM PatientSearch WHERE PatientSearch MATCH ?"
+    else:
+        source = "Patients p"
+        conditions = []
+        params = []
+        count_query = "SELECT COUNT(*) FROM Patients"
+    
+    # Opt-in cursor pagination: seek past the last row instead of counting an OFFSET
+    keyset_mode = cursor_mode(request.args)
+    cursor_values, backwards = read_cursor(request.args, len(PATIENT_KEY))
+    prev_cursor = next_cursor = None
+    
+    # Get total count for pagination (a cached, possibly slightly stale one in cursor mode)
+    if search_query and not search_match:
+        total_patients = 0  # Nothing searchable in the query, e.g. only punctuation
+    elif keyset_mode:
+        total_patients = cached_count(conn, count_query, params)
+    else:
+        cursor.execute(count_query, params)
+        total_patients = cursor.fetchone()[0]
     
     # Calculate pagination
     total_pages = (total_patients + per_page - 1) // per_page
@@ -476,96 +531,121 @@ def patients():
     
     offset = (page - 1) * per_page
     
+    if keyset_mode:
+        if cursor_values:
+            conditions.append(keyset_condition(PATIENT_KEY, backwards=backwards))
+            params += cursor_values
+        # Name is unique, so ordering by it alone follows the (Name, ID) key
+        order_by = keyset_order(PATIENT_KEY[:1], backwards=backwards)
+        limit, offset = per_page + 1, 0
+    else:
+        order_by = "p.Name"
+        limit = per_page
+    
+    where_clause = " AND ".join(conditions) if conditions else "1=1"
+    
     # Get patients with pagination
-    if search_query:
-        cursor.execute("""
-            SELECT p.ID, p.Name, p.Contact, p.Email, p.DateOfBirth, p.CreatedDate,
-                   COUNT(a.ID) as appointment_count,
-                   MIN(a.Date) as first_appointment, MAX(a.Date) as last_appointment
-            FROM Patients p
-            LEFT JOIN Appointments a ON p.Name = a.PatientName
-            WHERE p.Name LIKE ?
-            GROUP BY p.ID, p.Name, p.Contact, p.Email, p.DateOfBirth, p.CreatedDate
-            ORDER BY p.Name
-            LIMIT ? OFFSET ?
-        """, (f'%{search_query}%', per_page, offset))
+    if search_query and not search_match:
+        patients = []
     else:
-        cursor.execute("""
+        cursor.execute(f"""
             SELECT p.ID, p.Name, p.Contact, p.Email, p.DateOfBirth, p.CreatedDate,
-                   COUNT(a.ID) as appointment_count,
-                   MIN(a.Date) as first_appointment, MAX(a.Date) as last_appointment
-            FROM Patients p
-            LEFT JOIN Appointments a ON p.Name = a.PatientName
-            GROUP BY p.ID, p.Name, p.Contact, p.Email, p.DateOfBirth, p.CreatedDate
-            ORDER BY p.Name
+                   COALESCE(s.AppointmentCount, 0) as appointment_count,
+                   s.FirstDate as first_appointment, s.LastDate as last_appointment
+            FROM {source}
+            LEFT JOIN PatientAppointmentStats s ON s.PatientID = p.ID
+            WHERE {where_clause}
+            ORDER BY {order_by}
             LIMIT ? OFFSET ?
-        """, (per_page, offset))
+        """, params + [limit, offset])
+        patients = cursor.fetchall()
     
-    patients = cursor.fetchall()
-    conn.close()
+    if keyset_mode:
+        patients, prev_cursor, next_cursor = page_cursors(
+            patients, per_page, backwards, cursor_values is not None,
+            key=lambda row: (row[1], row[0]))
     
-    return render_template('patients.html', 
+    response = render_page('patients.html', 'partials/patients_results.html',
                          patients=patients, 
                          search_query=search_query,
                          page=page,
                          per_page=per_page,
                          total_patients=total_patients,
-                         total_pages=total_pages)
+                         total_pages=total_pages,
+                         cursor_mode=keyset_mode,
+                         prev_cursor=prev_cursor,
+                         next_cursor=next_cursor)
+    return set_validators(response, etag, last_modified)
+
+@app.route('/api/patients/search')
+def api_patients_search():
+    """Ranked, typo-tolerant patient lookup for search box autocomplete"""
+    search_query = request.args.get('q', '').strip()
+    limit = int(request.args.get('limit', 10))
+    
+    if limit < 1 or limit > 50:
+        limit = 10
+    
+    results = []
+    for row in search_patients(get_db(), search_query, limit):
+        results.append({
+            'id': row[0],
+            'name': row[1],
+            'nickname': row[2],
+            'contact': row[3],
+            'email': row[4]
+        })
+    
+    return jsonify({'query': search_query, 'results': results})
 
 @app.route('/patient/<patient_name>')
 def patient_history(patient_name):
     """Show detailed appointment history for a specific patient"""
-    conn = sqlite3.connect(DB_FILE)
+    conn = get_db()
     cursor = conn.cursor()
     
-    # Get patient details
-    cursor.execute("SELECT * FROM Patients WHERE Name = ?", (patient_name,))
-    patient = cursor.fetchone()
+    # Get patient details, medical history and allergies included
+    patient = load_patient_by_name(conn, patient_name)
     
     if not patient:
-        conn.close()
         return redirect('/patients')
     
+    patient_id = patient[0]
+    
     # Get all appointments for this patient
     cursor.execute("""
         SELECT * FROM Appointments 
-        WHERE PatientName = ? 
-        ORDER BY Date DESC, Time DESC
-    """, (patient_name,))
+        WHERE PatientID = ? 
+        ORDER BY StartsAt DESC
+    """, (patient_id,))
     
     appointments = cursor.fetchall()
     
-    # Get patient statistics
-    if appointments:
-        cursor.execute("""
-            SELECT COUNT(*) as total_appointments,
-                   MIN(Date) as first_appointment,
-                   MAX(Date) as last_appointment,
-                   COUNT(DISTINCT DentalCare) as unique_treatments
-            FROM Appointments 
-            WHERE PatientName = ?
-        """, (patient_name,))
-        
-        stats = cursor.fetchone()
-        
+    # Get precomputed patient statistics
+    cursor.execute("""
+        SELECT AppointmentCount, FirstDate, LastDate, TreatmentCount
+        FROM PatientAppointmentStats 
+        WHERE PatientID = ?
+    """, (patient_id,))
+    
+    stats = cursor.fetchone()
+    
+    if stats:
         # Get treatment history
         cursor.execute("""
-            SELECT DentalCare, COUNT(*) as treatment_count
-            FROM Appointments 
-            WHERE PatientName = ?
-            GROUP BY DentalCare
-            ORDER BY treatment_count DESC
-        """, (patient_name,))
+            SELECT DentalCare, AppointmentCount
+            FROM PatientCareStats 
+            WHERE PatientID = ?
+            ORDER BY AppointmentCount DESC
+        """, (patient_id,))
         
         treatments = cursor.fetchall()
     else:
         stats = (0, None, None, 0)
         treatments = []
     
-    conn.close()
-    
-    # Get current datetime for comparison
-    current_datetime = datetime.now().strftime('%Y-%m-%d %H:%M')
+    # Appointments starting before this are shown as past
+    now = current_timestamp()
     
     return render_template('patient_history.html', 
                          patient=patient,
@@ -573,7 +653,7 @@ def patient_history(patient_name):
                          appointments=appointments,
                          stats=stats,
                          treatments=treatments,
-                         current_datetime=current_datetime)
+                         now=now)
 
 @app.route('/calendar')
 def calendar_view():
@@ -581,29 +661,39 @@ def calendar_view():
     year = int(request.args.get('year', date.today().year))
     month = int(request.args.get('month', date.today().month))
     
+    # Get the current minute for comparison; past appointments are marked, so the
+    # page also changes as the clock moves on
+    now = current_timestamp()
+    
+    # Optionally only one chair's or dentist's appointments
+    resource = request.args.get('resource', '')
+    
+    etag, last_modified = validators(('appointments', 'resources'), request.full_path, wants_fragment(), now)
+    if is_not_modified(etag, last_modified):
+        return not_modified(etag, last_modified)
+    
     # Create calendar
     cal = calendar.monthcalendar(year, month)
     month_name = calendar.month_name[month]
     
     # Get appointments for the month
-    conn = sqlite3.connect(DB_FILE)
+    conn = get_db()
     cursor = conn.cursor()
     
-    # Get start and end dates for the month
-    start_date = f"{year:04d}-{month:02d}-01"
-    if month == 12:
-        end_date = f"{year+1:04d}-01-01"
-    else:
-        end_date = f"{year:04d}-{month+1:02d}-01"
+    # Get start and end timestamps for the month
+    start = timestamp(f"{year:04d}-{month:02d}-01")
+    end = start + calendar.monthrange(year, month)[1] * DAY_SECONDS
     
-    cursor.execute("""
-        SELECT * FROM Appointments 
-        WHERE Date >= ? AND Date < ? 
-        ORDER BY Date, Time
-    """, (start_date, end_date))
+    query = "SELECT * FROM Appointments WHERE StartsAt >= ? AND StartsAt < ?"
+    params = [start, end]
+    if resource.isdigit():
+        query += " AND ResourceID = ?"
+        params.append(int(resource))
+    cursor.execute(query + " ORDER BY StartsAt", params)
     
     appointments = cursor.fetchall()
-    conn.close()
+    
+    resources = list_resources(conn)
     
     # Organize appointments by date
     appointments_by_date = {}
@@ -621,10 +711,7 @@ def calendar_view():
     next_month = month + 1 if month < 12 else 1
     next_year = year if month < 12 else year + 1
     
-    # Get current datetime for comparison
-    current_datetime = datetime.now().strftime('%Y-%m-%d %H:%M')
-    
-    return render_template('calendar.html', 
+    response = render_page('calendar.html', 'partials/calendar_month.html',
                          calendar=cal,
                          month_name=month_name,
                          year=year,
@@ -635,7 +722,11 @@ def calendar_view():
                          prev_year=prev_year,
                          next_month=next_month,
                          next_year=next_year,
-                         current_datetime=current_datetime)
+                         now=now,
+                         resources=resources,
+                         resource_names={row[0]: row[1] for row in resources},
+                         selected_resource=resource)
+    return set_validators(response, etag, last_modified)
 
 @app.route('/appointments')
 def appointments():
@@ -651,7 +742,7 @@ def appointments():
     if per_page < 1 or per_page > 100:  # Limit to reasonable range
         per_page = 15
     
-    conn = sqlite3.connect(DB_FILE)
+    conn = get_db()
     cursor = conn.cursor()
     
     # Build the base query and count query
@@ -659,8 +750,12 @@ def appointments():
     params = []
     
     if selected_date:
-        base_conditions.append("Date = ?")
-        params.append(selected_date)
+        try:
+            day_start = timestamp(selected_date)
+        except ValueError:
+            return redirect('/appointments')
+        base_conditions.append("StartsAt >= ? AND StartsAt < ?")
+        params += [day_start, day_start + DAY_SECONDS]
     
     if dental_care_filter:
         base_conditions.append("DentalCare LIKE ?")
@@ -668,10 +763,18 @@ def appointments():
     
     where_clause = " AND ".join(base_conditions) if base_conditions else "1=1"
     
-    # Get total count for pagination
+    # Opt-in cursor pagination: seek past the last row instead of counting an OFFSET
+    keyset_mode = cursor_mode(request.args)
+    cursor_values, backwards = read_cursor(request.args, len(APPOINTMENT_KEY))
+    prev_cursor = next_cursor = None
+    
+    # Get total count for pagination (a cached, possibly slightly stale one in cursor mode)
     count_query = f"SELECT COUNT(*) FROM Appointments WHERE {where_clause}"
-    cursor.execute(count_query, params)
-    total_appointments = cursor.fetchone()[0]
+    if keyset_mode:
+        total_appointments = cached_count(conn, count_query, params)
+    else:
+        cursor.execute(count_query, params)
+        total_appointments = cursor.fetchone()[0]
     
     # Calculate pagination
     total_pages = (total_appointments + per_page - 1) // per_page
@@ -681,36 +784,48 @@ def appointments():
     offset = (page - 1) * per_page
     
     # Get appointments with pagination
-    query = f"SELECT * FROM Appointments WHERE {where_clause} ORDER BY Date, Time LIMIT ? OFFSET ?"
-    cursor.execute(query, params + [per_page, offset])
-    appointments = cursor.fetchall()
+    if keyset_mode:
+        if cursor_values:
+            where_clause += " AND " + keyset_condition(APPOINTMENT_KEY, backwards=backwards)
+            params = params + cursor_values
+        order_by = keyset_order(APPOINTMENT_KEY, backwards=backwards)
+        query = f"SELECT * FROM Appointments WHERE {where_clause} ORDER BY {order_by} LIMIT ?"
+        cursor.execute(query, params + [per_page + 1])
+        appointments, prev_cursor, next_cursor = page_cursors(
+            cursor.fetchall(), per_page, backwards, cursor_values is not None,
+            key=lambda row: (row[9], row[0]))
+    else:
+        query = f"SELECT * FROM Appointments WHERE {where_clause} ORDER BY StartsAt, ID LIMIT ? OFFSET ?"
+        cursor.execute(query, params + [per_page, offset])
+        appointments = cursor.fetchall()
     
     # Get unique dental care types for filter dropdown
     cursor.execute("SELECT DISTINCT DentalCare FROM Appointments ORDER BY DentalCare")
     dental_care_types = [row[0] for row in cursor.fetchall()]
     
-    conn.close()
-    
     # Set error message for past appointment editing
     if error_message == 'past_appointment':
         error_message = "Cannot edit appointments that have already passed."
     elif error_message == 'past_appointment_delete':
         error_message = "Cannot delete appointments that have already passed."
     
-    # Get current datetime for comparison
-    current_datetime = datetime.now().strftime('%Y-%m-%d %H:%M')
+    # Appointments starting before this are shown as past
+    now = current_timestamp()
     
-    return render_template('appointments.html', 
+    return render_page('appointments.html', 'partials/appointments_results.html',
                          appointments=appointments, 
                          selected_date=selected_date,
                          dental_care_filter=dental_care_filter,
                          dental_care_types=dental_care_types,
                          error_message=error_message,
-                         current_datetime=current_datetime,
+                         now=now,
                          page=page,
                          per_page=per_page,
                          total_appointments=total_appointments,
-                         total_pages=total_pages)
+                         total_pages=total_pages,
+                         cursor_mode=keyset_mode,
+                         prev_cursor=prev_cursor,
+                         next_cursor=next_cursor)
 
 @app.route('/edit/<int:appointment_id>', methods=['GET', 'POST'])
 def edit_appointment(appointment_id):
@@ -730,21 +845,23 @@ def edit_appointment(appointment_id):
             is_valid, error_message = validate_appointment_date(appointment_date, appointment_id)
             if not is_valid:
                 return jsonify({'success': False, 'error': error_message}), 400
+            
+            resource_id, error_message = booking_resource(request.form.get('resource_id', ''))
+            if error_message:
+                return jsonify({'success': False, 'error': error_message}), 400
+            
+            minutes, error_message = booking_minutes(request.form.get('duration'), dental_care, appointment_id)
+            error_message = error_message or clinic_hours_error(time, minutes)
+            if error_message:
+                return jsonify({'success': False, 'error': error_message}), 400
 
-            # Check for appointment conflicts (excluding current appointment)
-            is_available, conflict_message = check_appointment_conflict(appointment_date, time, appointment_id)
-            if not is_available:
-                return jsonify({'success': False, 'error': conflict_message}), 400
-
-            conn = sqlite3.connect(DB_FILE)
-            cursor = conn.cursor()
-            cursor.execute("""
-                UPDATE Appointments 
-                SET PatientName = ?, Contact = ?, Date = ?, Time = ?, DentalCare = ?
-                WHERE ID = ?
-            """, (name, contact, appointment_date, time, dental_care, appointment_id))
-            conn.commit()
-            conn.close()
+            # The overlap check and the update run as one writer job, so no booking can land in between
+            if not db.write(update_appointment, appointment_id, name, contact, appointment_date, time, dental_care,
+                            resource_id, minutes):
+                return jsonify({'success': False, 'error': slot_conflict_message(appointment_date, time, minutes)}), 400
+            availability_index.forget_appointment(appointment_id)
+            availability_index.invalidate(appointment_date)
+            data_versions.bump('appointments')
 
             return jsonify({'success': True, 'message': 'Appointment updated successfully'})
         else:
@@ -755,69 +872,57 @@ def edit_appointment(appointment_id):
             time = request.form['time']
             dental_care = request.form['dental_care']
 
-            # Validate appointment date
+            # Validate appointment date, length and the chosen chair or dentist
             is_valid, error_message = validate_appointment_date(appointment_date, appointment_id)
-            if not is_valid:
+            resource_id = minutes = None
+            if is_valid:
+                resource_id, error_message = booking_resource(request.form.get('resource_id', ''))
+            if not error_message:
+                minutes, error_message = booking_minutes(request.form.get('duration'), dental_care, appointment_id)
+            if not error_message:
+                error_message = clinic_hours_error(time, minutes)
+            
+            # The overlap check and the update run as one writer job, so no booking can land in between
+            if not error_message and not db.write(update_appointment, appointment_id, name, contact,
+                                                  appointment_date, time, dental_care, resource_id, minutes):
+                error_message = slot_conflict_message(appointment_date, time, minutes)
+            
+            if error_message:
                 # Get the appointment data to re-populate the form
-                conn = sqlite3.connect(DB_FILE)
+                conn = get_db()
                 cursor = conn.cursor()
                 cursor.execute("SELECT * FROM Appointments WHERE ID = ?", (appointment_id,))
                 appointment = cursor.fetchone()
-                conn.close()
                 
                 return render_template('edit_appointment.html', 
                                      appointment=appointment, 
+                                     resources=list_resources(conn),
                                      error_message=error_message)
-
-            # Check for appointment conflicts (excluding current appointment)
-            is_available, conflict_message = check_appointment_conflict(appointment_date, time, appointment_id)
-            if not is_available:
-                # Get the appointment data to re-populate the form
-                conn = sqlite3.connect(DB_FILE)
-                cursor = conn.cursor()
-                cursor.execute("SELECT * FROM Appointments WHERE ID = ?", (appointment_id,))
-                appointment = cursor.fetchone()
-                conn.close()
-                
-                return render_template('edit_appointment.html', 
-                                     appointment=appointment, 
-                                     error_message=conflict_message)
-
-            conn = sqlite3.connect(DB_FILE)
-            cursor = conn.cursor()
-            cursor.execute("""
-                UPDATE Appointments 
-                SET PatientName = ?, Contact = ?, Date = ?, Time = ?, DentalCare = ?
-                WHERE ID = ?
-            """, (name, contact, appointment_date, time, dental_care, appointment_id))
-            conn.commit()
-            conn.close()
+            availability_index.forget_appointment(appointment_id)
+            availability_index.invalidate(appointment_date)
+            data_versions.bump('appointments')
 
             return redirect('/appointments')
     
     # GET request - show edit form
-    conn = sqlite3.connect(DB_FILE)
+    conn = get_db()
     cursor = conn.cursor()
     cursor.execute("SELECT * FROM Appointments WHERE ID = ?", (appointment_id,))
     appointment = cursor.fetchone()
-    conn.close()
     
     if appointment is None:
         return redirect('/appointments')
     
     # Check if appointment has already passed
-    appointment_datetime = f"{appointment[3]} {appointment[4]}"  # Date + Time
-    current_datetime = datetime.now().strftime('%Y-%m-%d %H:%M')
-    
-    if appointment_datetime < current_datetime:
+    if has_passed(appointment):
         # Redirect with error message
         return redirect('/appointments?error=past_appointment')
     
-    return render_template('edit_appointment.html', appointment=appointment)
+    return render_template('edit_appointment.html', appointment=appointment, resources=list_resources(conn))
 
 @app.route('/delete/<int:appointment_id>')
 def delete_appointment(appointment_id):
-    conn = sqlite3.connect(DB_FILE)
+    conn = get_db()
     cursor = conn.cursor()
     
     # First, get the appointment details to check if it's in the past
@@ -825,63 +930,113 @@ def delete_appointment(appointment_id):
     appointment = cursor.fetchone()
     
     if appointment is None:
-        conn.close()
         return redirect('/appointments')
     
     # Check if appointment has already passed
-    appointment_datetime = f"{appointment[3]} {appointment[4]}"  # Date + Time
-    current_datetime = datetime.now().strftime('%Y-%m-%d %H:%M')
-    
-    if appointment_datetime < current_datetime:
-        conn.close()
+    if has_passed(appointment):
         # Redirect with error message for past appointment deletion
         return redirect('/appointments?error=past_appointment_delete')
     
     # If appointment is not in the past, proceed with deletion
-    cursor.execute("DELETE FROM Appointments WHERE ID = ?", (appointment_id,))
-    conn.commit()
-    conn.close()
+    db.write(lambda conn: conn.execute("DELETE FROM Appointments WHERE ID = ?", (appointment_id,)))
+    availability_index.invalidate(appointment[3])
+    data_versions.bump('appointments')
     
     return redirect('/appointments')
 
+def is_appointment_cursor(values):
+    """Whether decoded cursor values fit APPOINTMENT_KEY: an integer StartsAt (or None) and ID"""
+    if values is None:
+        return False
+    starts_at, appointment_id = values
+    # type(), not isinstance(): true and false are ints too
+    return type(appointment_id) is int and (starts_at is None or type(starts_at) is int)
+
 @app.route('/api/appointments')
 def api_appointments():
+    """Stream appointments as a JSON array or NDJSON, optionally by date range and page"""
     selected_date = request.args.get('date', '')
+    start_date = request.args.get('start', selected_date)
+    end_date = request.args.get('end', selected_date)
+    after = request.args.get('after', '')
+    ndjson = wants_ndjson(request)
+    
+    # Projection: ?fields=id,date,time picks the keys returned for each appointment
+    fields = [field.strip() for field in request.args.get('fields', '').split(',') if field.strip()]
+    fields = fields or list(DEFAULT_APPOINTMENT_FIELDS)
+    unknown = [field for field in fields if field not in APPOINTMENT_FIELDS]
+    if unknown:
+        return jsonify({'error': 'Unknown fields: ' + ', '.join(unknown)}), 400
+    
+    limit = request.args.get('limit', type=int)
+    if limit is not None and (limit < 1 or limit > MAX_API_PAGE_SIZE):
+        return jsonify({'error': f'limit must be between 1 and {MAX_API_PAGE_SIZE}'}), 400
+    
+    cursor_values = decode_cursor(after, len(APPOINTMENT_KEY)) if after else None
+    if after and not is_appointment_cursor(cursor_values):
+        return jsonify({'error': 'Invalid cursor'}), 400
+    
+    etag, last_modified = validators(('appointments',), request.full_path, ndjson)
+    if is_not_modified(etag, last_modified):
+        return not_modified(etag, last_modified)
+    
+    # Dates are inclusive, so the range runs to the start of the day after end
+    conditions = []
+    params = []
+    try:
+        if start_date:
+            conditions.append("StartsAt >= ?")
+            params.append(timestamp(start_date))
+        if end_date:
+            conditions.append("StartsAt < ?")
+            params.append(timestamp(end_date) + DAY_SECONDS)
+    except ValueError:
+        return jsonify({'error': 'Invalid date format. Please use YYYY-MM-DD format.'}), 400
+    if cursor_values:
+        conditions.append(keyset_condition(APPOINTMENT_KEY))
+        params += cursor_values
+    where_clause = " AND ".join(conditions) if conditions else "1=1"
     
-    conn = sqlite3.connect(DB_FILE)
+    # The sort key is always selected so the last row can become the next cursor
+    columns = ", ".join(APPOINTMENT_KEY + tuple(APPOINTMENT_FIELDS[field] for field in fields))
+    query = f"SELECT {columns} FROM Appointments WHERE {where_clause} ORDER BY StartsAt, ID"
+    
+    conn = get_db()
     cursor = conn.cursor()
     
-    if selected_date:
-        cursor.execute("SELECT * FROM Appointments WHERE Date = ? ORDER BY Time", (selected_date,))
+    next_cursor = None
+    if limit is not None:
+        cursor.execute(query + " LIMIT ?", params + [limit + 1])
+        rows = cursor.fetchall()
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1][:len(APPOINTMENT_KEY)])
     else:
-        cursor.execute("SELECT * FROM Appointments ORDER BY Date, Time")
-    
-    appointments = cursor.fetchall()
-    conn.close()
-    
-    # Convert to list of dictionaries for JSON response
-    appointments_list = []
-    for row in appointments:
-        appointments_list.append({
-            'id': row[0],
-            'patient_name': row[1],
-            'contact': row[2],
-            'date': row[3],
-            'time': row[4],
-            'dental_care': row[5]
-        })
-    
-    return jsonify(appointments_list)
+        cursor.execute(query, params)
+        rows = iter_rows(cursor)
+    
+    key_size = len(APPOINTMENT_KEY)
+    items = (dict(zip(fields, row[key_size:])) for row in rows)
+    chunks = (ndjson_chunks if ndjson else json_array_chunks)(items, app.json.dumps)
+    
+    response = Response(stream_with_context(chunks),
+                        mimetype=NDJSON_MIMETYPE if ndjson else 'application/json')
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return set_validators(response, etag, last_modified)
 
 @app.route('/api/appointment/<int:appointment_id>')
 def api_appointment_details(appointment_id):
     """Get appointment details by ID"""
-    conn = sqlite3.connect(DB_FILE)
+    etag, last_modified = validators(('appointments',), appointment_id)
+    if is_not_modified(etag, last_modified):
+        return not_modified(etag, last_modified)
+    
+    conn = get_db()
     cursor = conn.cursor()
     
     cursor.execute("SELECT * FROM Appointments WHERE ID = ?", (appointment_id,))
     appointment = cursor.fetchone()
-    conn.close()
     
     if appointment is None:
         return jsonify({'success': False, 'error': 'Appointment not found'}), 404
@@ -892,44 +1047,222 @@ def api_appointment_details(appointment_id):
         'contact': appointment[2],
         'date': appointment[3],
         'time': appointment[4],
-        'dental_care': appointment[5]
+        'dental_care': appointment[5],
+        'resource_id': appointment[7],
+        'duration': appointment[8]
     }
     
-    return jsonify({'success': True, 'appointment': appointment_data})
+    return set_validators(jsonify({'success': True, 'appointment': appointment_data}), etag, last_modified)
 
 @app.route('/api/available-times')
 def api_available_times():
-    """Get available times for a specific date"""
+    """Get available times for a specific date, for one resource or the whole clinic.
+    
+    Available times are those where an appointment of duration=<minutes>, or
+    of the length of dental_care=<text>, fits; one slot by default.
+    """
     selected_date = request.args.get('date', '')
     
     if not selected_date:
         return jsonify({'error': 'Date parameter is required'}), 400
     
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
+    conn = get_db()
+    resources = schedule_resources(conn, request.args.get('resource', ''))
+    if resources is None:
+        return jsonify({'error': 'Unknown or inactive resource'}), 400
+    minutes, error_message = booking_minutes(request.args.get('duration', ''), request.args.get('dental_care', ''))
+    if error_message:
+        return jsonify({'error': error_message}), 400
     
-    # Get all booked times for the selected date
-    cursor.execute("SELECT Time FROM Appointments WHERE Date = ? ORDER BY Time", (selected_date,))
-    booked_times = [row[0] for row in cursor.fetchall()]
-    
-    conn.close()
-    
-    # Generate all possible times (9 AM to 5 PM, 30-minute intervals)
-    all_times = []
-    for hour in range(9, 18):  # 9 AM to 5 PM
-        for minute in [0, 30]:
-            time_str = f"{hour:02d}:{minute:02d}"
-            all_times.append(time_str)
-    
-    # Filter out booked times
-    available_times = [time for time in all_times if time not in booked_times]
+    # Booked slots and open start times within clinic hours, from the slot index
+    booked_times = availability_index.booked_times(conn, selected_date, resources)
+    available_times = availability_index.free_slots(conn, selected_date, resources, minutes)
     
     return jsonify({
         'date': selected_date,
+        'duration': minutes,
         'booked_times': booked_times,
         'available_times': available_times
     })
 
+@app.route('/api/availability')
+def api_availability():
+    """Get booked and available times for every date in a month or date range.
+    
+    With resource=<id> the times are that chair's or dentist's; without it a
+    time is available while any active resource is free there. duration= and
+    dental_care= size the appointment, as for /api/available-times.
+    """
+    month = request.args.get('month', '')
+    
+    try:
+        if month:
+            month_start = datetime.strptime(month, '%Y-%m').date()
+            days_in_month = calendar.monthrange(month_start.year, month_start.month)[1]
+            start_date = month_start
+            end_date = month_start.replace(day=days_in_month)
+        else:
+            start_date = datetime.strptime(request.args.get('start', ''), '%Y-%m-%d').date()
+            end_date = datetime.strptime(request.args.get('end', start_date.isoformat()), '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({'error': 'Use month=YYYY-MM or start=YYYY-MM-DD&end=YYYY-MM-DD.'}), 400
+    
+    if end_date < start_date:
+        return jsonify({'error': 'End date must not be before start date.'}), 400
+    if (end_date - start_date).days >= MAX_AVAILABILITY_DAYS:
+        return jsonify({'error': f'Date range is limited to {MAX_AVAILABILITY_DAYS} days.'}), 400
+    
+    minutes, error_message = booking_minutes(request.args.get('duration', ''), request.args.get('dental_care', ''))
+    if error_message:
+        return jsonify({'error': error_message}), 400
+    
+    resource = request.args.get('resource', '')
+    etag, last_modified = validators(('appointments', 'resources'), start_date, end_date, resource, minutes)
+    if is_not_modified(etag, last_modified):
+        return not_modified(etag, last_modified)
+    
+    conn = get_db()
+    resources = schedule_resources(conn, resource)
+    if resources is None:
+        return jsonify({'error': 'Unknown or inactive resource'}), 400
+    days = availability_index.slots_range(conn, start_date.isoformat(), end_date.isoformat(), resources, minutes)
+    
+    response = jsonify({
+        'start': start_date.isoformat(),
+        'end': end_date.isoformat(),
+        'duration': minutes,
+        'days': {
+            day: {'booked_times': booked_times, 'available_times': available_times}
+            for day, booked_times, available_times in days
+        }
+    })
+    # Let the browser keep the month and revalidate it with If-None-Match
+    return set_validators(response, etag, last_modified)
+
+@app.route('/api/next-available-times')
+def api_next_available_times():
+    """Get the next open slots after a date and time, sized by duration= or dental_care="""
+    after_date = request.args.get('date', date.today().isoformat())
+    after_time = request.args.get('time', '')
+    count = int(request.args.get('count', 5))
+    
+    if count < 1 or count > 50:
+        count = 5
+    
+    conn = get_db()
+    resources = schedule_resources(conn, request.args.get('resource', ''))
+    if resources is None:
+        return jsonify({'error': 'Unknown or inactive resource'}), 400
+    minutes, error_message = booking_minutes(request.args.get('duration', ''), request.args.get('dental_care', ''))
+    if error_message:
+        return jsonify({'error': error_message}), 400
+    
+    try:
+        slots = availability_index.next_free_slots(conn, after_date, resources, after_time, count,
+                                                   minutes=minutes)
+    except ValueError:
+        return jsonify({'error': 'Invalid date format. Please use YYYY-MM-DD format.'}), 400
+    
+    return jsonify({
+        'date': after_date,
+        'time': after_time,
+        'slots': [{'date': slot_date, 'time': slot_time} for slot_date, slot_time in slots]
+    })
+
+@app.route('/api/resources', methods=['GET', 'POST'])
+def api_resources():
+    """List the chairs and dentists appointments are booked against, or add one"""
+    if request.method == 'GET':
+        rows = list_resources(get_db(), include_inactive=request.args.get('all') == '1')
+        return jsonify({'resources': [
+            {'id': row[0], 'name': row[1], 'kind': row[2], 'active': bool(row[3])} for row in rows
+        ]})
+    
+    data = request.get_json(silent=True) or {}
+    name = str(data.get('name', '')).strip()
+    kind = data.get('kind', 'chair')
+    if not name or kind not in RESOURCE_KINDS:
+        return jsonify({'success': False, 'error': f"Send a name and a kind of {' or '.join(RESOURCE_KINDS)}"}), 400
+    try:
+        resource_id = db.write(lambda conn: conn.execute(
+            "INSERT INTO Resources (Name, Kind) VALUES (?, ?)", (name, kind)).lastrowid)
+    except sqlite3.IntegrityError:
+        return jsonify({'success': False, 'error': 'A resource with this name already exists.'}), 400
+    data_versions.bump('resources')
+    return jsonify({'success': True, 'id': resource_id}), 201
+
+@app.route('/api/resources/<int:resource_id>', methods=['PATCH'])
+def api_resource(resource_id):
+    """Rename a resource or take it out of (or back into) booking"""
+    data = request.get_json(silent=True) or {}
+    name = str(data.get('name', '')).strip()
+    active = data.get('active')
+    if not name and not isinstance(active, bool):
+        return jsonify({'success': False, 'error': 'Send a new name and/or active: true|false'}), 400
+    
+    def update_resource(conn):
+        cursor = conn.execute('''
+            UPDATE Resources SET Name = COALESCE(?, Name), Active = COALESCE(?, Active) WHERE ID = ?
+        ''', (name or None, None if active is None else int(active), resource_id))
+        return cursor.rowcount
+    
+    try:
+        updated = db.write(update_resource)
+    except sqlite3.IntegrityError:
+        return jsonify({'success': False, 'error': 'A resource with this name already exists.'}), 400
+    if not updated:
+        return jsonify({'success': False, 'error': 'Resource not found'}), 404
+    data_versions.bump('resources')
+    return jsonify({'success': True})
+
+@app.route('/api/import/<kind>', methods=['POST'])
+def api_import(kind):
+    """Bulk-import patients, appointments or treatment_records from a CSV or NDJSON body.
+    
+    The format comes from ?format= or the Content-Type (text/csv or
+    application/x-ndjson). The body is read as it arrives and written in
+    batches; rows that fail validation are listed in the summary and skipped.
+    """
+    if kind not in IMPORTERS:
+        return jsonify({'success': False, 'error': f"Import one of: {', '.join(IMPORTERS)}"}), 404
+    fmt = request.args.get('format') or {'text/csv': 'csv', NDJSON_MIMETYPE: 'ndjson'}.get(request.mimetype)
+    if fmt not in IMPORT_FORMATS:
+        return jsonify({'success': False, 'error': 'Send text/csv or application/x-ndjson, or add ?format=csv|ndjson'}), 400
+    
+    summary = import_records(kind, request.stream, fmt)
+    
+    if summary['imported']:
+        if kind == 'appointments':
+            availability_index.invalidate()
+        data_versions.bump('patients', 'appointments',
+                           *(f'treatment_records:{patient_id}' for patient_id in summary['patient_ids']))
+    return jsonify({'success': True, **summary})
+
+@app.route('/api/export/<kind>')
+def api_export(kind):
+    """Stream patients, appointments, treatment_records or dental_charts as CSV or NDJSON.
+    
+    ?after= takes the X-Export-Watermark of an earlier export and returns
+    only what was added (or, for charts, saved) since.
+    """
+    if kind not in EXPORTS:
+        return jsonify({'success': False, 'error': f"Export one of: {', '.join(EXPORTS)}"}), 404
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'success': False, 'error': 'Use format=csv or format=ndjson'}), 400
+    
+    try:
+        fields, watermark, rows = export_rows(get_db(), kind, request.args.get('after'))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'after must be the watermark of an earlier export'}), 400
+    
+    response = Response(stream_with_context(export_chunks(fields, rows, fmt, app.json.dumps)),
+                        mimetype='text/csv' if fmt == 'csv' else NDJSON_MIMETYPE)
+    response.headers['Content-Disposition'] = f'attachment; filename="{kind}.{fmt}"'
+    if watermark is not None:
+        response.headers['X-Export-Watermark'] = str(watermark)
+    return response
+
 @app.route('/add', methods=['GET', 'POST'])
 def add():
     if request.method == 'POST':
@@ -938,10 +1271,25 @@ def add():
         appointment_date = request.form['date']
         time = request.form['time']
         dental_care = request.form['dental_care']
+        resource = request.form.get('resource_id', '')
+        duration = request.form.get('duration', '')
 
-        # Validate appointment date
+        # Validate appointment date, length and the chosen chair or dentist
         is_valid, error_message = validate_appointment_date(appointment_date)
-        if not is_valid:
+        resource_id = minutes = None
+        if is_valid:
+            resource_id, error_message = booking_resource(resource)
+        if not error_message:
+            minutes, error_message = booking_minutes(duration, dental_care)
+        if not error_message:
+            error_message = clinic_hours_error(time, minutes)
+
+        # The overlap check and the insert run as one writer job, so no booking can land in between
+        if not error_message and not db.write(insert_appointment, name, contact, appointment_date, time,
+                                              dental_care, resource_id, minutes):
+            error_message = slot_conflict_message(appointment_date, time, minutes)
+
+        if error_message:
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
                 return jsonify({'success': False, 'error': error_message}), 400
             return render_template('add_appointment.html', 
@@ -950,29 +1298,12 @@ def add():
                                  contact=contact,
                                  date=appointment_date,
                                  time=time,
-                                 dental_care=dental_care)
-
-        # Check for appointment conflicts
-        is_available, conflict_message = check_appointment_conflict(appointment_date, time)
-        if not is_available:
-            if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-                return jsonify({'success': False, 'error': conflict_message}), 400
-            return render_template('add_appointment.html', 
-                                 error_message=conflict_message,
-                                 patient_name=name,
-                                 contact=contact,
-                                 date=appointment_date,
-                                 time=time,
-                                 dental_care=dental_care)
-
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO Appointments (PatientName, Contact, Date, Time, DentalCare)
-            VALUES (?, ?, ?, ?, ?)
-        """, (name, contact, appointment_date, time, dental_care))
-        conn.commit()
-        conn.close()
+                                 dental_care=dental_care,
+                                 resource_id=resource,
+                                 duration=duration,
+                                 resources=list_resources(get_db()))
+        availability_index.invalidate(appointment_date)
+        data_versions.bump('appointments')
 
         # Check if it's an AJAX request
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
@@ -982,19 +1313,23 @@ def add():
     
     # GET request - show form with optional pre-filled patient name
     patient_name = request.args.get('patient', '')
-    return render_template('add_appointment.html', patient_name=patient_name)
+    return render_template('add_appointment.html', patient_name=patient_name, resources=list_resources(get_db()))
 
 @app.route('/patient/<patient_name>/treatment-records', methods=['GET', 'POST'])
 def treatment_records(patient_name):
-    conn = sqlite3.connect(DB_FILE)
+    conn = get_db()
     cursor = conn.cursor()
     # Get patient info
     cursor.execute("SELECT ID, Name FROM Patients WHERE Name = ?", (patient_name,))
     patient = cursor.fetchone()
     if not patient:
-        conn.close()
         return redirect('/patients')
     patient_id = patient[0]
+    if request.method == 'GET':
+        etag, last_modified = validators(('patients', f'treatment_records:{patient_id}'),
+                                         request.full_path, wants_fragment(), date.today())
+        if is_not_modified(etag, last_modified):
+            return not_modified(etag, last_modified)
     error_message = None
     # Handle new record submission
     if request.method == 'POST':
@@ -1008,12 +1343,12 @@ def treatment_records(patient_name):
         if not date_of_treatment:
             error_message = 'Date of treatment is required.'
         else:
-            cursor.execute('''
+            db.write(lambda conn: conn.execute('''
                 INSERT INTO TreatmentRecords
                 (PatientID, DateOfTreatment, ToothNumber, Procedure, DentistName, AmountCharged, AmountPaid, Balance)
                 VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (patient_id, date_of_treatment, tooth_number, procedure, dentist_name, amount_charged, amount_paid, balance))
-            conn.commit()
+            ''', (patient_id, date_of_treatment, tooth_number, procedure, dentist_name, amount_charged, amount_paid, balance)))
+            data_versions.bump(f'treatment_records:{patient_id}')
             flash('Treatment record added successfully!', 'success')
     # Pagination logic
     page = int(request.args.get('page', 1))
@@ -1022,23 +1357,47 @@ def treatment_records(patient_name):
         page = 1
     if per_page < 1 or per_page > 100:
         per_page = 10
-    # Get total count for pagination
-    cursor.execute('SELECT COUNT(*) FROM TreatmentRecords WHERE PatientID = ?', (patient_id,))
-    total_records = cursor.fetchone()[0]
+    # Opt-in cursor pagination: seek past the last row instead of counting an OFFSET
+    keyset_mode = cursor_mode(request.args)
+    cursor_values, backwards = read_cursor(request.args, len(TREATMENT_RECORD_KEY))
+    prev_cursor = next_cursor = None
+    # Get total count for pagination (a cached, possibly slightly stale one in cursor mode)
+    count_query = 'SELECT COUNT(*) FROM TreatmentRecords WHERE PatientID = ?'
+    if keyset_mode and request.method == 'GET':
+        total_records = cached_count(conn, count_query, (patient_id,))
+    else:
+        cursor.execute(count_query, (patient_id,))
+        total_records = cursor.fetchone()[0]
     total_pages = (total_records + per_page - 1) // per_page
     if page > total_pages and total_pages > 0:
         page = total_pages
     offset = (page - 1) * per_page
-    # Get paginated treatment records for this patient
-    cursor.execute('''
-        SELECT DateOfTreatment, ToothNumber, Procedure, DentistName, AmountCharged, AmountPaid, Balance
-        FROM TreatmentRecords WHERE PatientID = ? ORDER BY DateOfTreatment DESC
-        LIMIT ? OFFSET ?
-    ''', (patient_id, per_page, offset))
-    records = cursor.fetchall()
-    conn.close()
-    return render_template(
+    # Get paginated treatment records for this patient, newest first
+    if keyset_mode:
+        where_clause = 'PatientID = ?'
+        params = [patient_id]
+        if cursor_values:
+            where_clause += ' AND ' + keyset_condition(TREATMENT_RECORD_KEY, descending=True, backwards=backwards)
+            params += cursor_values
+        order_by = keyset_order(TREATMENT_RECORD_KEY, descending=True, backwards=backwards)
+        cursor.execute(f'''
+            SELECT DateOfTreatment, ToothNumber, Procedure, DentistName, AmountCharged, AmountPaid, Balance, ID
+            FROM TreatmentRecords WHERE {where_clause} ORDER BY {order_by}
+            LIMIT ?
+        ''', params + [per_page + 1])
+        records, prev_cursor, next_cursor = page_cursors(
+            cursor.fetchall(), per_page, backwards, cursor_values is not None,
+            key=lambda row: (row[0], row[7]))
+    else:
+        cursor.execute('''
+            SELECT DateOfTreatment, ToothNumber, Procedure, DentistName, AmountCharged, AmountPaid, Balance, ID
+            FROM TreatmentRecords WHERE PatientID = ? ORDER BY DateOfTreatment DESC, ID DESC
+            LIMIT ? OFFSET ?
+        ''', (patient_id, per_page, offset))
+        records = cursor.fetchall()
+    response = render_page(
         'treatment_records.html',
+        'partials/treatment_records_results.html',
         patient=patient,
         records=records,
         error_message=error_message,
@@ -1046,18 +1405,23 @@ def treatment_records(patient_name):
         page=page,
         per_page=per_page,
         total_records=total_records,
-        total_pages=total_pages
+        total_pages=total_pages,
+        cursor_mode=keyset_mode,
+        prev_cursor=prev_cursor,
+        next_cursor=next_cursor
     )
+    if request.method == 'POST':
+        return response
+    return set_validators(response, etag, last_modified)
 
 @app.route('/patient/<patient_name>/intraoral-exam')
 def intraoral_exam(patient_name):
-    conn = sqlite3.connect(DB_FILE)
+    conn = get_db()
     cursor = conn.cursor()
     # Get patient info
     cursor.execute("SELECT ID, Name FROM Patients WHERE Name = ?", (patient_name,))
     patient = cursor.fetchone()
     if not patient:
-        conn.close()
         return redirect('/patients')
     patient_id = patient[0]
     # Get dental chart records for this patient
@@ -1066,54 +1430,110 @@ def intraoral_exam(patient_name):
         FROM DentalCharts WHERE PatientID = ? ORDER BY ToothNumber ASC
     ''', (patient_id,))
     chart_records = cursor.fetchall()
-    # Prepare a list of string tooth numbers for template
-    tooth_numbers_with_records = [str(row[0]) for row in chart_records]
-    conn.close()
+    # Teeth with anything saved: the packed chart's surfaces and notes, plus any older exam rows
+    charted = set(load_chart(conn, patient_id)) | {str(row[0]) for row in chart_records}
+    tooth_numbers_with_records = [tooth for tooth in TEETH if tooth in charted] + sorted(charted - set(TEETH))
     return render_template(
         'intraoral_exam.html',
         patient=patient,
         chart_records=chart_records,
-        tooth_numbers_with_records=tooth_numbers_with_records
+        tooth_numbers_with_records=tooth_numbers_with_records,
+        chart_visits=chart_visits(conn, patient_id)
     )
 
-@app.route('/api/patient/<int:patient_id>/dental-chart', methods=['GET', 'POST'])
+def resolve_chart_revision(conn, patient_id, value):
+    """A chart revision from a revision number or a YYYY-MM-DD[ HH:MM:SS] UTC time"""
+    if value.isdigit():
+        return min(int(value), chart_revision(conn, patient_id))
+    try:
+        when = datetime.strptime(value, '%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        try:
+            # A bare date means the end of that day
+            when = datetime.strptime(value, '%Y-%m-%d').replace(hour=23, minute=59, second=59)
+        except ValueError:
+            return None
+    return revision_as_of(conn, patient_id, when.strftime('%Y-%m-%d %H:%M:%S'))
+
+@app.route('/api/patient/<int:patient_id>/dental-chart', methods=['GET', 'POST', 'PATCH'])
 def api_dental_chart(patient_id):
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
+    conn = get_db()
     if request.method == 'GET':
-        cursor.execute("SELECT ToothNumber, SliceColors, Notes FROM DentalCharts WHERE PatientID = ?", (patient_id,))
-        chart = {}
-        for row in cursor.fetchall():
-            tooth = row[0]
-            try:
-                slice_colors = json.loads(row[1]) if row[1] else {}
-            except Exception:
-                slice_colors = {}
-            notes = row[2] or {}
-            if isinstance(notes, str):
-                try:
-                    notes = json.loads(notes)
-                except Exception:
-                    notes = {}
-            chart[tooth] = {'slice_colors': slice_colors, 'notes': notes}
-        conn.close()
-        return jsonify(chart)
+        etag, last_modified = validators((f'dental_chart:{patient_id}',), request.query_string)
+        if is_not_modified(etag, last_modified):
+            return not_modified(etag, last_modified)
+        if 'revision' in request.args or 'as_of' in request.args:
+            # A past state of the chart, read from the history
+            value = request.args.get('revision') or request.args.get('as_of')
+            if not value:
+                return jsonify({'success': False, 'error': 'Send revision=<number> or as_of=YYYY-MM-DD[ HH:MM:SS]'}), 400
+            revision = resolve_chart_revision(conn, patient_id, value)
+            chart = chart_at(conn, patient_id, revision) if revision is not None else None
+            if chart is None:
+                return jsonify({'success': False, 'error': 'No chart history for that revision or date'}), 404
+        else:
+            revision = chart_revision(conn, patient_id)
+            chart = load_chart(conn, patient_id)
+        response = jsonify(chart)
+        # Patches are made against this revision
+        response.headers['X-Chart-Revision'] = str(revision)
+        return set_validators(response, etag, last_modified)
+    
+    data = request.get_json(silent=True)
+    if data is None:
+        data = {}
+    if not isinstance(data, dict):
+        return jsonify({'success': False, 'error': 'Send the chart as a JSON object'}), 400
+    if not conn.execute("SELECT 1 FROM Patients WHERE ID = ?", (patient_id,)).fetchone():
+        return jsonify({'success': False, 'error': 'Patient not found'}), 404
+    if request.method == 'PATCH':
+        # Only the zones that changed, checked against the revision the client last saw
+        revision = data.get('revision')
+        changes = data.get('changes', {})
+        # bool is an int subclass, but true is not a revision
+        if not isinstance(revision, int) or isinstance(revision, bool) or not is_chart_patch(changes):
+            return jsonify({'success': False, 'error': 'Send a revision and changes as {tooth: {part: {zone: string or null}}}'}), 400
+        try:
+            revision, results = db.write(apply_chart_patch, patient_id, revision, changes)
+        except StaleChartRevision as stale:
+            return jsonify({'success': False, 'error': 'The chart was changed elsewhere. Reload and try again.',
+                            'revision': stale.revision}), 409
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
     else:  # POST
-        data = request.get_json()
         chart_data = data.get('chart', {})
-        for tooth, info in chart_data.items():
-            slice_colors = json.dumps(info.get('slice_colors', {}))
-            notes = json.dumps(info.get('notes', {}))
-            # Upsert logic: update if exists, else insert
-            cursor.execute("SELECT ID FROM DentalCharts WHERE PatientID = ? AND ToothNumber = ?", (patient_id, tooth))
-            row = cursor.fetchone()
-            if row:
-                cursor.execute("UPDATE DentalCharts SET SliceColors = ?, Notes = ? WHERE ID = ?", (slice_colors, notes, row[0]))
-            else:
-                cursor.execute("INSERT INTO DentalCharts (PatientID, ToothNumber, SliceColors, Notes) VALUES (?, ?, ?, ?)", (patient_id, tooth, slice_colors, notes))
-        conn.commit()
-        conn.close()
-        return jsonify({'success': True})
+        if not isinstance(chart_data, dict) or not all(isinstance(info, dict) for info in chart_data.values()):
+            return jsonify({'success': False, 'error': 'chart must map tooth numbers to objects'}), 400
+        # One packed surfaces row plus the notes of the teeth that actually changed
+        try:
+            revision, results = db.write(replace_chart, patient_id, chart_data)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+    
+    if any(result != 'unchanged' for result in results.values()):
+        data_versions.bump(f'dental_chart:{patient_id}')
+    return jsonify({'success': True, 'revision': revision, 'teeth': results})
+
+@app.route('/api/patient/<int:patient_id>/dental-chart/diff')
+def api_dental_chart_diff(patient_id):
+    """Zone-level differences between two points in a patient's chart history"""
+    etag, last_modified = validators((f'dental_chart:{patient_id}',), request.query_string)
+    if is_not_modified(etag, last_modified):
+        return not_modified(etag, last_modified)
+    
+    if not request.args.get('from'):
+        return jsonify({'success': False, 'error': 'Send from=<number> or from=YYYY-MM-DD[ HH:MM:SS]'}), 400
+    conn = get_db()
+    from_revision = resolve_chart_revision(conn, patient_id, request.args['from'])
+    to_revision = resolve_chart_revision(conn, patient_id, request.args.get('to') or str(chart_revision(conn, patient_id)))
+    before = chart_at(conn, patient_id, from_revision) if from_revision is not None else None
+    after = chart_at(conn, patient_id, to_revision) if to_revision is not None else None
+    if before is None or after is None:
+        return jsonify({'success': False, 'error': 'No chart history for that revision or date'}), 404
+    
+    response = jsonify({'from': from_revision, 'to': to_revision, 'changes': chart_diff(before, after)})
+    return set_validators(response, etag, last_modified)
 
 if __name__ == '__main__':
+    # Development server only; production serving goes through asgi.py
     app.run(debug=True)
@@ -0,0 +1,102 @@
+# Per-patient appointment summaries, kept current by triggers on Appointments
+# so the patient list and history pages never aggregate on the fly.
+
+# Recompute one patient's summary rows from their appointments (an index range)
+REFRESH_PATIENT = """
+    DELETE FROM PatientCareStats WHERE PatientID = {patient};
+    INSERT INTO PatientCareStats (PatientID, DentalCare, AppointmentCount, FirstDate, LastDate)
+    SELECT PatientID, DentalCare, COUNT(*), MIN(Date), MAX(Date)
+    FROM Appointments WHERE PatientID = {patient}
+    GROUP BY DentalCare;
+    DELETE FROM PatientAppointmentStats WHERE PatientID = {patient};
+    INSERT INTO PatientAppointmentStats (PatientID, AppointmentCount, FirstDate, LastDate, TreatmentCount)
+    SELECT PatientID, COUNT(*), MIN(Date), MAX(Date), COUNT(DISTINCT DentalCare)
+    FROM Appointments WHERE PatientID = {patient}
+    GROUP BY PatientID;
+"""
+
+SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS PatientAppointmentStats (
+        PatientID INTEGER PRIMARY KEY REFERENCES Patients (ID),
+        AppointmentCount INTEGER NOT NULL,
+        FirstDate TEXT,
+        LastDate TEXT,
+        TreatmentCount INTEGER NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS PatientCareStats (
+        PatientID INTEGER NOT NULL REFERENCES Patients (ID),
+        DentalCare TEXT NOT NULL,
+        AppointmentCount INTEGER NOT NULL,
+        FirstDate TEXT,
+        LastDate TEXT,
+        PRIMARY KEY (PatientID, DentalCare)
+    ) WITHOUT ROWID
+    """,
+    # New bookings are the hot path, so they are folded in without a recount
+    """
+    CREATE TRIGGER IF NOT EXISTS appointments_stats_insert
+    AFTER INSERT ON Appointments WHEN new.PatientID IS NOT NULL BEGIN
+        INSERT INTO PatientCareStats (PatientID, DentalCare, AppointmentCount, FirstDate, LastDate)
+        VALUES (new.PatientID, new.DentalCare, 1, new.Date, new.Date)
+        ON CONFLICT (PatientID, DentalCare) DO UPDATE SET
+            AppointmentCount = AppointmentCount + 1,
+            FirstDate = MIN(FirstDate, excluded.FirstDate),
+            LastDate = MAX(LastDate, excluded.LastDate);
+        INSERT INTO PatientAppointmentStats (PatientID, AppointmentCount, FirstDate, LastDate, TreatmentCount)
+        VALUES (new.PatientID, 1, new.Date, new.Date, 1)
+        ON CONFLICT (PatientID) DO UPDATE SET
+            AppointmentCount = AppointmentCount + 1,
+            FirstDate = MIN(FirstDate, excluded.FirstDate),
+            LastDate = MAX(LastDate, excluded.LastDate),
+            TreatmentCount = (SELECT COUNT(*) FROM PatientCareStats WHERE PatientID = excluded.PatientID);
+    END
+    """,
+    # Removing a row may move the first/last dates, so the patient is recounted
+    """
+    CREATE TRIGGER IF NOT EXISTS appointments_stats_delete
+    AFTER DELETE ON Appointments WHEN old.PatientID IS NOT NULL BEGIN
+    """ + REFRESH_PATIENT.format(patient="old.PatientID") + """
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS appointments_stats_update
+    AFTER UPDATE OF PatientID, Date, DentalCare ON Appointments BEGIN
+    """ + REFRESH_PATIENT.format(patient="old.PatientID")
+        + REFRESH_PATIENT.format(patient="new.PatientID") + """
+    END
+    """,
+)
+
+
+def ensure_appointment_stats(conn):
+    """Create the summary tables and triggers, filling them on first use"""
+    cursor = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'PatientAppointmentStats'")
+    is_new = cursor.fetchone() is None
+
+    for statement in SCHEMA:
+        conn.execute(statement)
+
+    if is_new:
+        rebuild_appointment_stats(conn)
+    return is_new
+
+
+def rebuild_appointment_stats(conn):
+    """Recompute every patient's summary from scratch"""
+    conn.execute("DELETE FROM PatientCareStats")
+    conn.execute("""
+        INSERT INTO PatientCareStats (PatientID, DentalCare, AppointmentCount, FirstDate, LastDate)
+        SELECT PatientID, DentalCare, COUNT(*), MIN(Date), MAX(Date)
+        FROM Appointments WHERE PatientID IS NOT NULL
+        GROUP BY PatientID, DentalCare
+    """)
+    conn.execute("DELETE FROM PatientAppointmentStats")
+    conn.execute("""
+        INSERT INTO PatientAppointmentStats (PatientID, AppointmentCount, FirstDate, LastDate, TreatmentCount)
+        SELECT PatientID, COUNT(*), MIN(Date), MAX(Date), COUNT(DISTINCT DentalCare)
+        FROM Appointments WHERE PatientID IS NOT NULL
+        GROUP BY PatientID
+    """)
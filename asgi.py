@@ -0,0 +1,157 @@
+# Production entry point: serves the Flask app over ASGI.
+#
+#     uvicorn asgi:application --host 0.0.0.0 --port 8000
+#
+# or `python asgi.py` (HOST and PORT come from the environment). This replaces
+# `python app.py`, which starts the Werkzeug debug server.
+#
+# Run a single process. The availability index and the data versions behind
+# the ETags live in process memory, so a second worker process would serve
+# data the first has already changed. Concurrency comes from the event loop,
+# which holds idle, slow and streaming connections without tying up a thread,
+# and from a bounded pool of worker threads that run the routes and their
+# SQLite calls. Requests beyond the pool wait on the loop rather than each
+# opening another database connection.
+import asyncio
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
+
+import db
+from app import app
+
+# Requests run at once, each holding one pooled connection; matching the
+# connection pool means every worker reuses a warm connection
+WORKER_THREADS = int(os.environ.get('DENTAL_WORKER_THREADS', db.POOL_SIZE))
+
+# Request bodies larger than this are buffered on disk instead of in memory
+REQUEST_BUFFER_BYTES = 1024 * 1024
+
+
+class WsgiBridge:
+    """Serve a WSGI app over ASGI, running each request on a bounded thread pool.
+
+    The body is read on the event loop, then the app runs on a worker thread.
+    Response chunks are handed back to the loop one at a time, and each hand-off
+    waits for the send to finish, so a slow client holds back a streaming
+    response instead of letting it pile up in memory.
+    """
+
+    def __init__(self, wsgi_app, threads=WORKER_THREADS):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='dental-worker')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                loop = asyncio.get_running_loop()
+                await loop.run_in_executor(None, self.executor.shutdown)
+                # Commit whatever is still queued before the process exits
+                await loop.run_in_executor(None, db.writer.close)
+                db.pool.close_all()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _http(self, scope, receive, send):
+        with SpooledTemporaryFile(max_size=REQUEST_BUFFER_BYTES) as body:
+            while True:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    return
+                body.write(message.get('body', b''))
+                if not message.get('more_body'):
+                    break
+            body.seek(0)
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self.executor, self._run_app, loop, scope, body, send)
+
+    def _run_app(self, loop, scope, body, send):
+        """Run one request on a worker thread, sending the response through the loop"""
+        def post(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        start = {}
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and start.get('sent'):
+                raise exc_info[1].with_traceback(exc_info[2])
+            start['message'] = {
+                'type': 'http.response.start',
+                'status': int(status.split(' ', 1)[0]),
+                'headers': [(name.lower().encode('latin1'), value.encode('latin1')) for name, value in headers],
+            }
+
+        result = self.wsgi_app(wsgi_environ(scope, body), start_response)
+        try:
+            for chunk in result:
+                if not chunk:
+                    continue
+                if not start.get('sent'):
+                    post(start['message'])
+                    start['sent'] = True
+                post({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            if not start.get('sent'):
+                post(start['message'])
+            post({'type': 'http.response.body', 'body': b''})
+        finally:
+            # Ends the request context, which hands the database connection back
+            if hasattr(result, 'close'):
+                result.close()
+
+
+def wsgi_environ(scope, body):
+    """The WSGI environ for an ASGI http scope"""
+    script_name = scope.get('root_path', '')
+    path = scope['path']
+    if script_name and path.startswith(script_name):
+        path = path[len(script_name):]
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': script_name.encode('utf8').decode('latin1'),
+        'PATH_INFO': path.encode('utf8').decode('latin1'),
+        'QUERY_STRING': scope['query_string'].decode('latin1'),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'SERVER_NAME': scope['server'][0] if scope.get('server') else 'localhost',
+        'SERVER_PORT': str(scope['server'][1]) if scope.get('server') else '80',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope['headers']:
+        name = name.decode('latin1')
+        value = value.decode('latin1')
+        if name == 'content-type':
+            key = 'CONTENT_TYPE'
+        elif name == 'content-length':
+            key = 'CONTENT_LENGTH'
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        if key in environ:
+            # Repeated headers are joined; cookies use their own separator
+            value = environ[key] + ('; ' if key == 'HTTP_COOKIE' else ',') + value
+        environ[key] = value
+    return environ
+
+
+application = WsgiBridge(app)
+
+if __name__ == '__main__':
+    import uvicorn
+
+    uvicorn.run(application, host=os.environ.get('HOST', '127.0.0.1'), port=int(os.environ.get('PORT', '8000')))
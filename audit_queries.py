@@ -0,0 +1,277 @@
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+
+import db
+from pagination import encode_cursor
+
+# The patient, appointment date and chair the audit requests create and use;
+# the patient is found by email, since one request renames it
+AUDIT_PATIENT = "Audit Patient"
+AUDIT_EMAIL = "audit@example.com"
+AUDIT_DATE = "2099-01-05"
+AUDIT_RESOURCE = "Audit Chair"
+
+AUDIT_FORM = {'name': AUDIT_PATIENT, 'contact': '555-0100', 'email': AUDIT_EMAIL}
+AUDIT_BOOKING = {'name': AUDIT_PATIENT, 'contact': '555-0100', 'date': AUDIT_DATE, 'time': '10:00',
+                 'dental_care': 'Checkup'}
+
+# Requests that between them reach every query app.py issues, sent in this
+# order: the first ones create the records the rest read, the last ones
+# delete them. {placeholders} are filled in from request_context().
+REQUESTS = [
+    ('POST', '/create-patient', {'data': AUDIT_FORM}),
+    ('POST', '/edit-patient/{patient_id}', {'data': {**AUDIT_FORM, 'address': '1 Audit Street',
+                                                     'allergic_latex': 'No'}}),
+    ('POST', '/edit-patient/{patient_id}', {'data': {**AUDIT_FORM, 'name': AUDIT_PATIENT + ' Renamed'}}),
+    ('POST', '/edit-patient/{patient_id}', {'data': AUDIT_FORM}),
+    ('POST', '/api/resources', {'json': {'name': AUDIT_RESOURCE, 'kind': 'chair'}}),
+    ('PATCH', '/api/resources/{resource_id}', {'json': {'active': True}}),
+    ('POST', '/add', {'data': AUDIT_BOOKING}),
+    ('POST', '/add', {'data': {**AUDIT_BOOKING, 'time': '11:00', 'resource_id': '{resource_id}',
+                               'duration': '60'}}),
+    ('POST', '/edit/{appointment_id}', {'data': {**AUDIT_BOOKING, 'time': '14:00'},
+                                        'headers': {'X-Requested-With': 'XMLHttpRequest'}}),
+    ('POST', '/edit/{appointment_id}', {'data': {**AUDIT_BOOKING, 'time': '15:00'}}),
+    ('POST', '/patient/{name}/treatment-records', {'data': {'date_of_treatment': AUDIT_DATE,
+                                                            'amount_charged': '10', 'amount_paid': '5'}}),
+    ('POST', '/api/patient/{patient_id}/dental-chart', {'json': {'chart': {
+        '11': {'slice_colors': {'top': '#f44336'}, 'notes': {'top': 'audit'}}}}}),
+    ('PATCH', '/api/patient/{patient_id}/dental-chart', {'json': {'revision': '{chart_revision}', 'changes': {
+        '11': {'notes': {'top': None}}}}}),
+    ('POST', '/api/import/patients?format=csv', {'data': "name,contact\nAudit Import,555-0101\n"}),
+    ('POST', '/api/import/appointments?format=csv', {'data': (
+        "name,contact,date,time,dental_care\n" f"{AUDIT_PATIENT},555-0100,{AUDIT_DATE},16:00,Checkup\n")}),
+    ('POST', '/api/import/treatment_records?format=csv', {'data': (
+        "patient_name,date_of_treatment\n" f"{AUDIT_PATIENT},{AUDIT_DATE}\n")}),
+    ('GET', '/', {}),
+    ('GET', '/create-patient', {}),
+    ('GET', '/edit-patient/{patient_id}', {}),
+    ('GET', '/patients', {}),
+    ('GET', '/patients?page=2&per_page=1', {}),
+    ('GET', '/patients?paging=cursor', {}),
+    ('GET', '/patients?after={patient_cursor}', {}),
+    ('GET', '/patients?before={patient_cursor}', {}),
+    ('GET', '/patients?search=audit', {}),
+    ('GET', '/patients?search=audit&paging=cursor', {}),
+    ('GET', '/api/patients/search?q=aud', {}),
+    ('GET', '/api/patients/search?q=adit', {}),
+    ('GET', '/patient/{name}', {}),
+    ('GET', '/calendar', {}),
+    ('GET', '/calendar?year=2099&month=1', {}),
+    ('GET', '/calendar?year=2099&month=1&resource={resource_id}', {}),
+    ('GET', '/appointments', {}),
+    ('GET', '/appointments?page=2&per_page=1', {}),
+    ('GET', f'/appointments?date={AUDIT_DATE}', {}),
+    ('GET', '/appointments?dental_care=Checkup', {}),
+    ('GET', '/appointments?paging=cursor', {}),
+    ('GET', '/appointments?after={appointment_cursor}', {}),
+    ('GET', f'/appointments?date={AUDIT_DATE}&after={{appointment_cursor}}', {}),
+    ('GET', '/edit/{appointment_id}', {}),
+    ('GET', '/api/appointments', {}),
+    ('GET', f'/api/appointments?date={AUDIT_DATE}', {}),
+    ('GET', f'/api/appointments?start={AUDIT_DATE}&end=2099-01-31&limit=2', {}),
+    ('GET', '/api/appointments?limit=2&after={appointment_cursor}', {}),
+    ('GET', '/api/appointments?format=ndjson&fields=id,date,starts_at', {}),
+    ('GET', '/api/appointment/{appointment_id}', {}),
+    ('GET', f'/api/available-times?date={AUDIT_DATE}', {}),
+    ('GET', f'/api/available-times?date={AUDIT_DATE}&resource={{resource_id}}&duration=60', {}),
+    ('GET', '/api/availability?month=2099-01', {}),
+    ('GET', f'/api/availability?start={AUDIT_DATE}&end=2099-01-09&resource={{resource_id}}', {}),
+    ('GET', f'/api/next-available-times?date={AUDIT_DATE}&count=3', {}),
+    ('GET', '/api/resources', {}),
+    ('GET', '/api/resources?all=1', {}),
+    ('GET', '/add', {}),
+    ('GET', '/patient/{name}/treatment-records', {}),
+    ('GET', '/patient/{name}/treatment-records?paging=cursor', {}),
+    ('GET', '/patient/{name}/treatment-records?after={record_cursor}', {}),
+    ('GET', '/patient/{name}/intraoral-exam', {}),
+    ('GET', '/api/patient/{patient_id}/dental-chart', {}),
+    ('GET', '/api/patient/{patient_id}/dental-chart?revision=1', {}),
+    ('GET', '/api/patient/{patient_id}/dental-chart?as_of=2099-01-01', {}),
+    ('GET', '/api/patient/{patient_id}/dental-chart/diff?from=1', {}),
+    ('GET', '/api/export/patients', {}),
+    ('GET', '/api/export/appointments?after=1', {}),
+    ('GET', '/api/export/treatment_records?format=ndjson', {}),
+    ('GET', '/api/export/dental_charts', {}),
+    ('GET', '/api/export/dental_charts?after=1', {}),
+    ('GET', '/delete/{appointment_id}', {}),
+    ('GET', '/delete-patient/{patient_id}', {}),
+]
+
+# Statements whose plans are checked; the rest are transaction control,
+# PRAGMAs and schema changes
+AUDITED_STATEMENTS = re.compile(r"^\s*(SELECT|WITH|INSERT|UPDATE|DELETE|REPLACE)\b", re.IGNORECASE)
+
+# A plan step that reads a whole table, or the whole of one of its indexes,
+# e.g. "SCAN Appointments" or "SCAN p USING COVERING INDEX ...". Walking an
+# index in ORDER BY order ("SCAN ... USING INDEX") stops at the LIMIT.
+FULL_SCAN = re.compile(r"^SCAN (\w+)(?: USING COVERING INDEX \w+)?$")
+
+# A subquery or CTE the plan runs on its own; scanning its result is not a table scan
+DERIVED = re.compile(r"^(?:CO-ROUTINE|MATERIALIZE) (\w+)")
+
+# Table names and their aliases in a statement, e.g. "FROM Patients p"
+TABLE_REFERENCE = re.compile(r"\b(?:FROM|JOIN|UPDATE|INTO)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?", re.IGNORECASE)
+
+# Literals, so statements that differ only in their values are checked once
+LITERAL = re.compile(r"(?:\b[xX])?'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+# Lookup tables with a handful of rows, read whole on purpose
+SMALL_TABLES = {"Resources"}
+
+# Statements (literals masked) that read a whole table on purpose, and why
+ACCEPTED_SCANS = {
+    "SELECT COUNT(*) FROM Patients":
+        "exact total for numbered pages; cursor paging counts through cached_count",
+    "SELECT COUNT(*) FROM Appointments WHERE ?=?":
+        "exact total for numbered pages; cursor paging counts through cached_count",
+    "SELECT COUNT(*) FROM Appointments WHERE DentalCare LIKE ?":
+        "a substring match cannot seek; it reads the DentalCare index rather than the table",
+    "SELECT DISTINCT DentalCare FROM Appointments ORDER BY DentalCare":
+        "the care filter's choices, read from the DentalCare index rather than the table",
+}
+
+
+def request_context(conn):
+    """Values for the {placeholders} in REQUESTS, read from the audited database"""
+    patient = conn.execute("SELECT ID FROM Patients WHERE Email = ?", (AUDIT_EMAIL,)).fetchone()
+    patient_id = patient[0] if patient else 0
+    appointment = conn.execute("""
+        SELECT ID, StartsAt FROM Appointments WHERE PatientID = ? ORDER BY ID DESC LIMIT 1
+    """, (patient_id,)).fetchone() or (0, 0)
+    record = conn.execute("SELECT MAX(ID) FROM TreatmentRecords WHERE PatientID = ?", (patient_id,)).fetchone()
+    resource = conn.execute("SELECT ID FROM Resources WHERE Name = ?", (AUDIT_RESOURCE,)).fetchone()
+    revision = conn.execute("SELECT Revision FROM DentalChartRevisions WHERE PatientID = ?", (patient_id,)).fetchone()
+    return {
+        'name': AUDIT_PATIENT,
+        'patient_id': patient_id,
+        'appointment_id': appointment[0],
+        'resource_id': resource[0] if resource else 0,
+        'chart_revision': revision[0] if revision else 0,
+        'patient_cursor': encode_cursor((AUDIT_PATIENT, patient_id)),
+        'appointment_cursor': encode_cursor(appointment),
+        'record_cursor': encode_cursor((AUDIT_DATE, record[0] or 0)),
+    }
+
+
+def fill(value, context):
+    """value with its {placeholders} filled in; a placeholder standing alone keeps its type"""
+    if isinstance(value, dict):
+        return {key: fill(item, context) for key, item in value.items()}
+    if isinstance(value, str):
+        match = re.fullmatch(r"\{(\w+)\}", value)
+        return context[match.group(1)] if match else value.format(**context)
+    return value
+
+
+def trace_requests(client, conn):
+    """{statement with its literals masked: (first request that ran it, statement as run)}"""
+    statements = {}
+    current = [None]
+
+    def trace(sql):
+        if AUDITED_STATEMENTS.match(sql):
+            statements.setdefault(LITERAL.sub("?", " ".join(sql.split())), (current[0], sql))
+
+    db.statement_trace = trace
+    # Connections opened before the hook was set would go unseen
+    db.pool.close_all()
+    db.writer.close()
+    try:
+        for method, url, options in REQUESTS:
+            context = request_context(conn)
+            options = fill(options, context)
+            url = fill(url, context)
+            if isinstance(options.get('data'), str):
+                options['content_type'] = 'text/csv'
+            current[0] = f"{method} {url}"
+            response = client.open(url, method=method, **options)
+            if response.status_code >= 400:
+                print(f"! {method} {url} answered {response.status_code}")
+            response.close()
+            conn.rollback()
+    finally:
+        db.statement_trace = None
+        db.writer.close()
+        db.pool.close_all()
+    return statements
+
+
+def explain(conn, sql):
+    """Return the EXPLAIN QUERY PLAN details for a statement"""
+    return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+
+
+def table_scans(plan, sql, tables):
+    """The steps of plan that read a whole table, other than the small ones"""
+    aliases = {alias: table for table, alias in TABLE_REFERENCE.findall(sql) if alias}
+    derived = {match.group(1) for match in map(DERIVED.match, plan) if match}
+    scans = []
+    for step in plan:
+        match = FULL_SCAN.match(step)
+        if not match or match.group(1) in derived:
+            continue
+        table = aliases.get(match.group(1), match.group(1))
+        if table in tables and table not in SMALL_TABLES:
+            scans.append(step)
+    return scans
+
+
+def audit_queries(db_file=None):
+    """Check that no query the app issues falls back to a full table scan.
+
+    The app is run against a copy of the database, so the migrations it
+    applies on startup and the records the requests add never touch the
+    real one. Every statement the requests run is traced and explained.
+    """
+    db_file = os.path.abspath(db_file or db.DB_FILE)
+
+    if not os.path.exists(db_file):
+        print("Database file not found.")
+        return False
+
+    workdir = tempfile.mkdtemp(prefix="audit_queries_")
+    cwd = os.getcwd()
+    try:
+        source = sqlite3.connect(db_file)
+        copy = sqlite3.connect(os.path.join(workdir, db.DB_FILE))
+        source.backup(copy)
+        source.close()
+        copy.close()
+
+        # db.DB_FILE is relative, so the app opens the copy
+        os.chdir(workdir)
+        import app
+
+        conn = sqlite3.connect(db.DB_FILE)
+        statements = trace_requests(app.app.test_client(), conn)
+        tables = {name for name, in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+        failures = 0
+        for statement, (origin, sql) in statements.items():
+            plan = explain(conn, sql)
+            scans = table_scans(plan, sql, tables)
+            accepted = ACCEPTED_SCANS.get(statement) if scans else None
+            status = "✗" if scans and not accepted else "✓"
+            print(f"{status} {origin}: {statement}")
+            for step in plan:
+                print(f"    {step}")
+            if accepted:
+                print(f"    (accepted: {accepted})")
+            failures += status == "✗"
+        conn.close()
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print("-" * 50)
+    print(f"{len(statements) - failures} of {len(statements)} queries use an index")
+    return failures == 0
+
+
+if __name__ == "__main__":
+    sys.exit(0 if audit_queries(*sys.argv[1:2]) else 1)
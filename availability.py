@@ -0,0 +1,212 @@
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+from functools import lru_cache
+
+from schedule import SLOT_MINUTES, SLOT_TIMES, to_minutes
+
+# Start minute of each slot, and the bitmap with every slot set
+SLOT_STARTS = tuple(to_minutes(time) for time in SLOT_TIMES)
+ALL_SLOTS = (1 << len(SLOT_TIMES)) - 1
+
+# Most days kept in memory at once (about ten years of calendar)
+MAX_CACHED_DAYS = 4000
+
+# Days loaded per query when scanning forward for free slots
+SCAN_CHUNK_DAYS = 31
+
+
+@lru_cache(maxsize=4096)
+def span_bits(time, minutes):
+    """Bitmap of the slots an appointment at time for minutes overlaps"""
+    start = to_minutes(time)
+    end = start + minutes
+    mask = 0
+    for i, slot_start in enumerate(SLOT_STARTS):
+        if slot_start < end and slot_start + SLOT_MINUTES > start:
+            mask |= 1 << i
+    return mask
+
+
+@lru_cache(maxsize=4096)
+def _free_starts(booked_mask, slots):
+    """Bitmap of the slots that begin a run of `slots` unbooked slots before closing"""
+    clear = ALL_SLOTS & ~booked_mask
+    starts = clear
+    for offset in range(1, slots):
+        starts &= clear >> offset
+    return starts
+
+
+@lru_cache(maxsize=4096)
+def _times(mask):
+    """The slot times set in a bitmap"""
+    return tuple(time for i, time in enumerate(SLOT_TIMES) if mask >> i & 1)
+
+
+class DaySlots:
+    """Bookings for one date: a bitmap over SLOT_TIMES per resource.
+
+    An appointment sets every slot its duration overlaps, so a start time
+    is open for a booking of n slots when n clear slots follow it.
+    """
+
+    __slots__ = ('masks', 'appointment_ids')
+
+    def __init__(self):
+        self.masks = {}             # resource ID -> booked-slot bitmap
+        self.appointment_ids = []
+
+    def add(self, appointment_id, time, minutes, resource_id):
+        self.masks[resource_id] = self.masks.get(resource_id, 0) | span_bits(time, minutes)
+        self.appointment_ids.append(appointment_id)
+
+    def busy_mask(self, resources):
+        """Bitmap of the slots at which every one of resources is booked"""
+        mask = ALL_SLOTS
+        for resource_id in resources:
+            mask &= self.masks.get(resource_id, 0)
+        return mask
+
+    def free_times(self, resources, minutes=SLOT_MINUTES):
+        """Start times at which at least one of resources is free for minutes"""
+        slots = -(-minutes // SLOT_MINUTES)
+        starts = 0
+        for resource_id in resources:
+            starts |= _free_starts(self.masks.get(resource_id, 0), slots)
+        return _times(starts)
+
+    def booked_times(self, resources):
+        """Slot times at which every one of resources is booked"""
+        return list(_times(self.busy_mask(resources)))
+
+
+class AvailabilityIndex:
+    """In-memory per-date, per-resource slot bitmaps built from Appointments.
+
+    Days are loaded on demand with one range query covering every resource
+    and kept until a write path invalidates them, so repeated availability
+    lookups are answered without touching SQLite. Lookups take the resource
+    IDs to consider: one resource for its own grid, or every active one for
+    the clinic as a whole, where a time is open while any of them is free.
+    """
+
+    def __init__(self, max_days=MAX_CACHED_DAYS):
+        self.max_days = max_days
+        self._days = OrderedDict()      # 'YYYY-MM-DD' -> DaySlots
+        self._appointment_days = {}     # appointment ID -> cached date holding it
+        self._lock = threading.Lock()
+        self._generation = 0
+
+    def _days_between(self, conn, first_date, last_date):
+        """[(date, DaySlots)] for an inclusive date range, loading missing days in one query"""
+        dates = date_range(first_date, last_date)
+        with self._lock:
+            found = {d: self._days[d] for d in dates if d in self._days}
+            generation = self._generation
+        missing = [d for d in dates if d not in found]
+
+        if missing:
+            loaded = {d: DaySlots() for d in missing}
+            cursor = conn.execute("""
+                SELECT Date, Time, Duration, ID, ResourceID FROM Appointments
+                WHERE Date >= ? AND Date <= ?
+            """, (missing[0], missing[-1]))
+            for app_date, time, minutes, appointment_id, resource_id in cursor:
+                if app_date in loaded:
+                    loaded[app_date].add(appointment_id, time, minutes, resource_id)
+            found.update(loaded)
+
+            with self._lock:
+                # If a write landed while we were reading, use the rows but don't cache them
+                if generation == self._generation:
+                    for d, slots in loaded.items():
+                        self._store(d, slots)
+                    while len(self._days) > self.max_days:
+                        self._drop(next(iter(self._days)))
+
+        return [(d, found[d]) for d in dates]
+
+    def _store(self, day, slots):
+        self._days[day] = slots
+        for appointment_id in slots.appointment_ids:
+            self._appointment_days[appointment_id] = day
+
+    def _drop(self, day):
+        slots = self._days.pop(day, None)
+        if slots is not None:
+            for appointment_id in slots.appointment_ids:
+                self._appointment_days.pop(appointment_id, None)
+
+    def _day(self, conn, day):
+        with self._lock:
+            slots = self._days.get(day)
+            if slots is not None:
+                self._days.move_to_end(day)
+                return slots
+        return self._days_between(conn, day, day)[0][1]
+
+    def booked_times(self, conn, day, resources):
+        """Sorted slot times on a date at which all of resources are booked"""
+        return self._day(conn, day).booked_times(resources)
+
+    def free_slots(self, conn, day, resources, minutes=SLOT_MINUTES):
+        """Start times on a date at which any of resources is open for minutes"""
+        return list(self._day(conn, day).free_times(resources, minutes))
+
+    def slots_range(self, conn, first_date, last_date, resources, minutes=SLOT_MINUTES):
+        """[(date, booked times, open start times)] for every date in an inclusive range"""
+        return [(d, slots.booked_times(resources), list(slots.free_times(resources, minutes)))
+                for d, slots in self._days_between(conn, first_date, last_date)]
+
+    def next_free_slots(self, conn, after_date, resources, after_time='', count=1, max_days=366,
+                        minutes=SLOT_MINUTES):
+        """The first count (date, time) open starts for minutes strictly after after_date/after_time"""
+        found = []
+        start = date.fromisoformat(after_date)
+        end = start + timedelta(days=max_days)
+        while start <= end and len(found) < count:
+            chunk_end = min(start + timedelta(days=SCAN_CHUNK_DAYS - 1), end)
+            for d, slots in self._days_between(conn, start.isoformat(), chunk_end.isoformat()):
+                for time in slots.free_times(resources, minutes):
+                    if d == after_date and time <= after_time:
+                        continue
+                    found.append((d, time))
+                    if len(found) == count:
+                        return found
+            start = chunk_end + timedelta(days=1)
+        return found
+
+    def invalidate(self, day=None):
+        """Forget one date's bookings, or every date when day is None"""
+        with self._lock:
+            self._generation += 1
+            if day is None:
+                self._days.clear()
+                self._appointment_days.clear()
+            else:
+                self._drop(day)
+
+    def forget_appointment(self, appointment_id):
+        """Forget whichever cached date currently holds an appointment"""
+        with self._lock:
+            self._generation += 1
+            day = self._appointment_days.get(appointment_id)
+            if day is not None:
+                self._drop(day)
+
+
+def date_range(first_date, last_date):
+    """ISO date strings from first_date to last_date inclusive"""
+    if first_date == last_date:
+        return [first_date]
+    current = date.fromisoformat(first_date)
+    last = date.fromisoformat(last_date)
+    dates = []
+    while current <= last:
+        dates.append(current.isoformat())
+        current += timedelta(days=1)
+    return dates
+
+
+availability_index = AvailabilityIndex()
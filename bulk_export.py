@@ -0,0 +1,175 @@
+# Bulk export of patients, appointments, treatment records and dental charts
+# to CSV or NDJSON, for reporting jobs and backups:
+#
+#     python bulk_export.py patients -o patients.csv
+#     python bulk_export.py appointments --after 1200 --format ndjson
+#
+# or GET /api/export/<kind>. Columns use the form field names, so an export
+# can be fed back through bulk_import.py.
+#
+# Rows are read in key order, EXPORT_BATCH_ROWS at a time, each batch its own
+# short query that seeks past the last key. Memory stays flat however large
+# the table is, and no read stays open long enough to hold back the writer's
+# WAL checkpoints. An export stops at the newest row that existed when it
+# began and reports that as its watermark; passing the watermark back as
+# --after (or after=) exports only what was added since.
+import argparse
+import csv
+import io
+import json
+import sys
+
+import db
+from dental_charts import build_chart
+from patient_fields import PATIENT_COLUMNS, RECORD_FIELDS, RECORD_SOURCE
+from streaming import ndjson_chunks
+
+# Rows read per query
+EXPORT_BATCH_ROWS = 500
+
+EXPORT_FORMATS = ('csv', 'ndjson')
+
+
+def chart_row(row):
+    """A dental chart export row: the packed chart and the per-tooth exam rows, as JSON"""
+    patient_id, revision, saved_at, surfaces, notes, teeth = row
+    chart = build_chart(surfaces, json.loads(notes)) if revision is not None else {}
+    return patient_id, revision, saved_at, json.dumps(chart), teeth
+
+
+# kind -> what to export. `rows` pages through the table with :key (the last
+# key exported), :upper (the watermark when the export began), :since (the
+# watermark passed in) and :limit. Patients, appointments and treatment
+# records are keyed and watermarked by ID; dental charts are keyed by patient
+# and watermarked by the DentalChartLog.Seq of their last save. `row` turns a
+# fetched row into the exported one.
+EXPORTS = {
+    'patients': {
+        'fields': ('id',) + tuple(field for field, _ in PATIENT_COLUMNS) + ('created_date',),
+        'upper': "SELECT MAX(ID) FROM Patients",
+        'rows': f"""
+            SELECT p.ID, {RECORD_FIELDS}, p.CreatedDate
+            FROM {RECORD_SOURCE} WHERE p.ID > :key AND p.ID <= :upper ORDER BY p.ID LIMIT :limit
+        """,
+    },
+    'appointments': {
+        'fields': ('id', 'name', 'contact', 'date', 'time', 'dental_care', 'patient_id', 'resource_id',
+                   'duration'),
+        'upper': "SELECT MAX(ID) FROM Appointments",
+        'rows': """
+            SELECT ID, PatientName, Contact, Date, Time, DentalCare, PatientID, ResourceID, Duration
+            FROM Appointments WHERE ID > :key AND ID <= :upper ORDER BY ID LIMIT :limit
+        """,
+    },
+    'treatment_records': {
+        'fields': ('id', 'patient_id', 'patient_name', 'date_of_treatment', 'tooth_number', 'procedure',
+                   'dentist_name', 'amount_charged', 'amount_paid', 'balance'),
+        'upper': "SELECT MAX(ID) FROM TreatmentRecords",
+        'rows': """
+            SELECT t.ID, t.PatientID, p.Name, t.DateOfTreatment, t.ToothNumber, t.Procedure, t.DentistName,
+                   t.AmountCharged, t.AmountPaid, t.Balance
+            FROM TreatmentRecords t
+            LEFT JOIN Patients p ON p.ID = t.PatientID
+            WHERE t.ID > :key AND t.ID <= :upper ORDER BY t.ID LIMIT :limit
+        """,
+    },
+    'dental_charts': {
+        'fields': ('patient_id', 'revision', 'saved_at', 'chart', 'teeth'),
+        'upper': "SELECT MAX(Seq) FROM DentalChartLog",
+        'since': True,
+        # The notes and legacy exam rows of each chart come back as JSON
+        # arrays, so a page of charts is a single query
+        'rows': """
+            SELECT p.ID, r.Revision, l.SavedAt, s.Surfaces,
+                   (SELECT json_group_array(json_array(n.ToothNumber, n.Zone, n.Note))
+                    FROM DentalChartNotes n WHERE n.PatientID = p.ID),
+                   (SELECT json_group_array(json_object('tooth_number', d.ToothNumber, 'condition', d.Condition,
+                                                        'treatment', d.Treatment, 'notes', d.Notes,
+                                                        'exam_date', d.ExamDate))
+                    FROM (SELECT * FROM DentalCharts WHERE PatientID = p.ID ORDER BY ToothNumber ASC) d)
+            FROM Patients p
+            LEFT JOIN DentalChartRevisions r ON r.PatientID = p.ID
+            LEFT JOIN DentalChartLog l ON l.PatientID = r.PatientID AND l.Revision = r.Revision
+            LEFT JOIN DentalChartSurfaces s ON s.PatientID = p.ID
+            WHERE p.ID > :key
+              AND (r.PatientID IS NOT NULL OR EXISTS (SELECT 1 FROM DentalCharts d WHERE d.PatientID = p.ID))
+              AND (:since IS NULL OR l.Seq > :since)
+              AND (l.Seq IS NULL OR l.Seq <= :upper)
+            ORDER BY p.ID LIMIT :limit
+        """,
+        'row': chart_row,
+    },
+}
+
+
+def export_rows(conn, kind, after=None, batch=EXPORT_BATCH_ROWS):
+    """(field names, watermark, iterator of row tuples) for one kind of record.
+
+    after is the watermark of an earlier export; only rows added (or charts
+    saved) since then are included. The returned watermark is the one to
+    pass next time.
+    """
+    spec = EXPORTS[kind]
+    upper = conn.execute(spec['upper']).fetchone()[0]
+    since = spec.get('since')
+    if after is not None:
+        after = int(after)
+    watermark = upper if upper is not None else after
+
+    def rows():
+        if upper is None and not since:
+            return
+        params = {'key': 0 if since else (after or 0), 'since': after if since else None,
+                  'upper': upper, 'limit': batch}
+        while True:
+            page = conn.execute(spec['rows'], params).fetchall()
+            for row in page:
+                yield spec['row'](row) if 'row' in spec else row
+            if len(page) < batch:
+                return
+            params['key'] = page[-1][0]
+
+    return spec['fields'], watermark, rows()
+
+
+def csv_chunks(fields, rows, batch=EXPORT_BATCH_ROWS):
+    """Encode rows as CSV with a header line, yielded in pieces of about batch rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for count, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if count % batch == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def export_chunks(fields, rows, fmt, dumps=json.dumps):
+    """Text chunks of an export in fmt"""
+    if fmt == 'csv':
+        return csv_chunks(fields, rows)
+    return ndjson_chunks((dict(zip(fields, row)) for row in rows), dumps)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export records to CSV or NDJSON.")
+    parser.add_argument('kind', choices=EXPORTS)
+    parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv')
+    parser.add_argument('--after', type=int, help="watermark printed by an earlier export")
+    parser.add_argument('-o', '--output', help="file to write (default: standard output)")
+    args = parser.parse_args()
+
+    conn = db.connect_reader()
+    fields, watermark, rows = export_rows(conn, args.kind, args.after)
+    out = open(args.output, 'w', newline='', encoding='utf-8') if args.output else sys.stdout
+    try:
+        for chunk in export_chunks(fields, rows, args.format):
+            out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
+        conn.close()
+    # On stderr so it stays out of an export written to standard output
+    print(f"Watermark: {watermark}", file=sys.stderr)
@@ -0,0 +1,267 @@
+# Bulk import of patients, appointments and treatment records from CSV or
+# NDJSON, for moving a clinic's existing records in:
+#
+#     python bulk_import.py patients patients.csv
+#     python bulk_import.py appointments appointments.ndjson
+#
+# or POST the file to /api/import/<kind>. Columns (or JSON keys) use the
+# form field names, e.g. name, contact, date_of_birth. Rows are read one at
+# a time and checked with the same rules as the forms; every
+# IMPORT_BATCH_ROWS valid rows are written by one writer job, so a large
+# file costs a few hundred transactions rather than one per row. Rows that
+# fail are reported and skipped, never ending the import.
+#
+# Run the command while the app is stopped, or use the endpoint: the
+# running app only learns about rows that came through it.
+import csv
+import io
+import json
+import os
+import sys
+import time
+from datetime import date
+
+import db
+from patient_fields import missing_fields, insert_row, insert_patient_rows
+from resources import free_resource, list_resources
+from schedule import appointment_minutes, clinic_hours_error, normalize_time, overlapping_appointment
+
+# Valid rows written per writer job
+IMPORT_BATCH_ROWS = 500
+
+# Rejected rows listed in a summary; the rest are only counted
+MAX_REPORTED_REJECTS = 100
+
+IMPORT_FORMATS = ('csv', 'ndjson')
+
+def read_records(stream, fmt):
+    """Yield (line number, {field: text}) from a binary stream, one record at a time.
+
+    Unparseable NDJSON lines come through as (line number, error message).
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        for record in reader:
+            yield reader.line_num, {key.strip(): clean(value) for key, value in record.items() if key}
+        return
+    for line_number, line in enumerate(text, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_number, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(record, dict):
+            yield line_number, "Each line must be a JSON object."
+            continue
+        yield line_number, {key: clean(value) for key, value in record.items()}
+
+
+def clean(value):
+    """A field value as stripped text, with missing values as ''"""
+    return '' if value is None else str(value).strip()
+
+
+def parse_patient(record):
+    """(row, error message) for a patient record"""
+    if missing_fields(record):
+        return None, "Name and Contact are required fields."
+    return insert_row(record), None
+
+
+def parse_appointment(record):
+    """(row, error message) for an appointment record.
+
+    Past dates are accepted, since imports are mostly history; the other
+    checks are the booking form's.
+    """
+    fields = [record.get(field, '') for field in ('name', 'contact', 'date', 'time', 'dental_care')]
+    if not all(fields):
+        return None, "Name, Contact, Date, Time and Dental Care are required fields."
+    name, contact, appointment_date, appointment_time, dental_care = fields
+    try:
+        date.fromisoformat(appointment_date)
+    except ValueError:
+        return None, "Invalid date format. Please use YYYY-MM-DD format."
+    minutes, error_message = appointment_minutes(record.get('duration', ''), dental_care)
+    error_message = error_message or clinic_hours_error(appointment_time, minutes)
+    if error_message:
+        return None, error_message
+    appointment_time = normalize_time(appointment_time)
+    resource_id = record.get('resource_id', '')
+    if resource_id and not resource_id.isdigit():
+        return None, "Please choose an active chair or dentist."
+    return (name, contact, appointment_date, appointment_time, dental_care,
+            int(resource_id) if resource_id else None, minutes), None
+
+
+def parse_treatment_record(record):
+    """(row, error message) for a treatment record, keyed to its patient by patient_name"""
+    patient_name = record.get('patient_name', '')
+    date_of_treatment = record.get('date_of_treatment', '')
+    if not patient_name:
+        return None, "Patient name is required."
+    if not date_of_treatment:
+        return None, "Date of treatment is required."
+    try:
+        amount_charged = float(record.get('amount_charged') or 0)
+        amount_paid = float(record.get('amount_paid') or 0)
+    except ValueError:
+        return None, "Amounts must be numbers."
+    return (patient_name, date_of_treatment, record.get('tooth_number', ''), record.get('procedure', ''),
+            record.get('dentist_name', ''), amount_charged, amount_paid, amount_charged - amount_paid), None
+
+
+def insert_patients(conn, batch):
+    """Insert [(line, row)] patients; returns ([(line, error)], set of patient IDs)"""
+    names = [row[0] for _, row in batch]
+    placeholders = ', '.join('?' * len(names))
+    taken = {name for name, in conn.execute(f"SELECT Name FROM Patients WHERE Name IN ({placeholders})", names)}
+
+    rejects, rows = [], []
+    for line, row in batch:
+        if row[0] in taken:
+            rejects.append((line, "A patient with this name already exists."))
+        else:
+            taken.add(row[0])
+            rows.append(row)
+
+    insert_patient_rows(conn, rows)
+    # Link any appointments booked under these names before the patients existed
+    conn.executemany("""
+        UPDATE Appointments SET PatientID = (SELECT ID FROM Patients WHERE Name = ?)
+        WHERE PatientID IS NULL AND PatientName = ?
+    """, [(row[0], row[0]) for row in rows])
+    return rejects, set()
+
+
+def insert_appointments(conn, batch):
+    """Book [(line, row)] appointments; returns ([(line, error)], set of patient IDs).
+
+    Each booking is checked against those before it, including earlier rows
+    of the batch, so these are inserted one statement at a time.
+    """
+    active = {row[0] for row in list_resources(conn)}
+    names = sorted({row[0] for _, row in batch})
+    placeholders = ', '.join('?' * len(names))
+    patient_ids = dict(conn.execute(f"SELECT Name, ID FROM Patients WHERE Name IN ({placeholders})", names))
+    rejects, booked = [], set()
+    for line, (name, contact, appointment_date, appointment_time, dental_care, resource_id, minutes) in batch:
+        if resource_id is None:
+            resource_id = free_resource(conn, appointment_date, appointment_time, minutes)
+        elif resource_id not in active:
+            rejects.append((line, "Please choose an active chair or dentist."))
+            continue
+        elif overlapping_appointment(conn, appointment_date, appointment_time, minutes, resource_id) is not None:
+            resource_id = None
+        if resource_id is None:
+            rejects.append((line, f"A {minutes}-minute appointment on {appointment_date} at {appointment_time} "
+                                  f"overlaps one already scheduled."))
+            continue
+        conn.execute("""
+            INSERT INTO Appointments (PatientName, Contact, Date, Time, DentalCare, PatientID, ResourceID, Duration)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (name, contact, appointment_date, appointment_time, dental_care, patient_ids.get(name), resource_id, minutes))
+        if name in patient_ids:
+            booked.add(patient_ids[name])
+    return rejects, booked
+
+
+def insert_treatment_records(conn, batch):
+    """Insert [(line, row)] treatment records; returns ([(line, error)], set of patient IDs)"""
+    names = sorted({row[0] for _, row in batch})
+    placeholders = ', '.join('?' * len(names))
+    patient_ids = dict(conn.execute(f"SELECT Name, ID FROM Patients WHERE Name IN ({placeholders})", names))
+
+    rejects, rows = [], []
+    for line, (patient_name, *values) in batch:
+        if patient_name in patient_ids:
+            rows.append((patient_ids[patient_name], *values))
+        else:
+            rejects.append((line, f"No patient named {patient_name}."))
+    conn.executemany("""
+        INSERT INTO TreatmentRecords
+        (PatientID, DateOfTreatment, ToothNumber, Procedure, DentistName, AmountCharged, AmountPaid, Balance)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, rows)
+    return rejects, {row[0] for row in rows}
+
+
+# kind -> (record check, batch writer)
+IMPORTERS = {
+    'patients': (parse_patient, insert_patients),
+    'appointments': (parse_appointment, insert_appointments),
+    'treatment_records': (parse_treatment_record, insert_treatment_records),
+}
+
+
+def import_records(kind, stream, fmt, batch_rows=IMPORT_BATCH_ROWS):
+    """Import a CSV or NDJSON stream of one kind of record; returns a summary dict.
+
+    The summary counts rows read, imported and rejected, lists the first
+    rejects with their line numbers, gives the rate in rows per second and
+    the IDs of patients whose appointments or treatment records changed.
+    """
+    parse, insert = IMPORTERS[kind]
+    started = time.perf_counter()
+    summary = {'kind': kind, 'read': 0, 'imported': 0, 'rejected': 0, 'rejects': []}
+    patient_ids = set()
+
+    def reject(line, error):
+        summary['rejected'] += 1
+        if len(summary['rejects']) < MAX_REPORTED_REJECTS:
+            summary['rejects'].append({'line': line, 'error': error})
+
+    def flush(batch):
+        rejects, touched = db.write(insert, batch)
+        for line, error in rejects:
+            reject(line, error)
+        summary['imported'] += len(batch) - len(rejects)
+        patient_ids.update(touched)
+
+    batch = []
+    for line, record in read_records(stream, fmt):
+        summary['read'] += 1
+        row, error = (None, record) if isinstance(record, str) else parse(record)
+        if error:
+            reject(line, error)
+            continue
+        batch.append((line, row))
+        if len(batch) >= batch_rows:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+
+    summary['rejects'].sort(key=lambda reject: reject['line'])
+    elapsed = time.perf_counter() - started
+    summary['seconds'] = round(elapsed, 3)
+    summary['rows_per_second'] = round(summary['read'] / elapsed) if elapsed else summary['read']
+    summary['patient_ids'] = sorted(patient_ids)
+    return summary
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[1] not in IMPORTERS:
+        print(f"Usage: python bulk_import.py {{{'|'.join(IMPORTERS)}}} FILE.csv|FILE.ndjson")
+        sys.exit(2)
+    kind, path = sys.argv[1:]
+
+    if not os.path.exists(db.DB_FILE):
+        print("Database file not found.")
+        sys.exit(1)
+
+    fmt = 'csv' if path.lower().endswith('.csv') else 'ndjson'
+    with open(path, 'rb') as stream:
+        summary = import_records(kind, stream, fmt)
+    # Commit whatever the writer still holds before exiting
+    db.writer.close()
+
+    for reject in summary['rejects']:
+        print(f"Line {reject['line']}: {reject['error']}")
+    if summary['rejected'] > len(summary['rejects']):
+        print(f"... and {summary['rejected'] - len(summary['rejects'])} more rejected rows")
+    print(f"Imported {summary['imported']} of {summary['read']} {kind} in {summary['seconds']}s "
+          f"({summary['rows_per_second']} rows/s).")
@@ -0,0 +1,59 @@
+# Packed storage for dental chart surface colours.
+#
+# A patient's whole chart is one fixed-size blob: a 4-bit colour code for
+# every zone of every tooth, in TEETH x ZONES order, two codes per byte.
+
+# Universal numbering: permanent teeth 1-32, then primary teeth A-T
+TEETH = tuple(str(number) for number in range(1, 33)) + tuple(chr(code) for code in range(ord('A'), ord('T') + 1))
+ZONES = ('top', 'right', 'bottom', 'left', 'center')
+
+# Colour for each code. Code 0 means the zone is unset. Only ever append,
+# since stored charts refer to colours by position.
+COLORS = (None, '', 'red', 'blue', '#fff', '#f44336', '#2196f3')
+
+SURFACES_SIZE = (len(TEETH) * len(ZONES) + 1) // 2
+
+_TOOTH_INDEX = {tooth: i for i, tooth in enumerate(TEETH)}
+_ZONE_INDEX = {zone: i for i, zone in enumerate(ZONES)}
+_COLOR_CODE = {color: code for code, color in enumerate(COLORS) if color is not None}
+
+
+def encode_surfaces(colors):
+    """Pack {tooth: {zone: colour}} into a SURFACES_SIZE blob.
+
+    Raises ValueError for a tooth, zone or colour the format has no code for.
+    """
+    codes = bytearray(len(TEETH) * len(ZONES))
+    for tooth, zones in colors.items():
+        if tooth not in _TOOTH_INDEX:
+            raise ValueError(f"Unknown tooth {tooth!r}")
+        base = _TOOTH_INDEX[tooth] * len(ZONES)
+        for zone, color in zones.items():
+            if zone not in _ZONE_INDEX:
+                raise ValueError(f"Unknown tooth zone {zone!r}")
+            if color not in _COLOR_CODE:
+                raise ValueError(f"Unsupported chart colour {color!r}")
+            codes[base + _ZONE_INDEX[zone]] = _COLOR_CODE[color]
+
+    packed = bytearray(SURFACES_SIZE)
+    for i, code in enumerate(codes):
+        packed[i >> 1] |= code << (4 * (i & 1))
+    return bytes(packed)
+
+
+def decode_surfaces(blob):
+    """Unpack a surfaces blob into {tooth: {zone: colour}} for the teeth that have any"""
+    colors = {}
+    if not blob:
+        return colors
+    zone_count = len(ZONES)
+    for byte_index, byte in enumerate(blob):
+        if not byte:
+            continue
+        for half in (0, 1):
+            code = (byte >> (4 * half)) & 0x0F
+            if code:
+                i = byte_index * 2 + half
+                tooth = TEETH[i // zone_count]
+                colors.setdefault(tooth, {})[ZONES[i % zone_count]] = COLORS[code]
+    return colors
@@ -1,6 +1,8 @@
 import sqlite3
 import os
 
+from patient_fields import TABLE_COLUMNS
+
 def check_database():
     """Check the database structure and verify all patient fields are present"""
     DB_FILE = "dental.db"
@@ -12,45 +14,32 @@ def check_database():
     conn = sqlite3.connect(DB_FILE)
     cursor = conn.cursor()
     
-    # Check Patients table structure
-    cursor.execute("PRAGMA table_info(Patients)")
-    columns = cursor.fetchall()
-    
-    print("Patients table columns:")
-    print("-" * 50)
-    for column in columns:
-        print(f"{column[1]} ({column[2]})")
-    
-    # Check if all required columns exist
-    required_columns = [
-        'ID', 'Name', 'Contact', 'Email', 'DateOfBirth', 'Address', 
-        'EmergencyContact', 'MedicalHistory', 'Religion', 'HomeAddress', 
-        'Occupation', 'DentalInsurance', 'EffectiveDate', 'ParentGuardianName', 
-        'ParentGuardianOccupation', 'ReferralSource', 'ConsultationReason', 
-        'DentalHistory', 'PreviousDentist', 'LastDentalVisit', 'Sex', 'Nickname', 
-        'Age', 'Nationality', 'GoodHealth', 'MedicalTreatment', 'TreatmentCondition',
-        'SeriousIllness', 'SurgicalOperation', 'Hospitalized', 'HospitalizationDetails',
-        'PrescriptionMedication', 'NonPrescriptionMedication', 'TobaccoUse', 'AlcoholDrugUse',
-        'AllergicLocalAnesthetic', 'AllergicPenicillin', 'AllergicAntibiotics', 'AllergicSulfaDrugs',
-        'AllergicAspirin', 'AllergicLatex', 'AllergicOthers', 'BleedingTime', 'Pregnant',
-        'Nursing', 'BirthPills', 'BloodType', 'BloodPressure', 'CreatedDate'
-    ]
-    
-    existing_columns = [column[1] for column in columns]
-    
-    print("\nColumn verification:")
-    print("-" * 50)
-    for required_col in required_columns:
-        if required_col in existing_columns:
-            print(f"✓ {required_col}")
-        else:
-            print(f"✗ {required_col} - MISSING")
+    # Check the patient tables and verify every registry column is present
+    for table, required_columns in TABLE_COLUMNS.items():
+        cursor.execute(f"PRAGMA table_info({table})")
+        columns = cursor.fetchall()
+        
+        print(f"{table} table columns:")
+        print("-" * 50)
+        for column in columns:
+            print(f"{column[1]} ({column[2]})")
+        
+        existing_columns = [column[1] for column in columns]
+        
+        print("\nColumn verification:")
+        print("-" * 50)
+        for required_col in required_columns:
+            if required_col in existing_columns:
+                print(f"✓ {required_col}")
+            else:
+                print(f"✗ {required_col} - MISSING")
+        print()
     
     # Check Appointments table
     cursor.execute("PRAGMA table_info(Appointments)")
     appointment_columns = cursor.fetchall()
     
-    print("\nAppointments table columns:")
+    print("Appointments table columns:")
     print("-" * 50)
     for column in appointment_columns:
         print(f"{column[1]} ({column[2]})")
@@ -0,0 +1,269 @@
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+
+from flask import g
+
+# SQLite DB path
+DB_FILE = "dental.db"
+
+# Per-connection tuning, applied once when a connection is opened
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -16000",      # ~16 MB page cache
+    "PRAGMA mmap_size = 268435456",    # 256 MB memory-mapped I/O
+    "PRAGMA temp_store = MEMORY",
+)
+
+# Number of idle connections kept around between requests
+POOL_SIZE = 8
+
+# Prepared statements cached per connection
+STATEMENT_CACHE_SIZE = 256
+
+# Most writes committed together by the writer thread
+WRITE_BATCH_SIZE = 32
+
+# Called with the text of every statement run on connections opened after
+# it is set, e.g. by audit_queries.py; None traces nothing
+statement_trace = None
+
+
+def connect(db_file=None):
+    """Open a new tuned SQLite connection"""
+    conn = sqlite3.connect(db_file or DB_FILE,
+                           check_same_thread=False,
+                           cached_statements=STATEMENT_CACHE_SIZE)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    if statement_trace is not None:
+        conn.set_trace_callback(statement_trace)
+    return conn
+
+
+def connect_reader(db_file=None):
+    """Open a tuned connection that can only read"""
+    conn = sqlite3.connect(f"file:{db_file or DB_FILE}?mode=ro", uri=True,
+                           check_same_thread=False,
+                           cached_statements=STATEMENT_CACHE_SIZE)
+    # journal_mode is a property of the database file, set by the writer
+    for pragma in PRAGMAS[1:]:
+        conn.execute(pragma)
+    conn.execute("PRAGMA query_only = ON")
+    if statement_trace is not None:
+        conn.set_trace_callback(statement_trace)
+    return conn
+
+
+class ConnectionPool:
+    """Bounded pool of long-lived read-only SQLite connections.
+
+    A connection is checked out for the lifetime of one app context, so each
+    request uses exactly one connection, and is handed back afterwards so its
+    page cache and statement cache are reused by the next request. Under WAL
+    these readers never wait on the writer. Writes go through the Writer.
+    """
+
+    def __init__(self, db_file, size=POOL_SIZE):
+        self.db_file = db_file
+        self.size = size
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return connect_reader(self.db_file)
+
+    def release(self, conn):
+        # Never hand out a connection with a half-finished transaction
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+class Writer:
+    """The one thread, and the one connection, that changes the database.
+
+    Every mutation is a function taking the write connection, queued with
+    submit() or run(). The thread takes whatever is queued, up to
+    WRITE_BATCH_SIZE jobs, runs them in one transaction with a savepoint
+    each, and commits once for the whole batch. A job that raises is rolled
+    back to its savepoint alone, and its caller gets the exception. Jobs
+    must not commit or roll back themselves.
+
+    With a single writer, requests never race for SQLite's write lock, so
+    "database is locked" cannot happen between them. A burst of saves shares
+    one fsync instead of paying for one each.
+    """
+
+    def __init__(self, db_file, batch=WRITE_BATCH_SIZE):
+        self.db_file = db_file
+        self.batch = batch
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args):
+        """Queue fn(conn, *args) and return a Future for its result"""
+        future = Future()
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='dental-writer', daemon=True)
+                self._thread.start()
+            self._queue.put((fn, args, future))
+        return future
+
+    def run(self, fn, *args):
+        """Run fn(conn, *args) on the writer and return its result once committed"""
+        return self.submit(fn, *args).result()
+
+    def close(self):
+        """Finish the queued writes and stop the thread"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+            if thread is not None:
+                self._queue.put(None)
+        if thread is not None:
+            thread.join()
+
+    def _run(self):
+        conn = connect(self.db_file)
+        # Transactions are begun and ended here, never implicitly
+        conn.isolation_level = None
+        try:
+            while True:
+                jobs = [self._queue.get()]
+                while jobs[-1] is not None and len(jobs) < self.batch:
+                    try:
+                        jobs.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                stopping = jobs[-1] is None
+                jobs = [job for job in jobs if job is not None]
+                if jobs:
+                    self._commit_batch(conn, jobs)
+                if stopping:
+                    return
+        finally:
+            conn.close()
+
+    def _commit_batch(self, conn, jobs):
+        outcomes = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for fn, args, future in jobs:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                conn.execute("SAVEPOINT job")
+                try:
+                    result = fn(conn, *args)
+                except Exception as e:
+                    conn.execute("ROLLBACK TO job")
+                    conn.execute("RELEASE job")
+                    outcomes.append((future, None, e))
+                else:
+                    conn.execute("RELEASE job")
+                    outcomes.append((future, result, None))
+            conn.execute("COMMIT")
+        except Exception as e:
+            # The batch as a whole failed; nothing in it was committed
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            for fn, args, future in jobs:
+                if future.running():
+                    future.set_exception(e)
+            return
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+
+pool = ConnectionPool(DB_FILE)
+writer = Writer(DB_FILE)
+
+
+def write(fn, *args):
+    """Run fn(conn, *args) on the writer thread and return its result once committed"""
+    return writer.run(fn, *args)
+
+
+def get_db():
+    """Return the pooled read-only connection bound to the current app context"""
+    if 'db' not in g:
+        g.db = pool.acquire()
+    return g.db
+
+
+def release_db(exception=None):
+    """Return the app context's connection to the pool"""
+    conn = g.pop('db', None)
+    if conn is not None:
+        pool.release(conn)
+
+
+def init_app(app):
+    """Register connection handling with the Flask app"""
+    app.teardown_appcontext(release_db)
+
+
+# Secondary indexes maintained by init_db and the migration scripts:
+# (index name, table, indexed columns, partial-index condition)
+INDEXES = (
+    ("idx_appointments_resource_date_time", "Appointments", "ResourceID, Date, Time", None),
+    ("idx_appointments_patientid_date", "Appointments", "PatientID, Date, Time", None),
+    ("idx_appointments_starts_at", "Appointments", "StartsAt", None),
+    ("idx_appointments_patient_starts_at", "Appointments", "PatientID, StartsAt", None),
+    ("idx_appointments_unlinked_name", "Appointments", "PatientName", "PatientID IS NULL"),
+    ("idx_appointments_dentalcare", "Appointments", "DentalCare", None),
+    ("idx_treatmentrecords_patient_date", "TreatmentRecords", "PatientID, DateOfTreatment", None),
+)
+
+# Unique indexes, in the same shape. Rows already in the table can break
+# them, so each is created by its own migration, which checks for that
+# first: idx_appointments_date_time by migrate_unique_appointment_slots.
+UNIQUE_INDEXES = (
+    ("idx_appointments_date_time", "Appointments", "Date, Time, ResourceID", None),
+)
+
+# Indexes superseded by the sets above
+OBSOLETE_INDEXES = (
+    "idx_appointments_patient_date",
+)
+
+
+def ensure_indexes(conn):
+    """Create any missing secondary indexes on tables that exist"""
+    for name in OBSOLETE_INDEXES:
+        conn.execute(f"DROP INDEX IF EXISTS {name}")
+
+    created = []
+    for name, table, columns, where in INDEXES:
+        # table_xinfo, unlike table_info, lists generated columns too
+        existing_columns = {row[1] for row in conn.execute(f"PRAGMA table_xinfo({table})")}
+        # Skip tables or columns that a pending migration has not added yet
+        if not all(column.strip() in existing_columns for column in columns.split(',')):
+            continue
+        cursor = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (name,))
+        if cursor.fetchone() is None:
+            sql = f"CREATE INDEX {name} ON {table} ({columns})"
+            if where:
+                sql += f" WHERE {where}"
+            conn.execute(sql)
+            created.append(name)
+    return created
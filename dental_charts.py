@@ -0,0 +1,351 @@
+import json
+
+from chart_codec import decode_surfaces, encode_surfaces
+
+# Chart parts a patch may change, each mapping zone -> value
+CHART_PARTS = ('slice_colors', 'notes')
+
+# Saves between full snapshots in the chart history; a point-in-time read
+# replays at most this many revisions of zone changes on top of a snapshot
+SNAPSHOT_INTERVAL = 25
+
+SCHEMA = (
+    # One row per charted patient; every saved change advances the revision
+    """
+    CREATE TABLE IF NOT EXISTS DentalChartRevisions (
+        PatientID INTEGER PRIMARY KEY REFERENCES Patients (ID),
+        Revision INTEGER NOT NULL
+    )
+    """,
+    # Surface colours for a patient's whole chart, packed by chart_codec
+    """
+    CREATE TABLE IF NOT EXISTS DentalChartSurfaces (
+        PatientID INTEGER PRIMARY KEY REFERENCES Patients (ID),
+        Surfaces BLOB NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS DentalChartNotes (
+        PatientID INTEGER NOT NULL REFERENCES Patients (ID),
+        ToothNumber TEXT NOT NULL,
+        Zone TEXT NOT NULL,
+        Note TEXT NOT NULL,
+        PRIMARY KEY (PatientID, ToothNumber, Zone)
+    ) WITHOUT ROWID
+    """,
+    # Append-only history: when each revision was saved and the zones it changed.
+    # Seq numbers saves across all patients (migrate_add_chartlog_seq)
+    """
+    CREATE TABLE IF NOT EXISTS DentalChartLog (
+        PatientID INTEGER NOT NULL REFERENCES Patients (ID),
+        Revision INTEGER NOT NULL,
+        SavedAt TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        Seq INTEGER,
+        PRIMARY KEY (PatientID, Revision)
+    ) WITHOUT ROWID
+    """,
+    # Value is NULL where the revision removed the zone
+    """
+    CREATE TABLE IF NOT EXISTS DentalChartChanges (
+        PatientID INTEGER NOT NULL REFERENCES Patients (ID),
+        Revision INTEGER NOT NULL,
+        ToothNumber TEXT NOT NULL,
+        Part TEXT NOT NULL,
+        Zone TEXT NOT NULL,
+        Value TEXT,
+        PRIMARY KEY (PatientID, Revision, ToothNumber, Part, Zone)
+    ) WITHOUT ROWID
+    """,
+    # The whole chart every SNAPSHOT_INTERVAL revisions, surfaces packed as in DentalChartSurfaces
+    """
+    CREATE TABLE IF NOT EXISTS DentalChartSnapshots (
+        PatientID INTEGER NOT NULL REFERENCES Patients (ID),
+        Revision INTEGER NOT NULL,
+        Surfaces BLOB NOT NULL,
+        Notes TEXT NOT NULL,
+        PRIMARY KEY (PatientID, Revision)
+    ) WITHOUT ROWID
+    """,
+)
+
+
+class StaleChartRevision(Exception):
+    """A chart patch was made against a revision that is no longer current"""
+
+    def __init__(self, revision):
+        super().__init__(f"chart is at revision {revision}")
+        self.revision = revision
+
+
+def ensure_chart_tables(conn):
+    """Create the chart revision, storage and history tables"""
+    for statement in SCHEMA:
+        conn.execute(statement)
+
+
+def chart_revision(conn, patient_id):
+    """The patient's current chart revision (0 before the first save)"""
+    row = conn.execute("SELECT Revision FROM DentalChartRevisions WHERE PatientID = ?", (patient_id,)).fetchone()
+    return row[0] if row else 0
+
+
+def advance_revision(conn, patient_id):
+    """Record a saved change to the patient's chart and return the new revision"""
+    conn.execute("""
+        INSERT INTO DentalChartRevisions (PatientID, Revision) VALUES (?, 1)
+        ON CONFLICT (PatientID) DO UPDATE SET Revision = Revision + 1
+    """, (patient_id,))
+    return chart_revision(conn, patient_id)
+
+
+def decode_blob(text):
+    """Parse a legacy SliceColors/Notes JSON column, treating bad data as empty"""
+    if not text:
+        return {}
+    try:
+        value = json.loads(text)
+    except ValueError:
+        return {}
+    return value if isinstance(value, dict) else {}
+
+
+def build_chart(surfaces, notes):
+    """A chart from its packed surfaces (or None) and (tooth, zone, note) rows"""
+    chart = {tooth: {'slice_colors': colors, 'notes': {}} for tooth, colors in decode_surfaces(surfaces).items()}
+    for tooth, zone, note in notes:
+        chart.setdefault(tooth, {'slice_colors': {}, 'notes': {}})['notes'][zone] = note
+    return chart
+
+
+def load_chart(conn, patient_id):
+    """{tooth: {'slice_colors': {...}, 'notes': {...}}} for one patient"""
+    row = conn.execute("SELECT Surfaces FROM DentalChartSurfaces WHERE PatientID = ?", (patient_id,)).fetchone()
+    cursor = conn.execute("SELECT ToothNumber, Zone, Note FROM DentalChartNotes WHERE PatientID = ?", (patient_id,))
+    return build_chart(row[0] if row else None, cursor)
+
+
+def save_chart(conn, patient_id, chart, stored=None):
+    """Replace the teeth in chart for a patient, skipping teeth that are unchanged.
+
+    Colours for the whole mouth are re-packed into one row and the notes of
+    changed teeth are rewritten with one executemany, in the caller's
+    transaction. Any change advances the revision and is logged to the
+    history. Raises ValueError for anything the packed format cannot hold.
+    Returns {tooth: 'inserted' | 'updated' | 'unchanged'}.
+    """
+    if stored is None:
+        stored = load_chart(conn, patient_id)
+
+    results = {}
+    after = dict(stored)
+    colors = {tooth: info['slice_colors'] for tooth, info in stored.items()}
+    note_rows = []
+    for tooth, info in chart.items():
+        tooth = str(tooth)
+        slice_colors = info.get('slice_colors', {})
+        notes = info.get('notes', {})
+        if not isinstance(slice_colors, dict) or not isinstance(notes, dict):
+            raise ValueError(f"Tooth {tooth} slice_colors and notes must be objects")
+        if not all(isinstance(value, str) for zones in (slice_colors, notes) for value in zones.values()):
+            raise ValueError(f"Tooth {tooth} colours and notes must be strings")
+        # A tooth with no colours or notes is the same as no tooth at all
+        current = stored.get(tooth, {'slice_colors': {}, 'notes': {}})
+        if current == {'slice_colors': slice_colors, 'notes': notes}:
+            results[tooth] = 'unchanged'
+            continue
+        results[tooth] = 'updated' if tooth in stored else 'inserted'
+        colors[tooth] = slice_colors
+        note_rows += [(patient_id, tooth, zone, note) for zone, note in notes.items()]
+        after[tooth] = {'slice_colors': slice_colors, 'notes': notes}
+
+    changed = [tooth for tooth, result in results.items() if result != 'unchanged']
+    if not changed:
+        return results
+
+    surfaces = encode_surfaces(colors)
+    conn.execute("""
+        INSERT INTO DentalChartSurfaces (PatientID, Surfaces) VALUES (?, ?)
+        ON CONFLICT (PatientID) DO UPDATE SET Surfaces = excluded.Surfaces
+    """, (patient_id, surfaces))
+    conn.executemany("DELETE FROM DentalChartNotes WHERE PatientID = ? AND ToothNumber = ?",
+                     [(patient_id, tooth) for tooth in changed])
+    conn.executemany("INSERT INTO DentalChartNotes (PatientID, ToothNumber, Zone, Note) VALUES (?, ?, ?, ?)",
+                     note_rows)
+    log_revision(conn, patient_id, stored, after)
+    return results
+
+
+def _pack_snapshot(chart):
+    """(surfaces blob, notes JSON) for a whole chart"""
+    colors = {tooth: info['slice_colors'] for tooth, info in chart.items()}
+    notes = {tooth: info['notes'] for tooth, info in chart.items() if info['notes']}
+    return encode_surfaces(colors), json.dumps(notes, separators=(',', ':'))
+
+
+def _unpack_snapshot(surfaces, notes):
+    """Whole chart from a snapshot row, in load_chart's shape"""
+    chart = {tooth: {'slice_colors': colors, 'notes': {}} for tooth, colors in decode_surfaces(surfaces).items()}
+    for tooth, zones in json.loads(notes).items():
+        chart.setdefault(tooth, {'slice_colors': {}, 'notes': {}})['notes'] = zones
+    return chart
+
+
+def _write_snapshot(conn, patient_id, revision, chart):
+    conn.execute("""
+        INSERT OR REPLACE INTO DentalChartSnapshots (PatientID, Revision, Surfaces, Notes)
+        VALUES (?, ?, ?, ?)
+    """, (patient_id, revision) + _pack_snapshot(chart))
+
+
+def zone_changes(before, after):
+    """(tooth, part, zone, value) for every zone that differs, value None where removed"""
+    changes = []
+    empty = {'slice_colors': {}, 'notes': {}}
+    for tooth in sorted(set(before) | set(after)):
+        old, new = before.get(tooth, empty), after.get(tooth, empty)
+        for part in CHART_PARTS:
+            for zone in sorted(set(old[part]) | set(new[part])):
+                if old[part].get(zone) != new[part].get(zone):
+                    changes.append((tooth, part, zone, new[part].get(zone)))
+    return changes
+
+
+def log_revision(conn, patient_id, before, after):
+    """Advance the revision for a saved change and append it to the chart history.
+
+    The first logged save also snapshots the chart it started from, so the
+    history can always be replayed from a snapshot. Returns the new revision.
+    """
+    revision = advance_revision(conn, patient_id)
+    latest = conn.execute(
+        "SELECT MAX(Revision) FROM DentalChartSnapshots WHERE PatientID = ?", (patient_id,)
+    ).fetchone()[0]
+    if latest is None:
+        latest = revision - 1
+        _write_snapshot(conn, patient_id, latest, before)
+
+    # Saves go through the single writer, so the next Seq cannot be taken twice
+    conn.execute("""
+        INSERT INTO DentalChartLog (PatientID, Revision, Seq)
+        VALUES (?, ?, (SELECT COALESCE(MAX(Seq), 0) + 1 FROM DentalChartLog))
+    """, (patient_id, revision))
+    conn.executemany("""
+        INSERT INTO DentalChartChanges (PatientID, Revision, ToothNumber, Part, Zone, Value)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, [(patient_id, revision) + change for change in zone_changes(before, after)])
+
+    if revision - latest >= SNAPSHOT_INTERVAL:
+        _write_snapshot(conn, patient_id, revision, after)
+    return revision
+
+
+def chart_at(conn, patient_id, revision):
+    """The patient's chart as it was at revision, or None before its history starts.
+
+    Reads the nearest snapshot at or below revision and replays the zone
+    changes logged after it.
+    """
+    snapshot = conn.execute("""
+        SELECT Revision, Surfaces, Notes FROM DentalChartSnapshots
+        WHERE PatientID = ? AND Revision <= ?
+        ORDER BY Revision DESC LIMIT 1
+    """, (patient_id, revision)).fetchone()
+    if snapshot is None:
+        return {} if revision == 0 else None
+
+    chart = _unpack_snapshot(snapshot[1], snapshot[2])
+    cursor = conn.execute("""
+        SELECT ToothNumber, Part, Zone, Value FROM DentalChartChanges
+        WHERE PatientID = ? AND Revision > ? AND Revision <= ?
+        ORDER BY Revision
+    """, (patient_id, snapshot[0], revision))
+    for tooth, part, zone, value in cursor:
+        zones = chart.setdefault(tooth, {'slice_colors': {}, 'notes': {}})[part]
+        if value is None:
+            zones.pop(zone, None)
+        else:
+            zones[zone] = value
+    return {tooth: info for tooth, info in chart.items() if info['slice_colors'] or info['notes']}
+
+
+def revision_as_of(conn, patient_id, when):
+    """The last revision saved at or before when ('YYYY-MM-DD HH:MM:SS', UTC), or None if unknown"""
+    row = conn.execute("""
+        SELECT MAX(Revision) FROM DentalChartLog WHERE PatientID = ? AND SavedAt <= ?
+    """, (patient_id, when)).fetchone()
+    if row[0] is not None:
+        return row[0]
+    # Before the first logged save the chart was its starting snapshot
+    first = conn.execute("""
+        SELECT Revision FROM DentalChartSnapshots WHERE PatientID = ? ORDER BY Revision LIMIT 1
+    """, (patient_id,)).fetchone()
+    return 0 if first is None or first[0] == 0 else None
+
+
+def chart_visits(conn, patient_id):
+    """[(date, last revision saved that day)] for the patient, newest first"""
+    return conn.execute("""
+        SELECT date(SavedAt), MAX(Revision) FROM DentalChartLog
+        WHERE PatientID = ?
+        GROUP BY date(SavedAt)
+        ORDER BY date(SavedAt) DESC
+    """, (patient_id,)).fetchall()
+
+
+def chart_diff(before, after):
+    """{tooth: {part: {zone: [old, new]}}} for the zones that differ between two charts"""
+    diff = {}
+    empty = {'slice_colors': {}, 'notes': {}}
+    for tooth, part, zone, value in zone_changes(before, after):
+        old = before.get(tooth, empty)[part].get(zone)
+        diff.setdefault(tooth, {}).setdefault(part, {})[zone] = [old, value]
+    return diff
+
+
+def is_chart_patch(changes):
+    """Whether changes has the {tooth: {part: {zone: string or None}}} patch shape"""
+    return isinstance(changes, dict) and all(
+        isinstance(tooth_changes, dict)
+        and all(
+            part in CHART_PARTS and isinstance(zones, dict)
+            and all(value is None or isinstance(value, str) for value in zones.values())
+            for part, zones in tooth_changes.items()
+        )
+        for tooth_changes in changes.values()
+    )
+
+
+def apply_chart_patch(conn, patient_id, base_revision, changes):
+    """Apply zone-level changes made against base_revision, on the writer connection.
+
+    changes maps tooth -> {'slice_colors': {zone: value}, 'notes': {zone: value}},
+    where a value of None removes the zone. Raises StaleChartRevision when
+    the chart has moved past base_revision. Returns (revision, per-tooth results).
+    """
+    # Run on the writer, so no other save can land between this check and the write
+    revision = chart_revision(conn, patient_id)
+    if revision != base_revision:
+        raise StaleChartRevision(revision)
+
+    stored = load_chart(conn, patient_id)
+    patched = {}
+    for tooth, tooth_changes in changes.items():
+        tooth = str(tooth)
+        current = stored.get(tooth, {'slice_colors': {}, 'notes': {}})
+        merged = {part: dict(current[part]) for part in CHART_PARTS}
+        for part, zones in tooth_changes.items():
+            for zone, value in zones.items():
+                if value is None:
+                    merged[part].pop(zone, None)
+                else:
+                    merged[part][zone] = value
+        patched[tooth] = merged
+
+    results = save_chart(conn, patient_id, patched, stored)
+    return chart_revision(conn, patient_id), results
+
+
+def replace_chart(conn, patient_id, chart):
+    """Save whole teeth regardless of revision. Returns (revision, per-tooth results)."""
+    results = save_chart(conn, patient_id, chart)
+    return chart_revision(conn, patient_id), results
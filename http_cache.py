@@ -0,0 +1,83 @@
+import hashlib
+import os
+import threading
+import time
+
+from flask import Response, request
+
+# Distinguishes this process's counters from those of an earlier run, so a
+# restart (which resets every version to 0) never revalidates an old copy
+EPOCH = f"{os.getpid():x}.{int(time.time()):x}"
+
+
+class DataVersions:
+    """Per-process change counters for the data behind cacheable responses.
+
+    Each name (a table such as 'appointments', or a per-patient key such as
+    'dental_chart:12') is bumped by the write paths after they commit. Read
+    endpoints build their ETag from the counters, so a client holding the
+    current version is answered with 304 before any query runs.
+    """
+
+    def __init__(self):
+        self._versions = {}
+        self._modified = {}
+        self._started = time.time()
+        self._lock = threading.Lock()
+
+    def bump(self, *names):
+        """Record that the data under each name has changed"""
+        now = time.time()
+        with self._lock:
+            for name in names:
+                self._versions[name] = self._versions.get(name, 0) + 1
+                self._modified[name] = now
+
+    def snapshot(self, names):
+        """(tuple of current versions, time of the latest change) for names"""
+        with self._lock:
+            versions = tuple(self._versions.get(name, 0) for name in names)
+            modified = max([self._modified.get(name, self._started) for name in names])
+        return versions, modified
+
+
+data_versions = DataVersions()
+
+
+def validators(names, *variant):
+    """(strong ETag, Last-Modified) for a response built from the named data.
+
+    variant holds whatever else shapes the body, such as the query string.
+    Last-Modified is None while the last change is in the current second.
+    """
+    versions, modified = data_versions.snapshot(names)
+    key = "\0".join(str(part) for part in variant).encode()
+    digest = hashlib.sha1(key).hexdigest()[:16]
+    etag = f"{EPOCH}-{'.'.join(map(str, versions))}-{digest}"
+    # HTTP dates have whole seconds. Once that second is over, any later
+    # change falls in a later one; before then, one could share its date.
+    last_modified = int(modified)
+    return etag, last_modified if last_modified < int(time.time()) else None
+
+
+def is_not_modified(etag, last_modified):
+    """Whether the request's conditional headers already match these validators"""
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if request.if_modified_since:
+        return last_modified is not None and last_modified <= request.if_modified_since.timestamp()
+    return False
+
+
+def set_validators(response, etag, last_modified):
+    """Attach the validators and ask the browser to revalidate before reuse"""
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    return response
+
+
+def not_modified(etag, last_modified):
+    """An empty 304 response for a client whose copy is still current"""
+    return set_validators(Response(status=304), etag, last_modified)
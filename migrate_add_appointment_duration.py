@@ -0,0 +1,33 @@
+import sqlite3
+import os
+
+
+def migrate_appointment_durations(conn):
+    """Add Appointments.Duration in minutes.
+
+    Existing appointments were booked as single half-hour slots, which the
+    column default gives them; returns whether the column was added.
+    """
+    cursor = conn.cursor()
+
+    cursor.execute("PRAGMA table_info(Appointments)")
+    existing_columns = [column[1] for column in cursor.fetchall()]
+
+    if 'Duration' in existing_columns:
+        return False
+    cursor.execute("ALTER TABLE Appointments ADD COLUMN Duration INTEGER NOT NULL DEFAULT 30")
+    print("Added column: Duration")
+    return True
+
+
+if __name__ == "__main__":
+    DB_FILE = "dental.db"
+
+    if not os.path.exists(DB_FILE):
+        print("Database file not found.")
+    else:
+        conn = sqlite3.connect(DB_FILE)
+        added = migrate_appointment_durations(conn)
+        conn.commit()
+        conn.close()
+        print("Appointments now have a duration." if added else "Appointments already have a duration.")
@@ -0,0 +1,36 @@
+import sqlite3
+import os
+
+
+def migrate_appointment_patient_ids(conn):
+    """Add Appointments.PatientID and backfill it from the patient name"""
+    cursor = conn.cursor()
+
+    cursor.execute("PRAGMA table_info(Appointments)")
+    existing_columns = [column[1] for column in cursor.fetchall()]
+
+    if 'PatientID' not in existing_columns:
+        cursor.execute("ALTER TABLE Appointments ADD COLUMN PatientID INTEGER REFERENCES Patients (ID)")
+        print("Added column: PatientID")
+
+    # Link every appointment whose name matches a patient
+    cursor.execute("""
+        UPDATE Appointments
+        SET PatientID = (SELECT p.ID FROM Patients p WHERE p.Name = Appointments.PatientName)
+        WHERE PatientID IS NULL
+          AND EXISTS (SELECT 1 FROM Patients p WHERE p.Name = Appointments.PatientName)
+    """)
+    return cursor.rowcount
+
+
+if __name__ == "__main__":
+    DB_FILE = "dental.db"
+
+    if not os.path.exists(DB_FILE):
+        print("Database file not found.")
+    else:
+        conn = sqlite3.connect(DB_FILE)
+        linked = migrate_appointment_patient_ids(conn)
+        conn.commit()
+        conn.close()
+        print(f"Backfilled PatientID on {linked} appointments.")
@@ -0,0 +1,44 @@
+import sqlite3
+import os
+
+# Seconds from 1970-01-01 00:00 to the appointment's Date and Time, both read
+# as clinic wall-clock time; Time may be H:MM, HH:MM or HH:MM:SS. Rows whose
+# Date is not YYYY-MM-DD get NULL.
+STARTS_AT = """
+    CAST(strftime('%s', Date) AS INTEGER)
+    + 3600 * CAST(Time AS INTEGER)
+    + 60 * CAST(substr(Time, instr(Time, ':') + 1) AS INTEGER)
+"""
+
+
+def migrate_appointment_timestamps(conn):
+    """Add Appointments.StartsAt, the integer sort and range key of an appointment.
+
+    It is a generated column, so every writer keeps it in step with Date and
+    Time without knowing it exists; being VIRTUAL, adding it rewrites nothing
+    and only its indexes (db.INDEXES) store it. Returns whether it was added.
+    """
+    cursor = conn.cursor()
+
+    # table_info leaves generated columns out
+    cursor.execute("PRAGMA table_xinfo(Appointments)")
+    existing_columns = [column[1] for column in cursor.fetchall()]
+
+    if 'StartsAt' in existing_columns:
+        return False
+    cursor.execute(f"ALTER TABLE Appointments ADD COLUMN StartsAt INTEGER GENERATED ALWAYS AS ({STARTS_AT}) VIRTUAL")
+    print("Added column: StartsAt")
+    return True
+
+
+if __name__ == "__main__":
+    DB_FILE = "dental.db"
+
+    if not os.path.exists(DB_FILE):
+        print("Database file not found.")
+    else:
+        conn = sqlite3.connect(DB_FILE)
+        added = migrate_appointment_timestamps(conn)
+        conn.commit()
+        conn.close()
+        print("Appointments now have a StartsAt timestamp." if added else "Appointments already have a StartsAt timestamp.")
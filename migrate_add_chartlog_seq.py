@@ -0,0 +1,51 @@
+import sqlite3
+import os
+
+from dental_charts import ensure_chart_tables
+
+
+def migrate_chart_log_sequence(conn):
+    """Number every DentalChartLog entry with DentalChartLog.Seq, the dental chart export watermark.
+
+    SavedAt only has one-second resolution, so two saves in the same second
+    cannot be told apart by it; Seq goes up by one with every save across
+    all patients (dental_charts.log_revision). Entries logged before it
+    existed are numbered in the order they were saved. Returns how many
+    entries were numbered.
+    """
+    cursor = conn.cursor()
+
+    cursor.execute("PRAGMA table_info(DentalChartLog)")
+    existing_columns = [column[1] for column in cursor.fetchall()]
+
+    if 'Seq' not in existing_columns:
+        cursor.execute("ALTER TABLE DentalChartLog ADD COLUMN Seq INTEGER")
+        print("Added column: Seq")
+
+    cursor.execute("SELECT COALESCE(MAX(Seq), 0) FROM DentalChartLog")
+    last = cursor.fetchone()[0]
+    cursor.execute("""
+        SELECT PatientID, Revision FROM DentalChartLog
+        WHERE Seq IS NULL
+        ORDER BY SavedAt, PatientID, Revision
+    """)
+    entries = cursor.fetchall()
+    cursor.executemany("UPDATE DentalChartLog SET Seq = ? WHERE PatientID = ? AND Revision = ?",
+                       [(seq, patient_id, revision) for seq, (patient_id, revision) in enumerate(entries, last + 1)])
+
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_dentalchartlog_seq ON DentalChartLog (Seq)")
+    return len(entries)
+
+
+if __name__ == "__main__":
+    DB_FILE = "dental.db"
+
+    if not os.path.exists(DB_FILE):
+        print("Database file not found.")
+    else:
+        conn = sqlite3.connect(DB_FILE)
+        ensure_chart_tables(conn)
+        numbered = migrate_chart_log_sequence(conn)
+        conn.commit()
+        conn.close()
+        print(f"Numbered {numbered} dental chart history entries.")
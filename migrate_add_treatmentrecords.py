@@ -19,6 +19,11 @@ cursor.execute('''
     )
 ''')
 
+cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_treatmentrecords_patient_date
+    ON TreatmentRecords (PatientID, DateOfTreatment)
+''')
+
 conn.commit()
 conn.close()
 print('TreatmentRecords table ensured in dental.db') 
\ No newline at end of file
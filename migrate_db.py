@@ -1,6 +1,11 @@
 import sqlite3
 import os
 
+from db import ensure_indexes
+from migrate_unique_appointment_slots import ensure_unique_slots
+from patient_fields import ensure_patient_tables
+from migrate_split_patients import split_patient_tables
+
 def migrate_database():
     """Migrate existing database to include new patient fields"""
     DB_FILE = "dental.db"
@@ -12,62 +17,12 @@ def migrate_database():
     conn = sqlite3.connect(DB_FILE)
     cursor = conn.cursor()
     
-    # List of new columns to add
-    new_columns = [
-        ('Religion', 'TEXT'),
-        ('HomeAddress', 'TEXT'),
-        ('Occupation', 'TEXT'),
-        ('DentalInsurance', 'TEXT'),
-        ('EffectiveDate', 'TEXT'),
-        ('ParentGuardianName', 'TEXT'),
-        ('ParentGuardianOccupation', 'TEXT'),
-        ('ReferralSource', 'TEXT'),
-        ('ConsultationReason', 'TEXT'),
-        ('DentalHistory', 'TEXT'),
-        ('PreviousDentist', 'TEXT'),
-        ('LastDentalVisit', 'TEXT'),
-        ('Sex', 'TEXT'),
-        ('Nickname', 'TEXT'),
-        ('Age', 'TEXT'),
-        ('Nationality', 'TEXT'),
-        ('GoodHealth', 'TEXT'),
-        ('MedicalTreatment', 'TEXT'),
-        ('TreatmentCondition', 'TEXT'),
-        ('SeriousIllness', 'TEXT'),
-        ('SurgicalOperation', 'TEXT'),
-        ('Hospitalized', 'TEXT'),
-        ('HospitalizationDetails', 'TEXT'),
-        ('PrescriptionMedication', 'TEXT'),
-        ('NonPrescriptionMedication', 'TEXT'),
-        ('TobaccoUse', 'TEXT'),
-        ('AlcoholDrugUse', 'TEXT'),
-        ('AllergicLocalAnesthetic', 'TEXT'),
-        ('AllergicPenicillin', 'TEXT'),
-        ('AllergicAntibiotics', 'TEXT'),
-        ('AllergicSulfaDrugs', 'TEXT'),
-        ('AllergicAspirin', 'TEXT'),
-        ('AllergicLatex', 'TEXT'),
-        ('AllergicOthers', 'TEXT'),
-        ('BleedingTime', 'TEXT'),
-        ('Pregnant', 'TEXT'),
-        ('Nursing', 'TEXT'),
-        ('BirthPills', 'TEXT'),
-        ('BloodType', 'TEXT'),
-        ('BloodPressure', 'TEXT')
-    ]
-    
-    # Check existing columns
-    cursor.execute("PRAGMA table_info(Patients)")
-    existing_columns = [column[1] for column in cursor.fetchall()]
+    # Add any patient field's column the tables are missing
+    for column_name in ensure_patient_tables(conn):
+        print(f"Added column: {column_name}")
     
-    # Add new columns if they don't exist
-    for column_name, column_type in new_columns:
-        if column_name not in existing_columns:
-            try:
-                cursor.execute(f"ALTER TABLE Patients ADD COLUMN {column_name} {column_type}")
-                print(f"Added column: {column_name}")
-            except sqlite3.OperationalError as e:
-                print(f"Error adding column {column_name}: {e}")
+    # Move the medical and allergy columns out of a pre-split Patients table
+    split_patient_tables(conn)
     
     try:
         cursor.execute("ALTER TABLE DentalCharts ADD COLUMN SliceColors TEXT")
@@ -75,6 +30,13 @@ def migrate_database():
     except Exception as e:
         print("Column may already exist or error occurred:", e)
     
+    # One appointment per resource and slot, where the bookings already allow it
+    ensure_unique_slots(conn)
+    
+    # Create the secondary indexes the app relies on
+    for index_name in ensure_indexes(conn):
+        print(f"Added index: {index_name}")
+    
     conn.commit()
     conn.close()
     print("Database migration completed!")
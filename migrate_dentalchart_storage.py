@@ -0,0 +1,83 @@
+import sqlite3
+import os
+
+from dental_charts import decode_blob, ensure_chart_tables, load_chart, save_chart
+from migrate_add_chartlog_seq import migrate_chart_log_sequence
+
+
+class UnmigratedCharts(Exception):
+    """Charts the packed format cannot hold, e.g. a colour missing from chart_codec.COLORS"""
+
+
+def migrate_chart_storage(conn):
+    """Move per-tooth SliceColors/Notes JSON into the packed chart tables.
+
+    The packed tables are all the app reads, so a chart that cannot be packed
+    stops the migration rather than being left behind where nothing shows
+    it: UnmigratedCharts lists them, and nothing is committed. Add the
+    colour to chart_codec.COLORS (or fix the row by hand) and run it again.
+    """
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT PatientID, ToothNumber, SliceColors, Notes, ExamDate
+        FROM DentalCharts
+        WHERE SliceColors IS NOT NULL OR (Notes LIKE '{%' AND json_valid(Notes))
+        ORDER BY PatientID
+    """)
+    rows = cursor.fetchall()
+
+    charts = {}
+    exam_dates = {}
+    for patient_id, tooth, slice_colors, notes, exam_date in rows:
+        chart = charts.setdefault(patient_id, {})
+        # Old saves stored whatever JSON the page sent; notes are kept as text
+        notes = {zone: str(note) for zone, note in decode_blob(notes).items()}
+        chart[str(tooth)] = {'slice_colors': decode_blob(slice_colors), 'notes': notes}
+        if exam_date:
+            exam_dates[patient_id] = max(exam_date, exam_dates.get(patient_id, exam_date))
+
+    migrated = 0
+    failures = []
+    for patient_id, chart in charts.items():
+        try:
+            save_chart(conn, patient_id, chart, load_chart(conn, patient_id))
+        except ValueError as e:
+            failures.append(f"patient {patient_id}: {e}")
+            continue
+        if patient_id in exam_dates:
+            # Date the chart's first history entry by its exam rather than by this migration
+            cursor.execute("""
+                UPDATE DentalChartLog SET SavedAt = ?
+                WHERE PatientID = ? AND Revision = (SELECT Revision FROM DentalChartRevisions WHERE PatientID = ?)
+            """, (exam_dates[patient_id], patient_id, patient_id))
+        # Free-text notes that are not a zone map stay where the exam page reads them
+        cursor.execute("""
+            UPDATE DentalCharts
+            SET SliceColors = NULL,
+                Notes = CASE WHEN Notes LIKE '{%' AND json_valid(Notes) THEN NULL ELSE Notes END
+            WHERE PatientID = ?
+        """, (patient_id,))
+        migrated += 1
+    if failures:
+        raise UnmigratedCharts("Dental charts that cannot be packed: " + "; ".join(failures))
+    return migrated
+
+
+if __name__ == "__main__":
+    DB_FILE = "dental.db"
+
+    if not os.path.exists(DB_FILE):
+        print("Database file not found.")
+    else:
+        conn = sqlite3.connect(DB_FILE)
+        ensure_chart_tables(conn)
+        migrate_chart_log_sequence(conn)
+        try:
+            migrated = migrate_chart_storage(conn)
+        except UnmigratedCharts as e:
+            print(e)
+            print("Nothing was moved; fix these charts, then run this again.")
+        else:
+            conn.commit()
+            print(f"Moved {migrated} dental charts to packed storage.")
+        conn.close()
@@ -0,0 +1,43 @@
+import sqlite3
+import os
+
+from schedule import normalize_time
+
+
+def normalize_appointment_times(conn):
+    """Rewrite Appointments.Time typed as H:MM or HH:MM:SS to HH:MM.
+
+    The overlap check and the unique slot index compare Time as text, so
+    09:00 and 9:00 would not be seen as the same slot. A row whose
+    normalized time is already taken on its resource is printed and left as
+    it was, so it can be moved by hand. Returns how many rows were rewritten.
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT ID, Time FROM Appointments WHERE Time NOT GLOB '[0-2][0-9]:[0-5][0-9]'")
+    rewritten = 0
+    for appointment_id, appointment_time in cursor.fetchall():
+        try:
+            normalized = normalize_time(appointment_time)
+        except (ValueError, AttributeError):
+            print(f"Appointment {appointment_id} has an unreadable time: {appointment_time!r}")
+            continue
+        try:
+            conn.execute("UPDATE Appointments SET Time = ? WHERE ID = ?", (normalized, appointment_id))
+        except sqlite3.IntegrityError:
+            print(f"Appointment {appointment_id} at {appointment_time} double-books its resource at {normalized}")
+            continue
+        rewritten += 1
+    return rewritten
+
+
+if __name__ == "__main__":
+    DB_FILE = "dental.db"
+
+    if not os.path.exists(DB_FILE):
+        print("Database file not found.")
+    else:
+        conn = sqlite3.connect(DB_FILE)
+        rewritten = normalize_appointment_times(conn)
+        conn.commit()
+        conn.close()
+        print(f"Rewrote {rewritten} appointment times as HH:MM.")
@@ -0,0 +1,78 @@
+import sqlite3
+import os
+
+from patient_fields import (CORE, COLUMN_TABLES, PATIENT_TABLES, SIDE_KEY, TABLE_COLUMNS, create_statement,
+                            ensure_patient_tables)
+
+
+def split_patient_tables(conn):
+    """Move the intake-form columns of a wide Patients table into PatientMedical and PatientAllergies.
+
+    Each patient gets a row in both side tables holding the values it had,
+    then Patients is rebuilt with just the core columns, keeping IDs, the
+    AUTOINCREMENT counter, and its indexes and triggers. Columns the field
+    registry does not know (added by hand or by an older version) are
+    carried into the rebuilt table as they were. The side tables must
+    already exist (ensure_patient_tables); returns whether anything moved.
+    """
+    cursor = conn.cursor()
+
+    cursor.execute("PRAGMA table_info(Patients)")
+    table_info = cursor.fetchall()
+    existing_columns = [column[1] for column in table_info]
+    moved = [column for column in existing_columns if COLUMN_TABLES.get(column, CORE) != CORE]
+    if not moved:
+        return False
+
+    for table in PATIENT_TABLES:
+        if table == CORE:
+            continue
+        columns = [column for column in moved if COLUMN_TABLES[column] == table]
+        cursor.execute(f"""
+            INSERT OR IGNORE INTO {table} ({SIDE_KEY}, {', '.join(columns)})
+            SELECT ID, {', '.join(columns)} FROM Patients
+        """)
+
+    # Dropping the table drops these too, so they are put back afterwards
+    cursor.execute("""
+        SELECT sql FROM sqlite_master
+        WHERE tbl_name = 'Patients' AND type IN ('index', 'trigger') AND sql IS NOT NULL
+    """)
+    dependents = [sql for sql, in cursor.fetchall()]
+    cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'Patients'")
+    row = cursor.fetchone()
+
+    kept = [column for column in TABLE_COLUMNS[CORE] if column in existing_columns]
+    cursor.execute(create_statement(CORE, name='Patients_core'))
+    for _, column, declared_type, _, default, _ in table_info:
+        if column in COLUMN_TABLES or column in kept:
+            continue
+        # NOT NULL is left off: ADD COLUMN only allows it with a default
+        declaration = f"{column} {declared_type}" + (f" DEFAULT {default}" if default is not None else "")
+        cursor.execute(f"ALTER TABLE Patients_core ADD COLUMN {declaration}")
+        print(f"Kept column not in the patient field registry: {column}")
+        kept.append(column)
+    cursor.execute(f"INSERT INTO Patients_core ({', '.join(kept)}) SELECT {', '.join(kept)} FROM Patients")
+    cursor.execute("DROP TABLE Patients")
+    cursor.execute("ALTER TABLE Patients_core RENAME TO Patients")
+    if row:
+        cursor.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'Patients'", (row[0],))
+    for sql in dependents:
+        cursor.execute(sql)
+
+    print(f"Moved {len(moved)} patient columns out of Patients")
+    return True
+
+
+if __name__ == "__main__":
+    DB_FILE = "dental.db"
+
+    if not os.path.exists(DB_FILE):
+        print("Database file not found.")
+    else:
+        conn = sqlite3.connect(DB_FILE)
+        ensure_patient_tables(conn)
+        moved = split_patient_tables(conn)
+        conn.commit()
+        conn.close()
+        print("Patient records are split." if moved else "Patient records were already split.")
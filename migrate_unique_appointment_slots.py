@@ -0,0 +1,65 @@
+import sqlite3
+import os
+
+from db import UNIQUE_INDEXES
+from resources import ensure_resources
+
+# The unique slot index as db.UNIQUE_INDEXES declares it
+SLOT_INDEX = "idx_appointments_date_time"
+SLOT_COLUMNS = next(columns for name, _, columns, _ in UNIQUE_INDEXES if name == SLOT_INDEX)
+
+
+def ensure_unique_slots(conn):
+    """Make (Date, Time, ResourceID) unique so each chair or dentist takes one booking per slot.
+
+    Returns False while double bookings remain; they are printed so they
+    can be moved by hand, and until then the index is a plain one, so
+    queries on the slot columns still use it. Also False while Appointments
+    lacks a slot column that a pending migration adds.
+    """
+    cursor = conn.cursor()
+
+    cursor.execute("PRAGMA table_info(Appointments)")
+    existing_columns = {column[1] for column in cursor.fetchall()}
+    if not all(column.strip() in existing_columns for column in SLOT_COLUMNS.split(',')):
+        return False
+
+    cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'index' AND name = ?", (SLOT_INDEX,))
+    row = cursor.fetchone()
+    wanted = f"CREATE UNIQUE INDEX {SLOT_INDEX} ON Appointments ({SLOT_COLUMNS})"
+    if row and row[0] == wanted:
+        return True
+
+    cursor.execute(f"""
+        SELECT {SLOT_COLUMNS}, GROUP_CONCAT(ID, ', ')
+        FROM Appointments
+        GROUP BY {SLOT_COLUMNS}
+        HAVING COUNT(*) > 1
+    """)
+    duplicates = cursor.fetchall()
+    for appointment_date, appointment_time, resource_id, ids in duplicates:
+        print(f"Double booking of resource {resource_id} on {appointment_date} at {appointment_time}: appointments {ids}")
+    if duplicates:
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {SLOT_INDEX} ON Appointments ({SLOT_COLUMNS})")
+        return False
+
+    cursor.execute(f"DROP INDEX IF EXISTS {SLOT_INDEX}")
+    cursor.execute(wanted)
+    return True
+
+
+if __name__ == "__main__":
+    DB_FILE = "dental.db"
+
+    if not os.path.exists(DB_FILE):
+        print("Database file not found.")
+    else:
+        conn = sqlite3.connect(DB_FILE)
+        ensure_resources(conn)
+        unique = ensure_unique_slots(conn)
+        conn.commit()
+        conn.close()
+        if unique:
+            print("Appointment slots are unique.")
+        else:
+            print("Resolve the double bookings above, then run this again.")
@@ -0,0 +1,104 @@
+import base64
+import binascii
+import json
+import threading
+import time
+
+# How long a list total may be reused before it is counted again
+COUNT_CACHE_SECONDS = 30
+
+# Most distinct count queries remembered at once
+COUNT_CACHE_SIZE = 256
+
+_count_cache = {}
+_count_lock = threading.Lock()
+
+
+def encode_cursor(values):
+    """Pack a row's sort key into an opaque URL-safe token"""
+    raw = json.dumps(list(values), separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token, size):
+    """Unpack a cursor token, or return None if it is malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(raw)
+    except (ValueError, binascii.Error):
+        return None
+    if not isinstance(values, list) or len(values) != size:
+        return None
+    # Only values SQLite can bind; a token holding objects or lists is not one of ours
+    if not all(value is None or isinstance(value, (str, int, float)) for value in values):
+        return None
+    return values
+
+
+def cursor_mode(args):
+    """Whether the query string asks for cursor (keyset) pagination"""
+    return args.get('paging') == 'cursor' or 'after' in args or 'before' in args
+
+
+def read_cursor(args, size):
+    """Return (sort key values, backwards) from the after/before query parameters"""
+    if args.get('before'):
+        values = decode_cursor(args['before'], size)
+        if values is not None:
+            return values, True
+    if args.get('after'):
+        values = decode_cursor(args['after'], size)
+        if values is not None:
+            return values, False
+    return None, False
+
+
+def keyset_condition(columns, descending=False, backwards=False):
+    """Row-value condition selecting rows past a cursor in (columns) order"""
+    operator = '>' if descending == backwards else '<'
+    placeholders = ', '.join('?' * len(columns))
+    return f"({', '.join(columns)}) {operator} ({placeholders})"
+
+
+def keyset_order(columns, descending=False, backwards=False):
+    """ORDER BY list for a keyset page, reversed when paging backwards"""
+    direction = ' DESC' if descending != backwards else ''
+    return ', '.join(column + direction for column in columns)
+
+
+def page_cursors(rows, per_page, backwards, has_cursor, key):
+    """Trim a page fetched with LIMIT per_page + 1 and work out its cursors.
+
+    Returns (rows in display order, prev cursor, next cursor), with a cursor
+    of None where there is no page in that direction.
+    """
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    has_prev = has_more if backwards else has_cursor
+    has_next = True if backwards else has_more
+
+    prev_cursor = encode_cursor(key(rows[0])) if rows and has_prev else None
+    next_cursor = encode_cursor(key(rows[-1])) if rows and has_next else None
+    return rows, prev_cursor, next_cursor
+
+
+def cached_count(conn, sql, params=()):
+    """Run a COUNT query, reusing a recent result for the same query"""
+    cache_key = (sql, tuple(params))
+    now = time.monotonic()
+
+    with _count_lock:
+        cached = _count_cache.get(cache_key)
+    if cached is not None and now - cached[1] < COUNT_CACHE_SECONDS:
+        return cached[0]
+
+    count = conn.execute(sql, params).fetchone()[0]
+
+    with _count_lock:
+        if len(_count_cache) >= COUNT_CACHE_SIZE:
+            _count_cache.clear()
+        _count_cache[cache_key] = (count, now)
+    return count
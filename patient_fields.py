@@ -0,0 +1,264 @@
+# The patient record, declared once. Each field is (form field, column,
+# column type, table); the create and edit forms are read through it, the
+# tables and their migrations are built from it, and the INSERT and UPDATE
+# statements are generated from it when the module loads, so the same text
+# reaches sqlite3's statement cache every time.
+#
+# The record is split across three tables sharing the patient's ID. Patients
+# is the narrow core that lists, lookups and search read; the rest of the
+# intake form lives in PatientMedical and PatientAllergies, one row per
+# patient, and is only read by the pages that show it.
+#
+# Adding a field to the form is one line here; init_db (or migrate_db.py)
+# adds the column to an existing database.
+from functools import lru_cache
+
+CORE = 'Patients'
+MEDICAL = 'PatientMedical'
+ALLERGIES = 'PatientAllergies'
+
+# Table -> alias used when the record is read back in one query
+PATIENT_TABLES = {CORE: 'p', MEDICAL: 'm', ALLERGIES: 'a'}
+
+PATIENT_FIELDS = (
+    ('name', 'Name', 'TEXT NOT NULL UNIQUE', CORE),
+    ('contact', 'Contact', 'TEXT NOT NULL', CORE),
+    ('email', 'Email', 'TEXT', CORE),
+    ('date_of_birth', 'DateOfBirth', 'TEXT', CORE),
+    ('address', 'Address', 'TEXT', MEDICAL),
+    ('emergency_contact', 'EmergencyContact', 'TEXT', MEDICAL),
+    ('medical_history', 'MedicalHistory', 'TEXT', MEDICAL),
+    ('religion', 'Religion', 'TEXT', MEDICAL),
+    ('home_address', 'HomeAddress', 'TEXT', MEDICAL),
+    ('occupation', 'Occupation', 'TEXT', MEDICAL),
+    ('dental_insurance', 'DentalInsurance', 'TEXT', MEDICAL),
+    ('effective_date', 'EffectiveDate', 'TEXT', MEDICAL),
+    ('parent_guardian_name', 'ParentGuardianName', 'TEXT', MEDICAL),
+    ('parent_guardian_occupation', 'ParentGuardianOccupation', 'TEXT', MEDICAL),
+    ('referral_source', 'ReferralSource', 'TEXT', MEDICAL),
+    ('consultation_reason', 'ConsultationReason', 'TEXT', MEDICAL),
+    ('dental_history', 'DentalHistory', 'TEXT', MEDICAL),
+    ('previous_dentist', 'PreviousDentist', 'TEXT', MEDICAL),
+    ('last_dental_visit', 'LastDentalVisit', 'TEXT', MEDICAL),
+    ('sex', 'Sex', 'TEXT', MEDICAL),
+    ('nickname', 'Nickname', 'TEXT', CORE),
+    ('age', 'Age', 'TEXT', MEDICAL),
+    ('nationality', 'Nationality', 'TEXT', MEDICAL),
+    # Medical history
+    ('good_health', 'GoodHealth', 'TEXT', MEDICAL),
+    ('medical_treatment', 'MedicalTreatment', 'TEXT', MEDICAL),
+    ('treatment_condition', 'TreatmentCondition', 'TEXT', MEDICAL),
+    ('serious_illness', 'SeriousIllness', 'TEXT', MEDICAL),
+    ('surgical_operation', 'SurgicalOperation', 'TEXT', MEDICAL),
+    ('hospitalized', 'Hospitalized', 'TEXT', MEDICAL),
+    ('hospitalization_details', 'HospitalizationDetails', 'TEXT', MEDICAL),
+    ('prescription_medication', 'PrescriptionMedication', 'TEXT', MEDICAL),
+    ('non_prescription_medication', 'NonPrescriptionMedication', 'TEXT', MEDICAL),
+    ('tobacco_use', 'TobaccoUse', 'TEXT', MEDICAL),
+    ('alcohol_drug_use', 'AlcoholDrugUse', 'TEXT', MEDICAL),
+    ('allergic_local_anesthetic', 'AllergicLocalAnesthetic', 'TEXT', ALLERGIES),
+    ('allergic_penicillin', 'AllergicPenicillin', 'TEXT', ALLERGIES),
+    ('allergic_antibiotics', 'AllergicAntibiotics', 'TEXT', ALLERGIES),
+    ('allergic_sulfa_drugs', 'AllergicSulfaDrugs', 'TEXT', ALLERGIES),
+    ('allergic_aspirin', 'AllergicAspirin', 'TEXT', ALLERGIES),
+    ('allergic_latex', 'AllergicLatex', 'TEXT', ALLERGIES),
+    ('allergic_others', 'AllergicOthers', 'TEXT', ALLERGIES),
+    ('bleeding_time', 'BleedingTime', 'TEXT', MEDICAL),
+    ('pregnant', 'Pregnant', 'TEXT', MEDICAL),
+    ('nursing', 'Nursing', 'TEXT', MEDICAL),
+    ('birth_pills', 'BirthPills', 'TEXT', MEDICAL),
+    ('blood_type', 'BloodType', 'TEXT', MEDICAL),
+    ('blood_pressure', 'BloodPressure', 'TEXT', MEDICAL),
+)
+
+# Form field -> column, in the order above, which is also the order of the
+# full record the edit and history pages index into
+PATIENT_COLUMNS = tuple((field, column) for field, column, _, _ in PATIENT_FIELDS)
+
+# Column -> the table holding it
+COLUMN_TABLES = {column: table for _, column, _, table in PATIENT_FIELDS}
+
+# Fields a patient cannot be saved without
+REQUIRED_FIELDS = ('name', 'contact')
+
+# Each side table's key column
+SIDE_KEY = 'PatientID'
+
+
+def table_columns(table):
+    """The registry columns kept in table, as (column, column type)"""
+    return tuple((column, declaration) for _, column, declaration, field_table in PATIENT_FIELDS
+                 if field_table == table)
+
+
+def create_statement(table, name=None):
+    """CREATE TABLE for one of the patient tables, optionally under another name"""
+    columns = [f"{column} {declaration}" for column, declaration in table_columns(table)]
+    if table == CORE:
+        columns = ["ID INTEGER PRIMARY KEY AUTOINCREMENT"] + columns + ["CreatedDate TEXT DEFAULT CURRENT_TIMESTAMP"]
+    else:
+        columns = [f"{SIDE_KEY} INTEGER PRIMARY KEY REFERENCES Patients (ID)"] + columns
+    return f"CREATE TABLE IF NOT EXISTS {name or table} (\n    " + ",\n    ".join(columns) + "\n)"
+
+
+CREATE_TABLES = tuple(create_statement(table) for table in PATIENT_TABLES)
+
+# Table -> every column it has, as check_db.py expects to find them
+TABLE_COLUMNS = {
+    table: (('ID',) if table == CORE else (SIDE_KEY,))
+           + tuple(column for column, _ in table_columns(table))
+           + (('CreatedDate',) if table == CORE else ())
+    for table in PATIENT_TABLES
+}
+
+
+def insert_statement(table):
+    """(INSERT statement, positions in PATIENT_COLUMNS of its values) for table.
+
+    Side tables take the new patient's ID ahead of the values.
+    """
+    columns = [column for column, _ in table_columns(table)]
+    if table != CORE:
+        columns.insert(0, SIDE_KEY)
+    positions = tuple(index for index, (_, column) in enumerate(PATIENT_COLUMNS) if COLUMN_TABLES[column] == table)
+    return f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", positions
+
+
+INSERT_STATEMENTS = {table: insert_statement(table) for table in PATIENT_TABLES}
+
+# Where the name sits in an insert_row row
+NAME_POSITION = [column for _, column in PATIENT_COLUMNS].index('Name')
+
+# The three tables joined on the patient's ID; side rows are optional
+RECORD_SOURCE = "Patients p " + " ".join(
+    f"LEFT JOIN {table} {alias} ON {alias}.{SIDE_KEY} = p.ID"
+    for table, alias in PATIENT_TABLES.items() if table != CORE)
+
+# Every registry column, qualified and in PATIENT_COLUMNS order
+RECORD_FIELDS = ", ".join(f"{PATIENT_TABLES[COLUMN_TABLES[column]]}.{column}" for _, column in PATIENT_COLUMNS)
+
+# The full record, laid out as the old single-table SELECT * was
+SELECT_RECORD = f"SELECT p.ID, {RECORD_FIELDS}, p.CreatedDate FROM {RECORD_SOURCE}"
+
+SELECT_PATIENT_FIELDS = f"SELECT {RECORD_FIELDS} FROM {RECORD_SOURCE} WHERE p.ID = ?"
+
+
+def read_patient_form(form):
+    """{form field: value} for every patient field, '' where the form leaves one out"""
+    return {field: form.get(field, '') for field, _ in PATIENT_COLUMNS}
+
+
+def missing_fields(values):
+    """Required fields left blank in values"""
+    return [field for field in REQUIRED_FIELDS if not values.get(field)]
+
+
+def insert_row(values):
+    """A patient row, in PATIENT_COLUMNS order, from {form field: value}"""
+    return tuple(values.get(field, '') for field, _ in PATIENT_COLUMNS)
+
+
+def insert_patient(conn, row):
+    """Insert a patient row made by insert_row across the three tables; returns the new ID"""
+    sql, positions = INSERT_STATEMENTS[CORE]
+    patient_id = conn.execute(sql, [row[index] for index in positions]).lastrowid
+    for table in PATIENT_TABLES:
+        if table != CORE:
+            sql, positions = INSERT_STATEMENTS[table]
+            conn.execute(sql, [patient_id] + [row[index] for index in positions])
+    return patient_id
+
+
+def insert_patient_rows(conn, rows):
+    """Insert many insert_row rows, one executemany per table.
+
+    The names must be new and distinct; side rows find their patient by name.
+    """
+    sql, positions = INSERT_STATEMENTS[CORE]
+    conn.executemany(sql, [[row[index] for index in positions] for row in rows])
+    for table in PATIENT_TABLES:
+        if table != CORE:
+            sql, positions = INSERT_STATEMENTS[table]
+            sql = sql.replace("VALUES (?", "VALUES ((SELECT ID FROM Patients WHERE Name = ?)", 1)
+            conn.executemany(sql, [[row[NAME_POSITION]] + [row[index] for index in positions] for row in rows])
+
+
+def delete_patient_record(conn, patient_id):
+    """Delete a patient's rows from all three tables"""
+    for table in PATIENT_TABLES:
+        if table != CORE:
+            conn.execute(f"DELETE FROM {table} WHERE {SIDE_KEY} = ?", (patient_id,))
+    conn.execute("DELETE FROM Patients WHERE ID = ?", (patient_id,))
+
+
+def load_patient(conn, patient_id):
+    """The full record of one patient, or None; only the pages showing it need it"""
+    return conn.execute(SELECT_RECORD + " WHERE p.ID = ?", (patient_id,)).fetchone()
+
+
+def load_patient_by_name(conn, name):
+    """The full record of the patient called name, or None"""
+    return conn.execute(SELECT_RECORD + " WHERE p.Name = ?", (name,)).fetchone()
+
+
+@lru_cache(maxsize=None)
+def update_statement(table, columns):
+    """Statement setting just the given columns (a tuple) of one patient's row in table.
+
+    Side rows are upserted, so a patient missing one still gets it.
+    """
+    if table == CORE:
+        return "UPDATE Patients SET {} WHERE ID = ?".format(', '.join(f"{column} = ?" for column in columns))
+    return "INSERT INTO {} ({}, {}) VALUES (?, {}) ON CONFLICT ({}) DO UPDATE SET {}".format(
+        table, SIDE_KEY, ', '.join(columns), ', '.join('?' * len(columns)), SIDE_KEY,
+        ', '.join(f"{column} = excluded.{column}" for column in columns))
+
+
+def changed_columns(stored, values):
+    """{column: new value} for the fields in values that differ from stored.
+
+    stored is a row read with SELECT_PATIENT_FIELDS; a NULL left by an older
+    schema counts the same as a blank field.
+    """
+    return {
+        column: values[field]
+        for (field, column), old in zip(PATIENT_COLUMNS, stored)
+        if field in values and ('' if old is None else old) != values[field]
+    }
+
+
+def update_patient_fields(conn, patient_id, values):
+    """Write the fields of values that changed; returns the changed columns.
+
+    Only the tables holding a changed field are touched, and in them only the
+    changed columns, so an edit to the medical history does not rewrite the
+    core row, its name index or the search index behind it.
+    """
+    stored = conn.execute(SELECT_PATIENT_FIELDS, (patient_id,)).fetchone()
+    if stored is None:
+        return {}
+    changes = changed_columns(stored, values)
+    for table in PATIENT_TABLES:
+        columns = tuple(column for column in changes if COLUMN_TABLES[column] == table)
+        if not columns:
+            continue
+        params = [changes[column] for column in columns]
+        if table == CORE:
+            conn.execute(update_statement(table, columns), params + [patient_id])
+        else:
+            conn.execute(update_statement(table, columns), [patient_id] + params)
+    return changes
+
+
+def ensure_patient_tables(conn):
+    """Create the patient tables, adding any field's column an older table lacks; returns the names added"""
+    added = []
+    for table, statement in zip(PATIENT_TABLES, CREATE_TABLES):
+        conn.execute(statement)
+        existing = {column[1] for column in conn.execute(f"PRAGMA table_info({table})")}
+        for column, _ in table_columns(table):
+            if column not in existing:
+                # ALTER TABLE cannot add NOT NULL or UNIQUE columns to filled tables
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} TEXT")
+                added.append(f"{table}.{column}")
+    return added
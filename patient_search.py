@@ -0,0 +1,149 @@
+import re
+
+# bm25 column weights, in PatientSearch column order: Name, Nickname, Contact, Email
+RANK_WEIGHTS = "10.0, 5.0, 1.0, 1.0"
+
+# Most alternative spellings tried per search word
+MAX_SIMILAR_TERMS = 8
+
+# Words of at least this length may be misspelt by one edit (two for long words)
+MIN_FUZZY_LENGTH = 3
+LONG_WORD_LENGTH = 8
+
+SEARCH_WORD = re.compile(r"\w+")
+
+SCHEMA = (
+    # External-content index over the searchable Patients columns
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS PatientSearch USING fts5(
+        Name, Nickname, Contact, Email,
+        content='Patients', content_rowid='ID',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    """,
+    # Vocabulary of indexed words, used to suggest corrections for typos
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS PatientSearchTerms USING fts5vocab(PatientSearch, 'row')
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS patients_search_insert AFTER INSERT ON Patients BEGIN
+        INSERT INTO PatientSearch (rowid, Name, Nickname, Contact, Email)
+        VALUES (new.ID, new.Name, new.Nickname, new.Contact, new.Email);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS patients_search_delete AFTER DELETE ON Patients BEGIN
+        INSERT INTO PatientSearch (PatientSearch, rowid, Name, Nickname, Contact, Email)
+        VALUES ('delete', old.ID, old.Name, old.Nickname, old.Contact, old.Email);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS patients_search_update
+    AFTER UPDATE OF Name, Nickname, Contact, Email ON Patients BEGIN
+        INSERT INTO PatientSearch (PatientSearch, rowid, Name, Nickname, Contact, Email)
+        VALUES ('delete', old.ID, old.Name, old.Nickname, old.Contact, old.Email);
+        INSERT INTO PatientSearch (rowid, Name, Nickname, Contact, Email)
+        VALUES (new.ID, new.Name, new.Nickname, new.Contact, new.Email);
+    END
+    """,
+)
+
+
+def ensure_patient_search(conn):
+    """Create the patient search index and its triggers, filling it on first use"""
+    cursor = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'PatientSearch'")
+    is_new = cursor.fetchone() is None
+
+    for statement in SCHEMA:
+        conn.execute(statement)
+
+    if is_new:
+        conn.execute("INSERT INTO PatientSearch (PatientSearch) VALUES ('rebuild')")
+    return is_new
+
+
+def edit_distance(a, b, limit):
+    """Levenshtein distance (counting swapped neighbours as one edit), capped at limit + 1"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+
+    previous, current = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        before, previous, current = previous, current, [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], before[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+    return current[-1]
+
+
+def similar_terms(conn, word):
+    """Indexed words within one or two edits of word, most common first"""
+    if len(word) < MIN_FUZZY_LENGTH:
+        return []
+    limit = 2 if len(word) >= LONG_WORD_LENGTH else 1
+
+    # Only words sharing the first letter are considered, which keeps the
+    # vocabulary lookup to a single range of the term index
+    cursor = conn.execute("""
+        SELECT term, doc FROM PatientSearchTerms
+        WHERE term >= ? AND term < ?
+    """, (word[0], word[0] + '\U0010ffff'))
+
+    candidates = []
+    for term, doc_count in cursor:
+        if term == word:
+            continue
+        distance = edit_distance(word, term, limit)
+        if distance <= limit:
+            candidates.append((distance, -doc_count, term))
+    candidates.sort()
+    return [term for _, _, term in candidates[:MAX_SIMILAR_TERMS]]
+
+
+def quote(term):
+    return '"' + term.replace('"', '""') + '"'
+
+
+def match_expression(conn, text):
+    """Build an FTS5 MATCH expression for free text typed into a search box.
+
+    Every word is matched as a prefix. When that finds nothing, each word is
+    widened to also accept close spellings from the index vocabulary.
+    Returns None when the text has no searchable words.
+    """
+    words = [word.lower() for word in SEARCH_WORD.findall(text)]
+    if not words:
+        return None
+
+    expression = " AND ".join(quote(word) + "*" for word in words)
+    cursor = conn.execute("SELECT 1 FROM PatientSearch WHERE PatientSearch MATCH ? LIMIT 1", (expression,))
+    if cursor.fetchone() is not None:
+        return expression
+
+    clauses = []
+    for word in words:
+        options = [quote(word) + "*"] + [quote(term) for term in similar_terms(conn, word)]
+        clauses.append("(" + " OR ".join(options) + ")")
+    return " AND ".join(clauses)
+
+
+def search_patients(conn, text, limit=10):
+    """Return (ID, Name, Nickname, Contact, Email) rows best matching text"""
+    expression = match_expression(conn, text)
+    if expression is None:
+        return []
+
+    cursor = conn.execute(f"""
+        SELECT p.ID, p.Name, p.Nickname, p.Contact, p.Email
+        FROM PatientSearch
+        JOIN Patients p ON p.ID = PatientSearch.rowid
+        WHERE PatientSearch MATCH ?
+        ORDER BY bm25(PatientSearch, {RANK_WEIGHTS})
+        LIMIT ?
+    """, (expression, limit))
+    return cursor.fetchall()
@@ -1,13 +1,15 @@
 import sqlite3
 
+from streaming import iter_rows
+
+# For a full or incremental dump of the charts use bulk_export.py dental_charts
 conn = sqlite3.connect('dental.db')
 cursor = conn.cursor()
 
 cursor.execute('SELECT * FROM DentalCharts')
-rows = cursor.fetchall()
 
 print('DentalCharts table:')
-for row in rows:
+for row in iter_rows(cursor):
     print(row)
 
 conn.close() 
\ No newline at end of file
@@ -0,0 +1,57 @@
+from schedule import overlapping_appointment
+
+# Chairs and dentists that appointments are booked against. Each resource
+# takes one appointment at a time; the clinic is free at a time while any
+# active resource is.
+RESOURCE_KINDS = ('chair', 'dentist')
+
+# Created on first run so existing appointments have somewhere to live
+DEFAULT_RESOURCE = 'Chair 1'
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS Resources (
+        ID INTEGER PRIMARY KEY AUTOINCREMENT,
+        Name TEXT NOT NULL UNIQUE,
+        Kind TEXT NOT NULL DEFAULT 'chair' CHECK (Kind IN ('chair', 'dentist')),
+        Active INTEGER NOT NULL DEFAULT 1
+    )
+"""
+
+
+def ensure_resources(conn):
+    """Create Resources, add Appointments.ResourceID and give unassigned appointments the first resource"""
+    conn.execute(SCHEMA)
+    if conn.execute("SELECT 1 FROM Resources LIMIT 1").fetchone() is None:
+        conn.execute("INSERT INTO Resources (Name, Kind) VALUES (?, 'chair')", (DEFAULT_RESOURCE,))
+        print(f"Added resource: {DEFAULT_RESOURCE}")
+
+    existing_columns = [column[1] for column in conn.execute("PRAGMA table_info(Appointments)")]
+    if 'ResourceID' not in existing_columns:
+        conn.execute("ALTER TABLE Appointments ADD COLUMN ResourceID INTEGER REFERENCES Resources (ID)")
+        print("Added column: ResourceID")
+
+    cursor = conn.execute("""
+        UPDATE Appointments SET ResourceID = (SELECT MIN(ID) FROM Resources)
+        WHERE ResourceID IS NULL
+    """)
+    return cursor.rowcount
+
+
+def list_resources(conn, include_inactive=False):
+    """[(ID, Name, Kind, Active)] in booking order"""
+    sql = "SELECT ID, Name, Kind, Active FROM Resources"
+    if not include_inactive:
+        sql += " WHERE Active = 1"
+    return conn.execute(sql + " ORDER BY ID").fetchall()
+
+
+def free_resource(conn, appointment_date, appointment_time, minutes, prefer=None, exclude_id=None):
+    """ID of an active resource with nothing overlapping date/time for minutes, or None.
+
+    prefer is tried first, so an edited appointment stays where it is when it can.
+    """
+    for resource_id, *_ in sorted(list_resources(conn), key=lambda row: row[0] != prefer):
+        if overlapping_appointment(conn, appointment_date, appointment_time, minutes, resource_id,
+                                   exclude_id) is None:
+            return resource_id
+    return None
@@ -0,0 +1,148 @@
+# Clinic hours and appointment lengths. An appointment holds its resource
+# from Time until Time + Duration minutes, and no two appointments on one
+# chair or dentist may overlap.
+import calendar
+import os
+from datetime import date, datetime
+
+# Opening hours as HH:MM; the last appointment has to end by CLOSE_TIME
+OPEN_TIME = os.environ.get('DENTAL_OPEN_TIME', '09:00')
+CLOSE_TIME = os.environ.get('DENTAL_CLOSE_TIME', '18:00')
+
+# Appointments start on this grid and their lengths are rounded up to it
+SLOT_MINUTES = int(os.environ.get('DENTAL_SLOT_MINUTES', '30'))
+
+# Longest appointment that can be booked
+MAX_MINUTES = 4 * 60
+
+# Minutes per procedure, matched against the words of an appointment's
+# DentalCare; care naming several procedures gets their total. Care matching
+# none of them takes one slot.
+PROCEDURE_MINUTES = {
+    'checkup': 30,
+    'check-up': 30,
+    'consultation': 30,
+    'cleaning': 30,
+    'x-ray': 30,
+    'filling': 60,
+    'extraction': 60,
+    'whitening': 60,
+    'braces': 60,
+    'root canal': 90,
+    'crown': 90,
+    'bridge': 90,
+    'implant': 120,
+    'surgery': 120,
+}
+
+
+def to_minutes(time):
+    """Minutes since midnight for an HH:MM time; ValueError if it is not one"""
+    hours, minutes = time.split(':')[:2]
+    hours, minutes = int(hours), int(minutes)
+    if not (0 <= hours < 24 and 0 <= minutes < 60):
+        raise ValueError(f"Invalid time: {time}")
+    return hours * 60 + minutes
+
+
+def to_time(minutes):
+    """HH:MM for minutes since midnight"""
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def normalize_time(time):
+    """HH:MM for a time typed as H:MM, HH:MM or HH:MM:SS; ValueError if it is none of them.
+
+    Appointments.Time is compared as text by the overlap check and the unique
+    slot index, so it is always stored in this form.
+    """
+    return to_time(to_minutes(time))
+
+
+# Bookable start times through the day, e.g. 09:00, 09:30, ... 17:30
+SLOT_TIMES = tuple(to_time(minutes) for minutes
+                   in range(to_minutes(OPEN_TIME), to_minutes(CLOSE_TIME), SLOT_MINUTES))
+
+# Lengths offered when booking
+DURATION_CHOICES = tuple(range(SLOT_MINUTES, MAX_MINUTES + 1, SLOT_MINUTES))
+
+
+# Seconds in a day, for day bounds on Appointments.StartsAt
+DAY_SECONDS = 24 * 60 * 60
+
+
+def timestamp(appointment_date, time='00:00'):
+    """Appointments.StartsAt for a YYYY-MM-DD date and HH:MM time; ValueError if either is invalid"""
+    return calendar.timegm(date.fromisoformat(appointment_date).timetuple()) + to_minutes(time) * 60
+
+
+def current_timestamp():
+    """StartsAt of the current minute, by the clinic's clock; appointments before it have passed"""
+    return calendar.timegm(datetime.now().timetuple()) // 60 * 60
+
+
+def round_to_slots(minutes):
+    """minutes rounded up to whole slots"""
+    return -(-minutes // SLOT_MINUTES) * SLOT_MINUTES
+
+
+def procedure_minutes(dental_care):
+    """Appointment length for a DentalCare description"""
+    care = (dental_care or '').lower()
+    total = sum(minutes for procedure, minutes in PROCEDURE_MINUTES.items() if procedure in care)
+    return round_to_slots(min(total, MAX_MINUTES)) if total else SLOT_MINUTES
+
+
+def appointment_minutes(value, dental_care):
+    """(minutes, error message) for a booking's duration field; blank means the dental care's length"""
+    if not value:
+        return procedure_minutes(dental_care), None
+    try:
+        minutes = int(value)
+    except ValueError:
+        return None, "Please choose a valid appointment length."
+    if not 0 < minutes <= MAX_MINUTES:
+        return None, f"Appointments can last up to {MAX_MINUTES} minutes."
+    return round_to_slots(minutes), None
+
+
+def within_clinic_hours(time, minutes):
+    """Whether an appointment at time for minutes starts and ends inside opening hours"""
+    start = to_minutes(time)
+    return to_minutes(OPEN_TIME) <= start and start + minutes <= to_minutes(CLOSE_TIME)
+
+
+def twelve_hour(time):
+    """9:30 AM for 09:30"""
+    hours, minutes = divmod(to_minutes(time), 60)
+    return f"{hours % 12 or 12}:{minutes:02d} {'PM' if hours >= 12 else 'AM'}"
+
+
+def clinic_hours_error(time, minutes):
+    """Error message when an appointment would not fit inside opening hours, else None"""
+    try:
+        if within_clinic_hours(time, minutes):
+            return None
+    except ValueError:
+        return "Invalid time format. Please use HH:MM format."
+    return (f"Appointments must fit between {twelve_hour(OPEN_TIME)} and {twelve_hour(CLOSE_TIME)}; "
+            f"a {minutes}-minute appointment cannot start at {twelve_hour(time)}.")
+
+
+def overlapping_appointment(conn, appointment_date, time, minutes, resource_id, exclude_id=None):
+    """ID of an appointment on resource_id overlapping [time, time + minutes), or None.
+
+    A resource's appointments never overlap one another, so sorted by start
+    time the only one that can reach the new interval is the last to start
+    before it ends: one index seek instead of reading the whole day.
+    """
+    start = to_minutes(time)
+    row = conn.execute("""
+        SELECT ID, Time, Duration FROM Appointments
+        WHERE ResourceID = ? AND Date = ? AND Time < ? AND ID IS NOT ?
+        ORDER BY Time DESC
+        LIMIT 1
+    """, (resource_id, appointment_date, to_time(start + minutes), exclude_id)).fetchone()
+    if row and to_minutes(row[1]) + row[2] > start:
+        return row[0]
+    return None
@@ -0,0 +1,48 @@
+import json
+
+# Rows serialized per chunk written to the client
+STREAM_BATCH_ROWS = 200
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+
+def wants_ndjson(request):
+    """Whether the client asked for newline-delimited JSON instead of an array"""
+    if request.args.get('format'):
+        return request.args['format'] == 'ndjson'
+    return request.accept_mimetypes.best_match(['application/json', NDJSON_MIMETYPE]) == NDJSON_MIMETYPE
+
+
+def iter_rows(cursor, batch=STREAM_BATCH_ROWS):
+    """Yield a cursor's rows a batch at a time, never holding the full result"""
+    while True:
+        rows = cursor.fetchmany(batch)
+        if not rows:
+            return
+        yield from rows
+
+
+def json_array_chunks(items, dumps=json.dumps, batch=STREAM_BATCH_ROWS):
+    """Encode items as one JSON array, yielded in pieces of about batch items"""
+    yield '['
+    chunk = []
+    separator = ''
+    for item in items:
+        chunk.append(separator + dumps(item))
+        separator = ','
+        if len(chunk) >= batch:
+            yield ''.join(chunk)
+            chunk = []
+    yield ''.join(chunk) + ']\n'
+
+
+def ndjson_chunks(items, dumps=json.dumps, batch=STREAM_BATCH_ROWS):
+    """Encode items as one JSON document per line, yielded in pieces of about batch lines"""
+    chunk = []
+    for item in items:
+        chunk.append(dumps(item) + '\n')
+        if len(chunk) >= batch:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)